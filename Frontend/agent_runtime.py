@@ -0,0 +1,90 @@
+"""
+Process-wide handle on the deployed agent engine, shared by every Streamlit session.
+
+The engine is resolved once, on a background thread, as soon as the server
+imports this module, and a few chat sessions are created ahead of time so
+that a new chat or a first message doesn't wait on create_session.
+"""
+import queue
+import threading
+import uuid
+
+from google.auth import default
+from google.cloud import aiplatform
+from vertexai import agent_engines
+
+
+class AgentRuntime:
+    def __init__(self, engine_id: str, location: str, pool_size: int = 2):
+        self.engine_id = engine_id
+        self.location = location
+        self.pool_size = pool_size
+        self.error = None
+        self._agent = None
+        self._ready = threading.Event()
+        self._sessions = queue.Queue()
+        self._refill_lock = threading.Lock()
+        threading.Thread(target=self._warm, name="agent-warm-up", daemon=True).start()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self.error is None
+
+    def _warm(self):
+        try:
+            credentials, project = default()
+            aiplatform.init(project=project, location=self.location, credentials=credentials)
+            self._agent = agent_engines.get(self.engine_id)
+            print(f"Agent engine {self.engine_id} resolved")
+        except Exception as e:
+            self.error = e
+            print(f"Failed to resolve agent engine: {e}")
+        finally:
+            self._ready.set()
+        if self.error is None:
+            self._refill()
+
+    def retry(self):
+        """Resolve the engine again after a failure."""
+        if self._ready.is_set() and self.error is not None:
+            self.error = None
+            self._ready.clear()
+            threading.Thread(target=self._warm, name="agent-warm-up", daemon=True).start()
+
+    def agent(self, timeout: float = None):
+        """The agent engine handle, waiting for the warm-up if it is still running."""
+        if not self._ready.wait(timeout):
+            raise TimeoutError("The agent engine is still starting up")
+        if self.error is not None:
+            raise self.error
+        return self._agent
+
+    def _create_session(self) -> dict:
+        user_id = str(uuid.uuid4())
+        return {"user_id": user_id, "session": self.agent().create_session(user_id=user_id)}
+
+    def _refill(self):
+        """Top the pool up to pool_size sessions; one refill runs at a time."""
+        if not self._refill_lock.acquire(blocking=False):
+            return
+        try:
+            while self._sessions.qsize() < self.pool_size:
+                self._sessions.put(self._create_session())
+        except Exception as e:
+            print(f"Failed to pre-create agent session: {e}")
+        finally:
+            self._refill_lock.release()
+
+    def take_session(self) -> dict:
+        """
+        A fresh chat session as {"user_id", "session"}.
+
+        Comes from the pool when one is ready (the pool is then refilled in the
+        background), otherwise is created on the spot.
+        """
+        try:
+            chat = self._sessions.get_nowait()
+        except queue.Empty:
+            chat = self._create_session()
+        threading.Thread(target=self._refill, name="agent-session-pool", daemon=True).start()
+        return chat
@@ -0,0 +1,199 @@
+"""
+Chat history kept in a local SQLite database instead of st.session_state.
+
+Browser sessions only hold the conversation currently open; the sidebar
+lists previews straight from the database and a past transcript is loaded
+when it is opened. Recently opened transcripts are kept in a small LRU
+cache shared by the whole server process, and old conversations are pruned
+by age and by a per-owner cap so the database doesn't grow without limit.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# SQLite file holding every conversation
+CHAT_HISTORY_DB = os.getenv("CHAT_HISTORY_DB", "chat_history.sqlite")
+# Transcripts kept in memory across all browser sessions
+CHAT_HISTORY_CACHE_SIZE = int(os.getenv("CHAT_HISTORY_CACHE_SIZE", "64"))
+# Conversations not updated for this many days are deleted (0 keeps them)
+CHAT_HISTORY_RETENTION_DAYS = float(os.getenv("CHAT_HISTORY_RETENTION_DAYS", "30"))
+# Most recent conversations kept per owner (0 keeps all)
+CHAT_HISTORY_MAX_CONVERSATIONS = int(os.getenv("CHAT_HISTORY_MAX_CONVERSATIONS", "50"))
+# Seconds between retention passes
+CHAT_HISTORY_PRUNE_INTERVAL = float(os.getenv("CHAT_HISTORY_PRUNE_INTERVAL", "3600"))
+# Characters of the first question shown in the sidebar
+PREVIEW_CHARS = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    preview TEXT,
+    agent_user_id TEXT,
+    agent_session_id TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_owner ON conversations (owner, updated);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+);
+"""
+
+
+class ChatHistoryStore:
+    def __init__(self, path: str = CHAT_HISTORY_DB, cache_size: int = CHAT_HISTORY_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _cached(self, conversation_id: str):
+        messages = self._cache.get(conversation_id)
+        if messages is not None:
+            self._cache.move_to_end(conversation_id)
+        return messages
+
+    def _remember(self, conversation_id: str, messages: list):
+        self._cache[conversation_id] = messages
+        self._cache.move_to_end(conversation_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def append_message(self, conversation_id: str, owner: str, role: str, content: str):
+        """Add a message to a conversation, creating the conversation on its first message."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT INTO conversations (id, owner, created, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET updated = excluded.updated",
+                    (conversation_id, owner, now, now),
+                )
+                if role == "user":
+                    self._conn.execute(
+                        "UPDATE conversations SET preview = ? WHERE id = ? AND preview IS NULL",
+                        (content[:PREVIEW_CHARS] + ("..." if len(content) > PREVIEW_CHARS else ""), conversation_id),
+                    )
+                self._conn.execute(
+                    "INSERT INTO messages (conversation_id, seq, role, content) "
+                    "SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ? FROM messages WHERE conversation_id = ?",
+                    (conversation_id, role, content, conversation_id),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            cached = self._cached(conversation_id)
+            if cached is not None:
+                cached.append({"role": role, "content": content})
+
+    def set_agent_session(self, conversation_id: str, owner: str, agent_user_id: str, agent_session_id: str):
+        """Remember which agent engine session a conversation talks to, so it can be resumed."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO conversations (id, owner, agent_user_id, agent_session_id, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET "
+                "agent_user_id = excluded.agent_user_id, agent_session_id = excluded.agent_session_id",
+                (conversation_id, owner, agent_user_id, agent_session_id, now, now),
+            )
+
+    def agent_session(self, conversation_id: str):
+        """(agent_user_id, agent_session_id) of a conversation, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT agent_user_id, agent_session_id FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        if row is None or row[1] is None:
+            return None
+        return row[0], row[1]
+
+    def list_conversations(self, owner: str, limit: int = 50) -> list:
+        """Previews of an owner's conversations with messages, most recently updated first: [(id, preview)]."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, COALESCE(preview, 'Empty chat') FROM conversations "
+                "WHERE owner = ? AND EXISTS (SELECT 1 FROM messages WHERE conversation_id = conversations.id) "
+                "ORDER BY updated DESC LIMIT ?",
+                (owner, limit),
+            ).fetchall()
+
+    def load_messages(self, conversation_id: str) -> list:
+        """Full transcript of a conversation as [{"role", "content"}], served from the LRU cache when possible."""
+        with self._lock:
+            messages = self._cached(conversation_id)
+            if messages is None:
+                rows = self._conn.execute(
+                    "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY seq", (conversation_id,)
+                ).fetchall()
+                messages = [{"role": role, "content": content} for role, content in rows]
+                self._remember(conversation_id, messages)
+            return list(messages)
+
+    def delete_conversation(self, conversation_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+            self._cache.pop(conversation_id, None)
+
+    def prune(self, retention_days: float = CHAT_HISTORY_RETENTION_DAYS,
+              max_conversations: int = CHAT_HISTORY_MAX_CONVERSATIONS) -> int:
+        """
+        Delete conversations older than retention_days and all but the
+        max_conversations most recent of each owner, then reclaim the space.
+
+        Returns the number of conversations deleted.
+        """
+        with self._lock:
+            doomed = set()
+            if retention_days > 0:
+                cutoff = time.time() - retention_days * 86400
+                doomed.update(r[0] for r in self._conn.execute(
+                    "SELECT id FROM conversations WHERE updated < ?", (cutoff,)))
+            if max_conversations > 0:
+                doomed.update(r[0] for r in self._conn.execute(
+                    "SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY owner ORDER BY updated DESC) AS n "
+                    "FROM conversations) WHERE n > ?", (max_conversations,)))
+            if not doomed:
+                return 0
+            self._conn.executemany("DELETE FROM conversations WHERE id = ?", [(id_,) for id_ in doomed])
+            for id_ in doomed:
+                self._cache.pop(id_, None)
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
+        print(f"Pruned {len(doomed)} conversations from chat history")
+        return len(doomed)
+
+    def start(self, interval: float = CHAT_HISTORY_PRUNE_INTERVAL):
+        """Prune now and then every interval seconds on a daemon thread."""
+        if self._thread is not None or interval <= 0:
+            return self
+
+        def run():
+            while True:
+                try:
+                    self.prune()
+                except Exception as e:
+                    print(f"Warning: chat history pruning failed: {e}")
+                if self._stop.wait(interval):
+                    break
+
+        self._thread = threading.Thread(target=run, name="chat-history-prune", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
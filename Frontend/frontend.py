@@ -1,26 +1,55 @@
+import os
 import streamlit as st
 import uuid
-from vertexai import agent_engines
-from vertexai.preview import reasoning_engines
-from google.auth import default
-from google.cloud import aiplatform
+
+from agent_runtime import AgentRuntime
+from chat_history import ChatHistoryStore
+from stream_renderer import StreamRenderer
 
 # Page setup
 st.set_page_config(page_title="TroubleBuster Agent", page_icon="vodafone3.png", layout="centered")
 
 # Agent configuration
 #AGENT_ENGINE_ID = "projects/vodaf-aida25lcpm-206/locations/europe-west1/reasoningEngines/300351392336314368"
-AGENT_ENGINE_ID = "projects/100938974863/locations/europe-west1/reasoningEngines/6493363829924167680"
- 
-# Initialize session state for managing multiple chat sessions
-if "chat_sessions" not in st.session_state:
-    st.session_state.chat_sessions = {}
+AGENT_ENGINE_ID = os.getenv(
+    "AGENT_ENGINE_ID", "projects/100938974863/locations/europe-west1/reasoningEngines/6493363829924167680"
+)
+AGENT_ENGINE_LOCATION = os.getenv("AGENT_ENGINE_LOCATION", "europe-west1")
+# Chat sessions kept pre-created so a first message or a new chat doesn't wait on create_session
+SESSION_POOL_SIZE = int(os.getenv("SESSION_POOL_SIZE", "2"))
+
+
+@st.cache_resource
+def get_agent_runtime():
+    """One agent engine handle and session pool per server process, shared by every browser session"""
+    return AgentRuntime(AGENT_ENGINE_ID, AGENT_ENGINE_LOCATION, pool_size=SESSION_POOL_SIZE)
+
+
+@st.cache_resource
+def get_chat_history():
+    """Chat history database shared by every browser session, pruned in the background"""
+    return ChatHistoryStore().start()
+
+
+# Start resolving the engine as soon as the app is first loaded, before anyone types
+runtime = get_agent_runtime()
+history = get_chat_history()
+
+assistant_Opening_msg = "Hi, This is TroubleBuster. How can I help you?"
+
+def opening_messages():
+    return [{"role": "assistant", "content": assistant_Opening_msg}]
+
+# History is kept per owner; the owner id lives in the URL so a reload or bookmark finds the same chats
+if "user" not in st.query_params:
+    st.query_params["user"] = str(uuid.uuid4())
+history_owner = st.query_params["user"]
+
+# Only the open conversation is held in session state; past ones stay in the history database
 if "current_chat_id" not in st.session_state:
     st.session_state.current_chat_id = str(uuid.uuid4())
 if "messages" not in st.session_state:
-    st.session_state.messages = []
-    assistant_Opening_msg = "Hi, This is TroubleBuster. How can I help you?"
-    st.session_state["messages"].append({"role": "assistant", "content": assistant_Opening_msg})
+    st.session_state.messages = opening_messages()
 
 # Agent initialization state (LAZY LOADING)
 if "agent_initialized" not in st.session_state:
@@ -32,53 +61,53 @@ if "session" not in st.session_state:
 if "initialization_error" not in st.session_state:
     st.session_state.initialization_error = None
 
-@st.cache_resource
-def get_credentials_and_project():
-    """Cache credentials to avoid repeated authentication"""
-    return default()
-
 def initialize_agent():
-    """Initialize the agent and session lazily"""
+    """Attach this browser session to the shared agent engine and take a pooled chat session"""
     try:
         if not st.session_state.agent_initialized:
-            with st.spinner("Initializing TroubleBuster Agent..."):
-                # Initialize credentials and AI Platform (cached)
-                credentials, project = get_credentials_and_project()
-                aiplatform.init(project=project, location="europe-west1", credentials=credentials)
-                
-                # Get agent engine
-                agent = agent_engines.get(AGENT_ENGINE_ID)
-                st.session_state.agent = agent
-                
-                # Create session
-                user_id = st.session_state.current_chat_id
-                session = agent.create_session(user_id=user_id)
-                st.session_state.session = session
-                
-                st.session_state.agent_initialized = True
-                st.success("TroubleBuster Agent initialized successfully!")
-                #st.rerun()
-                
+            if not runtime.ready:
+                with st.spinner("Initializing TroubleBuster Agent..."):
+                    runtime.agent()
+            st.session_state.agent = runtime.agent()
+            if st.session_state.session is None:
+                attach_agent_session()
+            st.session_state.agent_initialized = True
+            st.session_state.initialization_error = None
+
     except Exception as e:
         st.session_state.initialization_error = str(e)
         st.error(f"Failed to initialize agent: {e}")
         return False
     return True
 
+def attach_agent_session():
+    """Give the open conversation a pooled agent session and remember it for resuming"""
+    chat = runtime.take_session()
+    st.session_state.session = chat
+    history.set_agent_session(st.session_state.current_chat_id, history_owner, chat["user_id"], chat["session"]["id"])
+
+def add_message(role, content):
+    st.session_state["messages"].append({"role": role, "content": content})
+    history.append_message(st.session_state.current_chat_id, history_owner, role, content)
+
+def open_chat(chat_id):
+    """Switch to a past conversation, loading its transcript and agent session from the history database"""
+    st.session_state.current_chat_id = chat_id
+    st.session_state.messages = opening_messages() + history.load_messages(chat_id)
+    stored = history.agent_session(chat_id)
+    st.session_state.session = None if stored is None else {"user_id": stored[0], "session": {"id": stored[1]}}
+    st.session_state.agent_initialized = False
+
 def new_chat():
-    if st.session_state.messages:
-        st.session_state.chat_sessions[st.session_state.current_chat_id] = st.session_state.messages
     st.session_state.current_chat_id = str(uuid.uuid4()) 
-    st.session_state.messages = []
+    st.session_state.messages = opening_messages()
     
-    # Reset session for new chat if agent is initialized
+    # Reset session for new chat if agent is initialized; pooled sessions make this instant
     if st.session_state.agent:
-        user_id = st.session_state.current_chat_id
-        session = st.session_state.agent.create_session(user_id=user_id)
-        st.session_state.session = session
+        attach_agent_session()
+    else:
+        st.session_state.session = None
     
-    assistant_Opening_msg = "Hi, This is TroubleBuster. How can I help you?"
-    st.session_state["messages"].append({"role": "assistant", "content": assistant_Opening_msg})
     st.rerun() 
 
 
@@ -115,19 +144,21 @@ st.markdown(f'<img class="logo" src="https://vodafone.sharepoint.com/:i:/r/sites
 st.markdown('<div class="title-container"><h1 class="title">TroubleBuster Agent</h1></div>', unsafe_allow_html=True)
 
 # Show initialization status
-if not st.session_state.agent_initialized:
-    st.info("🤖 **TroubleBuster Agent** is ready to help! Send your first message to start the conversation.")
-    st.markdown("""
-    <div style="padding: 10px; border-radius: 5px; background-color: #e6f3ff; border-left: 4px solid #0066cc;">
-        <small><strong>Note:</strong> The agent will initialize when you send your first message. This may take 30-60 seconds.</small>
-    </div>
-    """, unsafe_allow_html=True)
-elif st.session_state.initialization_error:
-    st.error(f"❌ Agent initialization failed: {st.session_state.initialization_error}")
+if st.session_state.initialization_error or runtime.error is not None:
+    st.error(f"❌ Agent initialization failed: {st.session_state.initialization_error or runtime.error}")
     if st.button("🔄 Retry Initialization"):
         st.session_state.initialization_error = None
         st.session_state.agent_initialized = False
+        runtime.retry()
         st.rerun()
+elif not st.session_state.agent_initialized:
+    st.info("🤖 **TroubleBuster Agent** is ready to help! Send your first message to start the conversation.")
+    if not runtime.ready:
+        st.markdown("""
+        <div style="padding: 10px; border-radius: 5px; background-color: #e6f3ff; border-left: 4px solid #0066cc;">
+            <small><strong>Note:</strong> The agent is warming up in the background and will be ready in a moment.</small>
+        </div>
+        """, unsafe_allow_html=True)
 else:
     st.success("✅ **TroubleBuster Agent** is ready and responding!")
 
@@ -144,19 +175,20 @@ if user_prompt:
         #if not initialize_agent():
             #st.stop()
     
-    st.session_state["messages"].append({"role": "user", "content": user_prompt})
+    add_message("user", user_prompt)
     with st.chat_message("user"):
         st.markdown(user_prompt)
 
     # Generate and display assistant's response
     try:
         agent = st.session_state.agent
-        session = st.session_state.session
-        user_id = st.session_state.current_chat_id
+        # Pooled sessions are bound to the user id they were created under
+        session = st.session_state.session["session"]
+        user_id = st.session_state.session["user_id"]
         
-        text_part = ""
         with st.chat_message("assistant"):
-            message_placeholder = st.empty()
+            # Coalesces streamed parts and only redraws the paragraph still being written
+            renderer = StreamRenderer(st.container())
             
             for event in agent.stream_query(user_id=user_id, session_id=session["id"], message=user_prompt):
                 if "content" in event:
@@ -164,15 +196,21 @@ if user_prompt:
                         parts = event["content"]["parts"]
                         for part in parts:
                             if "text" in part:
-                                text_part += part["text"]
-                                # Update the message in real-time
-                                message_placeholder.markdown(text_part)
+                                renderer.feed(part["text"])
+            text_part = renderer.close()
         
-        st.session_state["messages"].append({"role": "assistant", "content": text_part})
+        metrics = renderer.metrics()
+        ttft = metrics["time_to_first_token"]
+        print(
+            f"Streamed response: first token {'n/a' if ttft is None else f'{ttft:.2f}s'}, "
+            f"total {metrics['total_seconds']:.2f}s, {metrics['chars']} chars in {metrics['renders']} renders "
+            f"({metrics['render_seconds'] * 1000:.1f} ms rendering)"
+        )
+        add_message("assistant", text_part)
         
     except Exception as e:
         st.error(f"Error generating response: {e}")
-        st.session_state["messages"].append({"role": "assistant", "content": f"Sorry, I encountered an error: {e}"})
+        add_message("assistant", f"Sorry, I encountered an error: {e}")
         
 # --- SIDEBAR CHAT HISTORY ---
 with st.sidebar:
@@ -181,28 +219,25 @@ with st.sidebar:
 
     st.markdown("## 🕘 Chat History") 
 
-    if st.session_state.chat_sessions:
-        for chat_id, messages in list(st.session_state.chat_sessions.items()):
-            if messages:
-                preview = messages[1]["content"][:30] + ("..." if len(messages[1]["content"]) > 30 else "")
-            else:
-                preview = "Empty chat"
-
+    # Only previews are read here; a transcript is loaded when its chat is opened
+    conversations = history.list_conversations(history_owner)
+    if conversations:
+        for chat_id, preview in conversations:
             cols = st.columns([0.8, 0.2])  
 
 
             if cols[0].button(preview, key=f"chat_{chat_id}"):
-                st.session_state.chat_sessions[st.session_state.current_chat_id] = st.session_state.messages
-                st.session_state.current_chat_id = chat_id 
-                st.session_state.messages = st.session_state.chat_sessions[chat_id]
+                open_chat(chat_id)
                 st.rerun()
 
 
             if cols[1].button("✖", key=f"delete_{chat_id}"):
-                del st.session_state.chat_sessions[chat_id]
+                history.delete_conversation(chat_id)
                 if chat_id == st.session_state.current_chat_id:  
                     st.session_state.current_chat_id = str(uuid.uuid4())
-                    st.session_state.messages = []
+                    st.session_state.messages = opening_messages()
+                    st.session_state.session = None
+                    st.session_state.agent_initialized = False
                 st.rerun()
     else:
 
@@ -0,0 +1,116 @@
+"""
+Incremental rendering of a streamed agent response into a Streamlit container.
+
+Re-rendering the whole accumulated text on every streamed part costs
+O(length) per part, so a long answer costs O(length^2) in markdown
+serialisation and websocket traffic. StreamRenderer instead:
+
+- coalesces parts and only redraws on a time cadence (or once enough new
+  text has piled up),
+- writes each finished paragraph once into its own element, so a redraw
+  only re-sends the paragraph still being written,
+- flushes everything once when the stream ends,
+
+and records time to first token and time spent rendering.
+"""
+import os
+import time
+
+# Minimum seconds between redraws while a response is streaming
+STREAM_RENDER_INTERVAL = float(os.getenv("STREAM_RENDER_INTERVAL", "0.1"))
+# Redraw before the interval is up once this many characters are pending
+STREAM_RENDER_MAX_PENDING = int(os.getenv("STREAM_RENDER_MAX_PENDING", "2000"))
+
+_FENCE = "```"
+
+
+def split_finished_blocks(text: str):
+    """
+    Split text into (finished paragraphs, unfinished tail).
+
+    A paragraph is finished once a blank line follows it; blank lines inside
+    a fenced code block don't end it.
+    """
+    blocks = []
+    start = 0
+    search = 0
+    while True:
+        end = text.find("\n\n", search)
+        if end < 0:
+            break
+        block = text[start:end]
+        if block.count(_FENCE) % 2:
+            # Inside an open code fence: keep going until the fence is closed
+            search = end + 2
+            continue
+        if block.strip():
+            blocks.append(block)
+        start = search = end + 2
+    return blocks, text[start:]
+
+
+class StreamRenderer:
+    def __init__(self, container, interval: float = STREAM_RENDER_INTERVAL,
+                 max_pending: int = STREAM_RENDER_MAX_PENDING):
+        self.container = container
+        self.interval = interval
+        self.max_pending = max_pending
+        self.text = ""
+        self._rendered_upto = 0     # characters of self.text already written as finished blocks
+        self._tail = None           # placeholder holding the paragraph still being written
+        self._pending = 0
+        self._last_render = 0.0
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.renders = 0
+        self.render_seconds = 0.0
+
+    def feed(self, text: str):
+        """Add streamed text; redraws only when the cadence allows."""
+        if not text:
+            return
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.text += text
+        self._pending += len(text)
+        now = time.perf_counter()
+        if now - self._last_render >= self.interval or self._pending >= self.max_pending:
+            self._render()
+
+    def close(self) -> str:
+        """Flush whatever is pending and return the full text."""
+        if self._pending or self.renders == 0:
+            self._render(final=True)
+        return self.text
+
+    def _render(self, final: bool = False):
+        began = time.perf_counter()
+        blocks, tail = split_finished_blocks(self.text[self._rendered_upto:])
+        if blocks:
+            if self._tail is not None:
+                # The tail placeholder becomes the first finished paragraph
+                self._tail.markdown(blocks[0])
+                self._tail = None
+                blocks = blocks[1:]
+            for block in blocks:
+                self.container.markdown(block)
+            self._rendered_upto = len(self.text) - len(tail)
+        if tail.strip() or (final and self.renders == 0):
+            if self._tail is None:
+                self._tail = self.container.empty()
+            self._tail.markdown(tail)
+        self._pending = 0
+        self.renders += 1
+        self._last_render = time.perf_counter()
+        self.render_seconds += self._last_render - began
+
+    def metrics(self) -> dict:
+        """Time to first token, total stream time and rendering cost, in seconds."""
+        total = time.perf_counter() - self.started
+        return {
+            "time_to_first_token": None if self.first_token is None else self.first_token - self.started,
+            "total_seconds": total,
+            "render_seconds": self.render_seconds,
+            "renders": self.renders,
+            "chars": len(self.text),
+        }
@@ -2,7 +2,8 @@ from dotenv import load_dotenv
 from google.adk import Agent
 import os
 from .prompts import return_instraction_root
-from .tools import retrieve_context_from_query
+from .tools import retrieve_context_for_queries, retrieve_context_from_query, warm_up
+from .tracing import TRACING_CALLBACKS
 model_name = os.getenv("MODEL", "gemini-2.0-flash")
 load_dotenv()
 
@@ -12,6 +13,11 @@ from google.adk.tools.agent_tool import AgentTool
 
 ANALYTICS_AGENT_TOOL = AgentTool(agent=ANALYTICS_AGENT)
 
+# Load the corpus, index and embedding model in the background so the first
+# query doesn't pay for them; set BACKEND_WARM_UP=0 to load on first use only.
+if os.getenv("BACKEND_WARM_UP", "1") != "0":
+    warm_up()
+
 # ---------- Root agent ----------
 root_agent = Agent(
     name="NetworkIncidentResolutionAgent",
@@ -20,7 +26,9 @@ root_agent = Agent(
     instruction=return_instraction_root(),
     tools=[
         retrieve_context_from_query,
+        retrieve_context_for_queries,
         ANALYTICS_AGENT_TOOL
     ],
-    
+    # Per-stage latency spans for model calls and tool calls (see tracing.py)
+    **TRACING_CALLBACKS
 )
\ No newline at end of file
@@ -0,0 +1,136 @@
+import json
+import math
+
+from .incident_records import LABELS, SEPARATOR, parse_incident_text
+
+# Fields kept first when a record has to be shortened; later ones are truncated or dropped first
+FIELD_PRIORITY = (
+    "root_cause",
+    "resolution_steps",
+    "incident_id",
+    "service_impact",
+    "severity",
+    "timestamp",
+    "incident_description",
+    "text",
+)
+# A field cut shorter than this is dropped instead
+MIN_FIELD_CHARS = 24
+# Records that would get less than this are left out
+MIN_RECORD_CHARS = 320
+RECORD_SEPARATOR = "\n\n\n"
+ELLIPSIS = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (about four characters per token for English text)."""
+    return math.ceil(len(text) / 4)
+
+
+def _fit_fields(record: dict, limit: int) -> dict:
+    """
+    Shorten a parsed record to about limit characters of field values.
+
+    The limit is shared evenly between fields, with what short fields don't
+    use going to the longer ones. If that leaves fields under MIN_FIELD_CHARS,
+    the lowest-priority fields are dropped until it doesn't, so root cause and
+    resolution steps are the last to go.
+    """
+    fields = sorted(record, key=lambda f: FIELD_PRIORITY.index(f) if f in FIELD_PRIORITY else len(FIELD_PRIORITY))
+    values = {field: str(record[field]) for field in fields}
+    while len(fields) > 1 and limit // len(fields) < MIN_FIELD_CHARS:
+        fields.pop()
+    sizes = {}
+    pending = list(fields)
+    remaining = limit
+    while pending:
+        share = remaining // len(pending)
+        short = [field for field in pending if len(values[field]) <= share]
+        if not short:
+            for field in pending:
+                sizes[field] = share
+            break
+        for field in short:
+            sizes[field] = len(values[field])
+            remaining -= sizes[field]
+            pending.remove(field)
+
+    fitted = {}
+    for field in record:
+        size = sizes.get(field)
+        if size is None or size < MIN_FIELD_CHARS and size < len(values[field]):
+            continue
+        value = values[field]
+        fitted[field] = value if len(value) <= size else value[:size - 1].rstrip() + ELLIPSIS
+    return fitted
+
+
+def _render(record: dict, fmt: str) -> str:
+    if fmt == "jsonl":
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+    parts = [f"{LABELS[field]}: {value}" if field in LABELS else value for field, value in record.items()]
+    return SEPARATOR.join(parts)
+
+
+def build_context(texts, max_tokens: int = 0, fmt: str = "text"):
+    """
+    Assemble retrieved records into one context string within a token budget.
+
+    Records are taken in rank order. Each gets an even share of what is left
+    of the budget (unused share carries over to later records); a record over
+    its share keeps its root cause and resolution steps first and loses its
+    lowest-priority fields; in "text" format a record within its share is
+    passed through unchanged. Records that would get less than MIN_RECORD_CHARS
+    are left out. fmt is "text" (the corpus format, records separated by blank
+    lines) or "jsonl" (one compact JSON object per record). max_tokens of 0
+    means no budget.
+
+    Returns (context, stats) where stats reports records available, included
+    and truncated, and the size of the context in characters and estimated tokens.
+    """
+    texts = list(texts)
+    separator = "\n" if fmt == "jsonl" else RECORD_SEPARATOR
+    budget = max_tokens * 4 if max_tokens > 0 else None
+    chunks = []
+    truncated = 0
+    used = 0
+    for position, text in enumerate(texts):
+        if budget is None:
+            chunks.append(text if fmt == "text" else _render(parse_incident_text(text), fmt))
+            continue
+        remaining = budget - used
+        share = remaining // (len(texts) - position)
+        if share < MIN_RECORD_CHARS:
+            share = min(remaining, MIN_RECORD_CHARS)
+        if share < MIN_RECORD_CHARS:
+            break
+        if fmt == "text" and len(text) + len(separator) <= share:
+            # Fits as it is: the record goes in unchanged, field order and all
+            chunks.append(text)
+            used += len(text) + len(separator)
+            continue
+        record = parse_incident_text(text)
+        rendered = _render(record, fmt)
+        if len(rendered) + len(separator) > share:
+            # Labels, separators and JSON keys are overhead on top of the field values
+            overhead = len(rendered) - sum(len(str(v)) for v in record.values())
+            record = _fit_fields(record, share - overhead - len(separator))
+            if not record:
+                break
+            rendered = _render(record, fmt)
+            truncated += 1
+        chunks.append(rendered)
+        used += len(rendered) + len(separator)
+
+    context = separator.join(chunks)
+    if chunks and fmt == "text":
+        # Same trailing separator as the concatenated output this replaces
+        context += separator
+    stats = {
+        "records_available": len(texts),
+        "records_included": len(chunks),
+        "records_truncated": truncated,
+        "chars": len(context),
+        "tokens": estimate_tokens(context),
+    }
+    return context, stats
@@ -0,0 +1,267 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from .corpus_store import lock_file
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class GCSBlobSource:
+    """The embeddings file as a Cloud Storage blob; its generation identifies the version."""
+
+    def __init__(self, bucket_name: str, blob_name: str, project: str = None):
+        self.bucket_name = bucket_name
+        self.blob_name = blob_name
+        self.project = project
+        self._bucket = None
+
+    def __str__(self):
+        return f"gs://{self.bucket_name}/{self.blob_name}"
+
+    def _get_bucket(self):
+        if self._bucket is None:
+            from google.cloud import storage
+
+            self._bucket = storage.Client(project=self.project).bucket(self.bucket_name)
+        return self._bucket
+
+    def generation(self):
+        """Current generation of the blob (a metadata-only request), or None if it doesn't exist."""
+        blob = self._get_bucket().get_blob(self.blob_name)
+        return str(blob.generation) if blob is not None else None
+
+    def download(self, dest_path: str, generation: str):
+        """Stream exactly that generation of the blob to dest_path."""
+        blob = self._get_bucket().blob(self.blob_name, generation=int(generation), chunk_size=CHUNK_SIZE)
+        with open(dest_path, "wb") as f:
+            blob.download_to_file(f)
+
+
+class LocalFileSource:
+    """A file on local disk standing in for the bucket (offline runs and tests)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __str__(self):
+        return self.path
+
+    def generation(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return f"{st.st_mtime_ns}-{st.st_size}"
+
+    def download(self, dest_path: str, generation: str):
+        with open(self.path, "rb") as src, open(dest_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def source_from_uri(uri: str, project: str = None):
+    """gs://bucket/path -> GCSBlobSource; anything else is a local path."""
+    if uri.startswith("gs://"):
+        bucket_name, _, blob_name = uri[len("gs://"):].partition("/")
+        return GCSBlobSource(bucket_name, blob_name, project)
+    return LocalFileSource(uri)
+
+
+def validate_embeddings_file(path: str) -> int:
+    """
+    Check a downloaded embeddings file before it replaces the live one.
+
+    Every line must be a JSON record with an integer id and a text (or a
+    deletion marker), and vectors (if present) must all have the same length.
+    Returns the record count.
+    """
+    count = 0
+    dim = None
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                int(record["id"])
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"line {line_no}: invalid record ({e})")
+            if record.get("deleted"):
+                continue
+            if not isinstance(record.get("text"), str):
+                raise ValueError(f"line {line_no}: record has no text")
+            if "embedding" in record:
+                if dim is None:
+                    dim = len(record["embedding"])
+                elif len(record["embedding"]) != dim:
+                    raise ValueError(f"line {line_no}: embedding has {len(record['embedding'])} values, expected {dim}")
+            count += 1
+    if count == 0:
+        raise ValueError("file has no records")
+    return count
+
+
+class CorpusRefresher:
+    """
+    Keeps a local copy of the embeddings file in sync with its source.
+
+    refresh() compares the source generation with the one recorded next to the
+    local file and only downloads when it changed. Downloads stream to a
+    temporary file in the same directory, are validated, and then atomically
+    replace the local file; on_update(generation) is called afterwards so the
+    in-memory structures can be rebuilt and swapped in.
+
+    Records and deletion markers appended to the local file since the last
+    download (ingestion, upsert_records, delete_records) are carried over to
+    the new file unless the source already has them, so a refresh never
+    drops local changes. The state file records the generation and how much
+    of the local file came from the source.
+    """
+
+    def __init__(self, source, local_path: str, on_update=None, validate=validate_embeddings_file):
+        self.source = source
+        self.local_path = local_path
+        self.on_update = on_update
+        self.validate = validate
+        self.state_path = local_path + ".generation"
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read_state(self):
+        """(generation, size of the downloaded part of the local file); (None, None) if never downloaded."""
+        try:
+            with open(self.state_path) as f:
+                lines = f.read().split()
+        except FileNotFoundError:
+            return None, None
+        generation = lines[0] if lines else None
+        # State files written before local changes were tracked hold only the generation
+        size = int(lines[1]) if len(lines) > 1 and lines[1].isdigit() else None
+        return generation, size
+
+    def current_generation(self):
+        return self._read_state()[0]
+
+    def _write_generation(self, generation: str, downloaded_size: int):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(f"{generation}\n{downloaded_size}\n")
+        os.replace(tmp, self.state_path)
+
+    @staticmethod
+    def _carry_over(local, downloaded_size: int, new_path: str) -> int:
+        """
+        Append the lines added to the open local file after downloaded_size to
+        new_path, leaving out those the new file already agrees with. Returns
+        how many lines were carried over.
+        """
+        local.seek(downloaded_size)
+        tail = local.read()
+        # A line still being written would have been finished under the lock; cut defensively anyway
+        tail = tail[:tail.rfind(b"\n") + 1]
+        changes = []
+        for line in tail.splitlines():
+            try:
+                record = json.loads(line)
+                changes.append((int(record["id"]), record, line))
+            except (ValueError, KeyError, TypeError):
+                if line.strip():
+                    print(f"Warning: Dropping invalid local line during refresh: {line[:80]!r}")
+        if not changes:
+            return 0
+        ids = {id_ for id_, _, _ in changes}
+        # Last record of each of those ids in the new file
+        current = {}
+        with open(new_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if int(record["id"]) in ids:
+                    current[int(record["id"])] = record
+        carried = []
+        for id_, record, line in changes:
+            latest = current.get(id_)
+            if record.get("deleted"):
+                present = latest is not None and not latest.get("deleted")
+                if not present:
+                    continue
+            elif latest == record:
+                continue
+            carried.append(line + b"\n")
+            current[id_] = record
+        if carried:
+            with open(new_path, "ab") as f:
+                f.writelines(carried)
+                f.flush()
+                os.fsync(f.fileno())
+        return len(carried)
+
+    def refresh(self, force: bool = False, notify: bool = True) -> bool:
+        """
+        Download the source if it changed (or force). Returns True if the local file was replaced.
+
+        With notify=False on_update is not called, for callers that load the
+        file themselves right after.
+        """
+        with self._lock:
+            generation = self.source.generation()
+            if generation is None:
+                raise FileNotFoundError(f"Embeddings source {self.source} does not exist")
+            if not force and os.path.exists(self.local_path) and generation == self.current_generation():
+                return False
+
+            directory = os.path.dirname(os.path.abspath(self.local_path))
+            fd, tmp_path = tempfile.mkstemp(prefix=".embeddings-", suffix=".tmp", dir=directory)
+            os.close(fd)
+            carried = 0
+            try:
+                self.source.download(tmp_path, generation)
+                records = self.validate(tmp_path)
+                downloaded_size = os.path.getsize(tmp_path)
+                _, local_downloaded = self._read_state()
+                if local_downloaded is not None and os.path.exists(self.local_path):
+                    # Held until the replace, so appends either land in the tail carried over or in the new file
+                    with open(self.local_path, "rb") as local:
+                        lock_file(local)
+                        carried = self._carry_over(local, local_downloaded, tmp_path)
+                        os.replace(tmp_path, self.local_path)
+                else:
+                    os.replace(tmp_path, self.local_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._write_generation(generation, downloaded_size)
+            print(f"Refreshed {self.local_path} from {self.source} (generation {generation}, {records} records, "
+                  f"{carried} local changes kept)")
+
+        if notify and self.on_update is not None:
+            self.on_update(generation)
+        return True
+
+    def start(self, interval: float):
+        """Check for a new version every interval seconds on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Warning: Embeddings refresh from {self.source} failed: {e}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="corpus-refresh", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
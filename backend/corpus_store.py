@@ -0,0 +1,328 @@
+import argparse
+import contextlib
+import glob
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, a single worker is assumed
+    fcntl = None
+
+IDS_FILE = "ids.npy"
+OFFSETS_FILE = "offsets.npy"
+TEXTS_FILE = "texts.bin"
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.json"
+# Superseded store versions kept for readers that resolved them just before a switch
+KEEP_OLD_VERSIONS = 1
+
+
+def convert_jsonl(source: str, dest_dir: str, vector_field: str = "embedding", vector_dtype: str = "float32") -> dict:
+    """
+    Convert an embeddings JSONL file into the compact store read by MmapCorpusStore.
+
+    Layout of dest_dir, all rows sorted by id:
+      ids.npy      int64 ids
+      offsets.npy  int64 byte offsets into texts.bin (one more than ids)
+      texts.bin    UTF-8 texts back to back
+      vectors.npy  float32/float16 matrix, one row per id (if the source has vectors)
+      meta.json    counts, dimension, dtype and vector field
+
+    When several records share an id, the last one in the file is kept; a
+    last line {"id": ..., "deleted": true} removes the record.
+
+    dest_dir is a symlink to the current version, a sibling directory named
+    after it. Each conversion writes a new version and switches the link
+    atomically, so readers never see a half-written or mixed store; one
+    process converts at a time.
+    """
+    with _store_lock(dest_dir):
+        return _convert(source, dest_dir, vector_field, vector_dtype)
+
+
+def prepare_store(source: str, dest_dir: str) -> str:
+    """
+    A store holding source, converted with the vector field and dtype dest_dir
+    was built with, for publish_store to switch dest_dir to once the caller is
+    done with it (e.g. has built an index over it). Returns dest_dir itself if
+    it already holds source.
+
+    Workers sharing the store all rebuild it after the same changes; whichever
+    gets the lock first converts, and the others find that version (published
+    or not) and reuse it.
+    """
+    with _store_lock(dest_dir):
+        with open(os.path.join(dest_dir, META_FILE)) as f:
+            meta = json.load(f)
+        st = os.stat(source)
+        if meta.get("source_inode") == st.st_ino and meta.get("source_size") == st.st_size:
+            return dest_dir
+        current = _version_number(os.path.realpath(dest_dir))
+        for number, version in reversed(_versions(dest_dir)):
+            if number <= current:
+                break
+            try:
+                with open(os.path.join(version, META_FILE)) as f:
+                    prepared = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if prepared.get("source_inode") == st.st_ino and prepared.get("source_size") == st.st_size:
+                return version
+        version, _ = _write_version(source, dest_dir, meta.get("vector_field") or "embedding",
+                                    meta.get("vector_dtype") or "float32")
+        return version
+
+
+def publish_store(dest_dir: str, version: str):
+    """Switch dest_dir to a version from prepare_store, unless a newer one is already published."""
+    with _store_lock(dest_dir):
+        if _version_number(version) > _version_number(os.path.realpath(dest_dir)):
+            _switch_version(dest_dir, version)
+
+
+def lock_file(f):
+    """Take an exclusive lock on an open file until it is closed (or unlock_file)."""
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+
+def unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def _store_lock(dest_dir: str):
+    """Exclusive lock on dest_dir's lock file, held by one process at a time."""
+    os.makedirs(os.path.dirname(os.path.abspath(dest_dir)), exist_ok=True)
+    with open(os.path.abspath(dest_dir) + ".lock", "a") as f:
+        lock_file(f)
+        try:
+            yield
+        finally:
+            unlock_file(f)
+
+
+def _convert(source: str, dest_dir: str, vector_field: str, vector_dtype: str) -> dict:
+    version, meta = _write_version(source, dest_dir, vector_field, vector_dtype)
+    _switch_version(dest_dir, version)
+    return meta
+
+
+def _write_version(source: str, dest_dir: str, vector_field: str, vector_dtype: str):
+    """Convert source into a new, unpublished version directory of dest_dir; returns (path, meta)."""
+    if vector_dtype not in ("float32", "float16"):
+        raise ValueError(f"Unsupported vector dtype: {vector_dtype}")
+    ids, texts, vectors = [], [], []
+    with open(source, encoding="utf-8") as f:
+        source_stat = os.fstat(f.fileno())
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "id" in record and record.get("deleted"):
+                ids.append(int(record["id"]))
+                texts.append(None)
+                vectors.append(None)
+                continue
+            if "id" not in record or "text" not in record:
+                raise ValueError(f"{source}:{line_no}: record has no 'id' or 'text'")
+            ids.append(int(record["id"]))
+            texts.append(record["text"].encode("utf-8"))
+            vectors.append(record.get(vector_field))
+    with_vectors = sum(v is not None for v in vectors)
+    deletions = texts.count(None)
+    if with_vectors and with_vectors + deletions != len(ids):
+        raise ValueError(f"{source}: only {with_vectors} of {len(ids) - deletions} records have '{vector_field}'")
+
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids, kind="stable")
+    ids = ids[order]
+    if len(ids) > 1:
+        # Appended records (see ingestion.py) replace earlier lines with the same id: keep the last of each run
+        last = np.append(ids[1:] != ids[:-1], True)
+        ids, order = ids[last], order[last]
+    if deletions:
+        live = np.asarray([texts[row] is not None for row in order], dtype=bool)
+        ids, order = ids[live], order[live]
+
+    dest_dir = os.path.abspath(dest_dir)
+    parent = os.path.dirname(dest_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".corpus-store-", dir=parent)
+    try:
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        with open(os.path.join(tmp_dir, TEXTS_FILE), "wb") as out:
+            for i, row in enumerate(order):
+                out.write(texts[row])
+                offsets[i + 1] = offsets[i] + len(texts[row])
+        np.save(os.path.join(tmp_dir, IDS_FILE), ids)
+        np.save(os.path.join(tmp_dir, OFFSETS_FILE), offsets)
+        dim = 0
+        if with_vectors and len(order):
+            matrix = np.asarray([vectors[row] for row in order], dtype=np.float32).astype(vector_dtype)
+            dim = matrix.shape[1]
+            np.save(os.path.join(tmp_dir, VECTORS_FILE), matrix)
+        meta = {
+            "count": int(len(ids)),
+            "dim": int(dim),
+            "vector_dtype": vector_dtype if with_vectors else None,
+            "vector_field": vector_field,
+            "source": os.path.basename(source),
+            # Lines appended to the source after this size are not in the store (see segments.LiveDelta)
+            "source_size": int(source_stat.st_size),
+            "source_inode": int(source_stat.st_ino),
+            "created": time.time(),
+        }
+        with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+            json.dump(meta, f)
+        version = f"{dest_dir}.v{time.time_ns()}"
+        os.rename(tmp_dir, version)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return version, meta
+
+
+def append_records(path: str, records):
+    """
+    Durably append records ({"id", "text", "embedding"} dicts, or {"id", "deleted": True}
+    deletion markers) to an embeddings JSONL file.
+
+    The file is locked while writing; a refresh holds the same lock while it
+    carries the appended lines over into the file that replaces this one.
+    """
+    lines = "".join(json.dumps(record) + "\n" for record in records)
+    while True:
+        with open(path, "a", encoding="utf-8") as f:
+            lock_file(f)
+            if os.fstat(f.fileno()).st_ino != os.stat(path).st_ino:
+                # Replaced by a refresh while waiting for the lock: append to the new file instead
+                continue
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+            return
+
+
+def _switch_version(dest: str, version: str):
+    """Point the dest symlink at version atomically and remove all but the newest old versions."""
+    if os.path.isdir(dest) and not os.path.islink(dest):
+        # A store from before versioning: it becomes an old version; readers see no store until the link exists
+        os.rename(dest, f"{dest}.v0")
+    link = f"{dest}.link-{os.getpid()}"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(version), link)
+    os.replace(link, dest)
+    # Versions newer than this one were prepared by another worker and are not published yet
+    old = [path for number, path in _versions(dest) if number < _version_number(version)]
+    for path in old[:max(len(old) - KEEP_OLD_VERSIONS, 0)]:
+        # Readers that already opened a removed version keep their mmaps
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _version_number(path: str) -> int:
+    """The number of a "<store>.v<number>" version directory; -1 for anything else."""
+    suffix = path.rpartition(".v")[2]
+    return int(suffix) if suffix.isdigit() else -1
+
+
+def _versions(dest: str) -> list:
+    """(number, path) of every version directory of dest, oldest first."""
+    return sorted(
+        (int(path[len(dest) + 2:]), path) for path in glob.glob(glob.escape(dest) + ".v*")
+        if path[len(dest) + 2:].isdigit()
+    )
+
+
+def store_exists(path: str) -> bool:
+    return os.path.exists(os.path.join(path, META_FILE))
+
+
+class MmapCorpusStore:
+    """
+    Read-only corpus store opened with mmap.
+
+    Opening is near-instant and the pages are shared by every process that
+    maps the same files. Offers the same lookup API as TextStore.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Resolved once so every file comes from the same version, even if the link switches meanwhile
+        path = os.path.realpath(path)
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        # Plain ndarray views of the memmaps: same shared pages, without np.memmap's per-access overhead
+        self.ids = np.load(os.path.join(path, IDS_FILE), mmap_mode="r").view(np.ndarray)
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r").view(np.ndarray)
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        self.vectors = None
+        if os.path.exists(vectors_path):
+            self.vectors = np.load(vectors_path, mmap_mode="r").view(np.ndarray)
+        self._texts_file = open(os.path.join(path, TEXTS_FILE), "rb")
+        size = os.fstat(self._texts_file.fileno()).st_size
+        self._texts = mmap.mmap(self._texts_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id_):
+        return self._rows([id_])[0] >= 0
+
+    def _rows(self, ids):
+        """Row of each id in the store, or -1 where the id is missing."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.full(len(ids), -1)
+        pos = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        return np.where(self.ids[pos] == ids, pos, -1)
+
+    def _text(self, row: int) -> str:
+        return self._texts[self.offsets[row]:self.offsets[row + 1]].decode("utf-8")
+
+    def items(self):
+        """Iterate over (id, text) pairs in id order."""
+        for row in range(len(self.ids)):
+            yield int(self.ids[row]), self._text(row)
+
+    def get(self, id_, default=None):
+        row = self._rows([id_])[0]
+        return self._text(row) if row >= 0 else default
+
+    def lookup_many(self, ids) -> list:
+        """Return the texts for ids in the order given, skipping ids not in the store."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return []
+        rows = self._rows(ids)
+        rows = rows[rows >= 0]
+        texts = self._texts
+        starts = self.offsets[rows].tolist()
+        ends = self.offsets[rows + 1].tolist()
+        return [texts[start:end].decode("utf-8") for start, end in zip(starts, ends)]
+
+    def close(self):
+        if isinstance(self._texts, mmap.mmap):
+            self._texts.close()
+        self._texts_file.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert an embeddings JSONL file into a compact mmap store.")
+    parser.add_argument("source", help="embeddings JSONL file, e.g. embeddings_text.json")
+    parser.add_argument("dest", help="store directory to write")
+    parser.add_argument("--vector-field", default="embedding")
+    parser.add_argument("--float16", action="store_true", help="store vectors as float16 (half the size)")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    meta = convert_jsonl(args.source, args.dest, args.vector_field, "float16" if args.float16 else "float32")
+    print(f"Wrote {meta['count']} records (dim {meta['dim']}) to {args.dest} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,39 @@
+import numpy as np
+
+
+def _unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def select_diverse(query, candidates, k: int, mmr_lambda: float = 0.7, duplicate_similarity: float = 1.0) -> list:
+    """
+    Pick up to k of the candidate vectors by maximal marginal relevance.
+
+    Each step takes the candidate with the best
+        mmr_lambda * sim(query, c) - (1 - mmr_lambda) * max sim(c, already picked)
+    using cosine similarity, so mmr_lambda=1 keeps the relevance order. A
+    candidate at least duplicate_similarity similar to a picked one is a near
+    duplicate and is never picked, so fewer than k may come back.
+
+    Returns the positions of the picked candidates, in pick order.
+    """
+    candidates = _unit_rows(candidates)
+    n = len(candidates)
+    if n == 0 or k <= 0:
+        return []
+    relevance = candidates @ _unit_rows(query)
+    # All pairwise similarities at once; candidate pools are a few hundred vectors at most
+    similarity = candidates @ candidates.T
+    redundancy = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    picked = []
+    while len(picked) < k and available.any():
+        scores = np.where(available, mmr_lambda * relevance - (1 - mmr_lambda) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        available &= similarity[best] < duplicate_similarity
+        redundancy = np.maximum(redundancy, similarity[best])
+    return picked
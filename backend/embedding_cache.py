@@ -0,0 +1,165 @@
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a query: case-folded with whitespace collapsed."""
+    return " ".join(text.split()).casefold()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of query embeddings keyed on (model name, normalized query).
+
+    A bounded in-memory LRU sits in front of an optional SQLite file. The file
+    survives restarts and is safe to share between worker processes (WAL mode),
+    so every worker benefits from embeddings computed by the others. Both tiers
+    hold float32 values, so a query gets the same vector from either tier and
+    from the call that computed it.
+    """
+
+    def __init__(self, model_name: str, path: str = None, max_entries: int = 1024):
+        self.model_name = model_name
+        self.path = path or None
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.path:
+            self._connect()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, vector BLOB NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (model, query))"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _get_memory(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return vector
+
+    def _get_disk(self, keys):
+        if not self.path or not keys:
+            return {}
+        found = {}
+        conn = self._connect()
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT query, vector FROM embeddings WHERE model = ? AND query IN ({','.join('?' * len(chunk))})",
+                [self.model_name, *chunk],
+            ).fetchall()
+            for query, blob in rows:
+                found[query] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _put_disk(self, items):
+        if not self.path or not items:
+            return
+        conn = self._connect()
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, query, vector, created) VALUES (?, ?, ?, ?)",
+            [(self.model_name, key, np.asarray(v, dtype=np.float32).tobytes(), now) for key, v in items],
+        )
+        conn.commit()
+
+    def get_embeddings(self, texts, embed_fn) -> list:
+        """
+        Return one embedding per text, calling embed_fn(list_of_texts) once for all misses.
+
+        embed_fn must return a list of vectors in the same order as its input.
+        """
+        keys = [normalize_query(t) for t in texts]
+        vectors = {}
+        for key in keys:
+            if key not in vectors:
+                vector = self._get_memory(key)
+                if vector is not None:
+                    vectors[key] = vector
+
+        on_disk = self._get_disk({k for k in keys if k not in vectors})
+        for key, vector in on_disk.items():
+            vectors[key] = vector
+            self._remember(key, vector)
+        with self._lock:
+            self.disk_hits += len(on_disk)
+
+        missing = {}
+        for text, key in zip(texts, keys):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+            computed = embed_fn(list(missing.values()))
+            items = [(key, np.asarray(vector, dtype=np.float32).tolist()) for key, vector in zip(missing, computed)]
+            for key, vector in items:
+                vectors[key] = vector
+                self._remember(key, vector)
+            self._put_disk(items)
+        return [vectors[key] for key in keys]
+
+    def preseed(self, queries, embed_fn, batch_size: int = 250) -> int:
+        """Embed and store any of queries not already cached. Returns how many were embedded."""
+        before = self.misses
+        queries = list(queries)
+        for start in range(0, len(queries), batch_size):
+            self.get_embeddings(queries[start:start + batch_size], embed_fn)
+        return self.misses - before
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+
+if __name__ == "__main__":
+    # Pre-seed the cache at deploy time:
+    #   python -m backend.embedding_cache [queries.txt]
+    # With no file, the canonical searches from the root prompt are used.
+    from .prompts import CANONICAL_SEARCH_QUERIES
+    from .tools import get_embedding_cache, preseed_embedding_cache
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            seed_queries = [line.strip() for line in f if line.strip()]
+    else:
+        seed_queries = CANONICAL_SEARCH_QUERIES
+    embedded = preseed_embedding_cache(seed_queries)
+    print(f"Embedded {embedded} of {len(seed_queries)} queries into {get_embedding_cache().path or 'memory'}")
+    print(get_embedding_cache().stats())
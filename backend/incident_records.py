@@ -0,0 +1,55 @@
+"""
+The incident text format stored in the embeddings corpus:
+
+    Incident ID: INC-1000 | Severity: High | Service Impact: ... | Description: ... | Resolution Steps: ... | Root Cause: ...
+
+Records may also carry a Timestamp field. Text that doesn't follow the
+format is kept whole under the "text" key.
+"""
+import re
+
+# Label in the text -> field name, in the order records are written
+FIELDS = {
+    "Incident ID": "incident_id",
+    "Timestamp": "timestamp",
+    "Severity": "severity",
+    "Service Impact": "service_impact",
+    "Description": "incident_description",
+    "Resolution Steps": "resolution_steps",
+    "Root Cause": "root_cause",
+}
+LABELS = {field: label for label, field in FIELDS.items()}
+SEPARATOR = " | "
+
+# Descriptions name the place as "... observed in Manchester."
+_LOCATION = re.compile(r"\bobserved in ([A-Z][\w'-]*(?: [A-Z][\w'-]*)*)")
+
+
+def parse_incident_text(text: str) -> dict:
+    """Split a record into {field: value}, in text order; unknown parts are kept under "text"."""
+    record = {}
+    extra = []
+    for part in text.split(SEPARATOR):
+        label, sep, value = part.partition(": ")
+        field = FIELDS.get(label.strip()) if sep else None
+        if field is None:
+            extra.append(part)
+        else:
+            record[field] = value.strip()
+    if extra:
+        record["text"] = SEPARATOR.join(extra).strip()
+    return record
+
+
+def format_incident_text(record: dict) -> str:
+    """The inverse of parse_incident_text: "Label: value" parts joined by " | "."""
+    parts = [f"{LABELS[field]}: {record[field]}" for field in LABELS if record.get(field) not in (None, "")]
+    if record.get("text"):
+        parts.append(record["text"])
+    return SEPARATOR.join(parts)
+
+
+def incident_location(record: dict):
+    """The location named in a parsed record's description, or None."""
+    match = _LOCATION.search(record.get("incident_description") or record.get("text") or "")
+    return match.group(1) if match else None
@@ -0,0 +1,422 @@
+"""
+Ingest new incidents into the retrieval corpus.
+
+Records are streamed from a JSONL or CSV file, turned into the corpus text
+format, embedded in batches sized to the embedding model's request limits
+(several requests in flight, rate limited), appended to the embeddings file
+and upserted into the search index. Servers following the file see each
+batch within seconds.
+
+Progress is checkpointed per batch next to the input file, so a crashed run
+resumes where it stopped; records whose text is already in the corpus are
+not embedded again either.
+
+    python -m backend.ingestion incidents.jsonl
+    python -m backend.ingestion incidents.csv --workers 8 --requests-per-minute 600
+    python -m backend.ingestion --delete INC-1042 INC-1043
+"""
+import argparse
+import csv
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+from .context_builder import estimate_tokens
+from .corpus_store import append_records
+from .incident_records import FIELDS, format_incident_text
+
+load_dotenv()
+
+# text-embedding-004 takes at most 250 texts and 20,000 tokens per request
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "250"))
+INGEST_MAX_BATCH_TOKENS = int(os.getenv("INGEST_MAX_BATCH_TOKENS", "20000"))
+# Embedding requests in flight at once, and the most started per minute (0 = no limit)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_REQUESTS_PER_MINUTE = float(os.getenv("INGEST_REQUESTS_PER_MINUTE", "300"))
+# Attempts per batch when the embedding request fails (quota errors back off exponentially)
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+
+_INCIDENT_ID = re.compile(r"(?:^|\| )Incident ID: ([^|]+?)\s*(?:\||$)")
+_QUOTA_MESSAGE = re.compile(
+    r"\b429\b|quota|resource[ _]exhausted|rate[ -]limit|too many requests", re.IGNORECASE
+)
+
+try:
+    from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+
+    _QUOTA_ERRORS = (ResourceExhausted, TooManyRequests)
+except ImportError:
+    _QUOTA_ERRORS = ()
+
+
+def read_records(path: str):
+    """Yield incident records (dicts) from a .jsonl/.json or .csv file, in file order."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                yield {k: v for k, v in row.items() if k is not None}
+        return
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_no}: invalid JSON ({e})")
+
+
+def incident_text(record: dict) -> str:
+    """The corpus text of a record: its "text" field if it has one, else the fields in corpus format."""
+    if isinstance(record.get("text"), str) and not any(field in record for field in FIELDS.values()):
+        return record["text"]
+    return format_incident_text({field: str(value).strip() for field, value in record.items() if value is not None})
+
+
+def record_key(text: str) -> str:
+    """Identity of a corpus record: its incident id, or a hash of the text when it has none."""
+    match = _INCIDENT_ID.search(text)
+    if match:
+        return "incident:" + match.group(1).strip().upper()
+    return "text:" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def plan_batches(texts, batch_size: int = INGEST_BATCH_SIZE, max_tokens: int = INGEST_MAX_BATCH_TOKENS):
+    """
+    Group texts into embedding requests of at most batch_size texts and
+    max_tokens estimated tokens. Yields lists of texts, reading texts lazily.
+    """
+    batch, tokens = [], 0
+    for text in texts:
+        size = estimate_tokens(text)
+        if batch and (len(batch) >= batch_size or tokens + size > max_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(text)
+        tokens += size
+    if batch:
+        yield batch
+
+
+class RateLimiter:
+    """Spaces out calls to at most per_minute a minute, across threads."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class Checkpoint:
+    """
+    Completed batch numbers of one ingestion run, kept in a JSON file.
+
+    The run is identified by the input's size and mtime and the batching
+    settings; a checkpoint from a different run is ignored.
+    """
+
+    def __init__(self, path: str, run: dict):
+        self.path = path
+        self.run = run
+        self.done = set()
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("run") == run:
+                self.done = set(saved.get("done", []))
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def mark(self, batch: int):
+        self.done.add(batch)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"run": self.run, "done": sorted(self.done)}, f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class CorpusAppender:
+    """
+    Appends embedded records to an embeddings JSONL file.
+
+    Ids continue after the largest id in the corpus; a record whose incident
+    id is already in the corpus keeps that id, and the newer line replaces
+    the older one when the corpus is loaded. Records whose text is already in
+    the corpus unchanged are reported as known so they aren't embedded again.
+    """
+
+    def __init__(self, path: str, store=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._known = {}
+        next_id = 0
+        for id_, text in (store.items() if store is not None else self._read_file()):
+            self._known[record_key(text)] = (int(id_), hashlib.sha1(text.encode("utf-8")).digest())
+            next_id = max(next_id, int(id_) + 1)
+        self._next_id = next_id
+
+    def _read_file(self):
+        records = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        if record.get("deleted"):
+                            records.pop(int(record["id"]), None)
+                        else:
+                            records[int(record["id"])] = record["text"]
+        return records.items()
+
+    def is_known(self, text: str) -> bool:
+        known = self._known.get(record_key(text))
+        return known is not None and known[1] == hashlib.sha1(text.encode("utf-8")).digest()
+
+    def assign_ids(self, texts) -> list:
+        """Corpus id for each text, allocating new ids in order."""
+        ids = []
+        with self._lock:
+            for text in texts:
+                key = record_key(text)
+                known = self._known.get(key)
+                if known is None:
+                    known = (self._next_id, None)
+                    self._known[key] = known
+                    self._next_id += 1
+                ids.append(known[0])
+        return ids
+
+    def append(self, ids, texts, vectors):
+        records = [
+            {"id": int(id_), "text": text, "embedding": [float(v) for v in vector]}
+            for id_, text, vector in zip(ids, texts, vectors)
+        ]
+        with self._lock:
+            append_records(self.path, records)
+            for id_, text in zip(ids, texts):
+                self._known[record_key(text)] = (int(id_), hashlib.sha1(text.encode("utf-8")).digest())
+
+    def incident_ids(self, incident_ids) -> list:
+        """Corpus ids of the records with these incident ids (e.g. INC-1042); unknown ones are left out."""
+        keys = ["incident:" + incident_id.strip().upper() for incident_id in incident_ids]
+        return [self._known[key][0] for key in keys if key in self._known]
+
+    def append_deletions(self, ids):
+        """Append deletion markers, which remove the records with these ids when the corpus is loaded."""
+        ids = {int(id_) for id_ in ids}
+        with self._lock:
+            append_records(self.path, [{"id": id_, "deleted": True} for id_ in sorted(ids)])
+            self._known = {key: known for key, known in self._known.items() if known[0] not in ids}
+
+
+def _is_quota_error(error: Exception) -> bool:
+    """Whether an embedding request failed on quota or rate limits (HTTP 429 / RESOURCE_EXHAUSTED)."""
+    if _QUOTA_ERRORS and isinstance(error, _QUOTA_ERRORS):
+        return True
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    return _QUOTA_MESSAGE.search(str(error)) is not None
+
+
+def embed_with_retry(embed_fn, texts, limiter: RateLimiter, max_attempts: int = INGEST_MAX_ATTEMPTS):
+    """embed_fn(texts) under the rate limit, retrying failures with exponential backoff."""
+    for attempt in range(1, max_attempts + 1):
+        limiter.acquire()
+        try:
+            return embed_fn(texts)
+        except Exception as e:
+            if attempt == max_attempts:
+                raise
+            delay = min(60.0, (4.0 if _is_quota_error(e) else 1.0) * 2 ** (attempt - 1))
+            print(f"Warning: embedding request failed ({e}); retrying in {delay:.0f}s")
+            time.sleep(delay)
+
+
+def ingest_texts(texts, embed_fn, appender: CorpusAppender, upsert=None, checkpoint: Checkpoint = None,
+                 workers: int = INGEST_WORKERS, requests_per_minute: float = INGEST_REQUESTS_PER_MINUTE,
+                 batch_size: int = INGEST_BATCH_SIZE, max_tokens: int = INGEST_MAX_BATCH_TOKENS,
+                 progress_every: float = 10.0) -> dict:
+    """
+    Embed texts and add them to the corpus.
+
+    texts is read lazily, a batch at a time, with at most two batches per
+    worker thread in flight, so memory stays bounded however long the input
+    is. Each embedded batch is appended to the corpus, passed to
+    upsert(ids, vectors, texts) if given, and then marked done in the
+    checkpoint. Texts already in the corpus unchanged are skipped. Returns
+    counts and throughput.
+    """
+    start = time.perf_counter()
+    limiter = RateLimiter(requests_per_minute)
+    workers = max(1, workers)
+    stats = {"records": 0, "batches": 0, "embedded": 0, "skipped": 0, "resumed_batches": 0}
+
+    def run(number, batch_texts):
+        new_texts = [t for t in batch_texts if not appender.is_known(t)]
+        vectors = embed_with_retry(embed_fn, new_texts, limiter) if new_texts else []
+        return number, len(batch_texts) - len(new_texts), new_texts, vectors
+
+    def collect(pending, return_when):
+        finished, pending = wait(pending, return_when=return_when)
+        for future in finished:
+            number, skipped, new_texts, vectors = future.result()
+            if new_texts:
+                ids = appender.assign_ids(new_texts)
+                appender.append(ids, new_texts, vectors)
+                if upsert is not None:
+                    upsert(ids, vectors, new_texts)
+            if checkpoint is not None:
+                checkpoint.mark(number)
+            stats["embedded"] += len(new_texts)
+            stats["skipped"] += skipped
+        return pending
+
+    last_report = start
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as pool:
+        pending = set()
+        for number, batch_texts in enumerate(plan_batches(texts, batch_size, max_tokens)):
+            stats["batches"] += 1
+            stats["records"] += len(batch_texts)
+            if checkpoint is not None and number in checkpoint.done:
+                stats["resumed_batches"] += 1
+                stats["skipped"] += len(batch_texts)
+                continue
+            pending.add(pool.submit(run, number, batch_texts))
+            if len(pending) >= 2 * workers:
+                pending = collect(pending, FIRST_COMPLETED)
+            now = time.perf_counter()
+            if progress_every and now - last_report >= progress_every:
+                last_report = now
+                done = stats["embedded"] + stats["skipped"]
+                print(f"Ingested {done} records so far ({stats['embedded'] / (now - start):.1f} records/s)")
+        collect(pending, ALL_COMPLETED)
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["records_per_second"] = stats["embedded"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def _check_remote_index():
+    from . import tools
+
+    if tools.VECTOR_SEARCH_BACKEND != "remote":
+        return
+    backend = tools.get_search_backend()
+    if backend is None or getattr(backend, "index", None) is None:
+        print("Warning: INDEX_ID is not set; changes reach the corpus file and lookups but not the remote index")
+
+
+def _serving_appender():
+    """A CorpusAppender on EMBEDDINGS_FILE that knows the records currently served."""
+    from . import tools
+
+    store = tools.get_text_store()
+    # With a compact store the JSONL file may never have been downloaded; appending needs the full file
+    tools.download_embeddings_if_not_exists()
+    _check_remote_index()
+    return CorpusAppender(tools.EMBEDDINGS_FILE, store)
+
+
+def ingest_records(records, embeddings_file: str = None, checkpoint_path: str = None, run: dict = None,
+                   **kwargs) -> dict:
+    """
+    Add incident records (dicts with the network_data columns, or {"text": ...})
+    to the corpus file and, batch by batch, to the serving corpus and search
+    index (tools.upsert_records), so they are searchable right away.
+
+    Remaining keyword arguments go to ingest_texts (workers,
+    requests_per_minute, batch_size, max_tokens).
+    """
+    from . import tools
+
+    if embeddings_file in (None, tools.EMBEDDINGS_FILE):
+        appender, upsert = _serving_appender(), functools.partial(tools.upsert_records, persisted=True)
+    else:
+        appender, upsert = CorpusAppender(embeddings_file), None
+    checkpoint = Checkpoint(checkpoint_path, run or {}) if checkpoint_path else None
+    texts = (incident_text(record) for record in records)
+    stats = ingest_texts(texts, tools._embed_uncached, appender, upsert=upsert, checkpoint=checkpoint, **kwargs)
+    if checkpoint is not None:
+        checkpoint.remove()
+    print(
+        f"Ingested {stats['embedded']} new incidents in {stats['seconds']:.1f}s "
+        f"({stats['records_per_second']:.1f} records/s); {stats['skipped']} already present"
+    )
+    return stats
+
+
+def ingest_file(path: str, **kwargs) -> dict:
+    """Ingest every record of a JSONL or CSV file, resuming from its checkpoint if a previous run stopped."""
+    info = os.stat(path)
+    run = {
+        "source": os.path.abspath(path),
+        "size": info.st_size,
+        "mtime": info.st_mtime,
+        "batch_size": kwargs.get("batch_size", INGEST_BATCH_SIZE),
+        "max_tokens": kwargs.get("max_tokens", INGEST_MAX_BATCH_TOKENS),
+    }
+    return ingest_records(read_records(path), checkpoint_path=path + ".checkpoint", run=run, **kwargs)
+
+
+def delete_incidents(incident_ids) -> list:
+    """
+    Remove incidents, by incident id (e.g. INC-1042), from the corpus file, the
+    serving corpus and the search index. Returns the corpus ids removed.
+    """
+    from . import tools
+
+    appender = _serving_appender()
+    ids = appender.incident_ids(incident_ids)
+    if ids:
+        appender.append_deletions(ids)
+        tools.delete_records(ids, persisted=True)
+    print(f"Deleted {len(ids)} of {len(incident_ids)} incidents")
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", help=".jsonl or .csv file of incidents")
+    parser.add_argument("--delete", nargs="+", metavar="INCIDENT_ID", help="remove these incidents instead")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--requests-per-minute", type=float, default=INGEST_REQUESTS_PER_MINUTE)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--max-tokens", type=int, default=INGEST_MAX_BATCH_TOKENS)
+    args = parser.parse_args()
+    from . import tools
+
+    # This process only writes the corpus file; the servers following it pick up the changes
+    tools.LIVE_POLL_INTERVAL = 0
+    if args.delete:
+        delete_incidents(args.delete)
+        return
+    if not args.path:
+        parser.error("a file of incidents (or --delete) is required")
+    ingest_file(args.path, workers=args.workers, requests_per_minute=args.requests_per_minute,
+                batch_size=args.batch_size, max_tokens=args.max_tokens)
+
+
+if __name__ == "__main__":
+    main()
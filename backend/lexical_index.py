@@ -0,0 +1,151 @@
+import re
+
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z]+-\d+|[a-z0-9]+")
+_INCIDENT_ID = re.compile(r"^inc-\d+$")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it of on or that the this to was were with "
+    "what which who how when where why show me find get give tell about any all details detail "
+    "incident incidents info information".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """Lowercase word tokens; incident ids such as INC-1042 stay one token."""
+    return _TOKEN.findall(text.lower())
+
+
+def is_incident_id(term: str) -> bool:
+    """Whether a token is an incident id such as inc-1042."""
+    return _INCIDENT_ID.match(term) is not None
+
+
+def query_terms(query: str) -> list:
+    """Distinct tokens of a query, without stopwords, in order of appearance."""
+    return list(dict.fromkeys(t for t in tokenize(query) if t not in STOPWORDS))
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60) -> list:
+    """
+    Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in.
+
+    Returns the ids ordered by fused score; ties keep first-seen order.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the corpus texts.
+
+    Each term's postings hold the documents containing it and their BM25 term
+    weights, precomputed at build time, so a search is one vectorized
+    scatter-add per query term followed by a top-k selection.
+    """
+
+    def __init__(self, ids, texts, k1: float = 1.2, b: float = 0.75):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self._rows = {int(id_): row for row, id_ in enumerate(self.ids)}
+        n = len(self.ids)
+        vocabulary = {}
+        token_ids = []
+        lengths = np.zeros(n, dtype=np.int64)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            token_ids.extend([vocabulary.setdefault(t, len(vocabulary)) for t in tokens])
+
+        # One (term, row) key per token; unique keys with their counts are the postings with term frequencies
+        keys = np.asarray(token_ids, dtype=np.int64) * max(n, 1) + np.repeat(np.arange(n, dtype=np.int64), lengths)
+        keys, tf = np.unique(keys, return_counts=True)
+        terms, rows = np.divmod(keys, max(n, 1))
+        doc_freq = np.bincount(terms, minlength=len(vocabulary))
+        idf = np.log1p((n - doc_freq + 0.5) / (doc_freq + 0.5))
+        avg_length = lengths.mean() if n and lengths.any() else 1.0
+        tf = tf.astype(np.float32)
+        weights = (idf[terms] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[rows] / avg_length))).astype(np.float32)
+        rows = rows.astype(np.int32)
+
+        bounds = np.concatenate([[0], np.cumsum(doc_freq)])
+        self._postings = {
+            term: (rows[bounds[i]:bounds[i + 1]], weights[bounds[i]:bounds[i + 1]])
+            for term, i in vocabulary.items()
+        }
+
+    @classmethod
+    def from_store(cls, store, **kwargs):
+        """Index every text in a TextStore or MmapCorpusStore."""
+        ids, texts = [], []
+        for id_, text in store.items():
+            ids.append(id_)
+            texts.append(text)
+        return cls(ids, texts, **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query: str, k: int = 10, allowed=None) -> list:
+        """
+        Top k (id, score) pairs for the query, best first; documents sharing no term are left out.
+
+        allowed is an optional boolean mask over the rows; other documents are not returned.
+        """
+        postings = [self._postings[t] for t in query_terms(query) if t in self._postings]
+        if not postings or k <= 0:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for rows, weights in postings:
+            # Rows are unique within a term's postings, so a fancy-indexed add is safe
+            scores[rows] += weights
+        if allowed is not None:
+            scores[~allowed] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(self.ids[row]), float(scores[row])) for row in candidates]
+
+    def incident_ids(self, query: str) -> list:
+        """Corpus ids of the records whose incident id (e.g. INC-1042) appears in the query."""
+        found = []
+        for term in query_terms(query):
+            if is_incident_id(term) and term in self._postings:
+                found.extend(int(self.ids[row]) for row in self._postings[term][0])
+        return list(dict.fromkeys(found))
+
+    def answers_alone(self, query: str, hits: list, confidence: float = 2.0) -> bool:
+        """
+        Whether the lexical result can stand without a vector search.
+
+        True when the query is nothing but incident ids that are all in the
+        corpus, or when the top hit contains every query term and scores at
+        least confidence times the runner-up.
+        """
+        terms = query_terms(query)
+        if not terms or not hits:
+            return False
+        if all(is_incident_id(t) for t in terms):
+            return all(t in self._postings for t in terms)
+        if not self.contains_terms(hits[0][0], terms):
+            return False
+        return len(hits) == 1 or hits[0][1] >= confidence * hits[1][1]
+
+    def contains_terms(self, id_, terms) -> bool:
+        """Whether the document with this id contains every one of the terms."""
+        row = self._rows.get(int(id_))
+        if row is None:
+            return False
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None or not np.any(postings[0] == row):
+                return False
+        return True
+
+    def rows(self, ids):
+        """Sorted rows of those ids that are in the index."""
+        return np.asarray(sorted({self._rows[int(i)] for i in ids if int(i) in self._rows}), dtype=np.int64)
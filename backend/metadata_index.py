@@ -0,0 +1,203 @@
+import datetime
+
+import numpy as np
+
+from .incident_records import incident_location, parse_incident_text
+
+# Fields that retrieval can be filtered on; also the restrict namespaces of the remote index
+FILTER_FIELDS = ("severity", "service_impact", "location")
+# Numeric restrict namespace holding the incident day (proleptic Gregorian ordinal)
+DAY_NAMESPACE = "day"
+# Fields matched exactly (case-insensitive); the others match any indexed value containing the filter text
+EXACT_FIELDS = ("severity",)
+
+
+def parse_day(value):
+    """Ordinal of a "YYYY-MM-DD[ HH:MM[:SS]]" date or timestamp, or None if it can't be parsed."""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(str(value).strip().replace("T", " ")).date().toordinal()
+    except ValueError:
+        return None
+
+
+def split_values(value) -> list:
+    """Filter values from a comma-separated string or a list, without blanks."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [v.strip() for v in value if v and v.strip()]
+
+
+def record_metadata(text: str) -> dict:
+    """The filterable fields of one corpus text, lowercased, plus its day ordinal under "day"."""
+    record = parse_incident_text(text)
+    metadata = {
+        "severity": record.get("severity"),
+        "service_impact": record.get("service_impact"),
+        "location": incident_location(record),
+    }
+    metadata = {field: value.casefold() for field, value in metadata.items() if value}
+    day = parse_day(record.get("timestamp"))
+    if day is not None:
+        metadata["day"] = day
+    return metadata
+
+
+class MetadataIndex:
+    """
+    Posting lists over the incident fields of the corpus, by store row.
+
+    For each filter field and value the index holds the sorted rows of the
+    records with that value, and an int32 array holds each record's day (-1
+    for records without a timestamp), so a filter combination becomes one
+    boolean row mask without parsing any text at query time. Rows follow the
+    store's order, the same order the local vector and lexical indexes use.
+    """
+
+    def __init__(self, ids, texts):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.days = np.full(len(self.ids), -1, dtype=np.int32)
+        rows_by_value = {field: {} for field in FILTER_FIELDS}
+        for row, text in enumerate(texts):
+            metadata = record_metadata(text)
+            self.days[row] = metadata.pop("day", -1)
+            for field, value in metadata.items():
+                rows_by_value[field].setdefault(value, []).append(row)
+        self._postings = {
+            field: {value: np.asarray(rows, dtype=np.int32) for value, rows in values.items()}
+            for field, values in rows_by_value.items()
+        }
+        self._rows = {int(id_): row for row, id_ in enumerate(self.ids)}
+        # Corpora in the plain prepare_incident_text format have no Timestamp field
+        self.undated = bool(np.any(self.days < 0))
+
+    @classmethod
+    def from_store(cls, store):
+        ids, texts = [], []
+        for id_, text in store.items():
+            ids.append(id_)
+            texts.append(text)
+        return cls(ids, texts)
+
+    @classmethod
+    def merged(cls, main, delta, ids):
+        """
+        The index of a corpus holding ids (in store order) whose records are
+        all in main or delta, built from their postings without parsing any
+        text; records in both take their delta entry. Returns None when some
+        id is in neither, e.g. after the corpus file was replaced.
+        """
+        index = cls.__new__(cls)
+        index.ids = np.asarray(ids, dtype=np.int64)
+        index._rows = {int(id_): row for row, id_ in enumerate(index.ids)}
+        order = np.argsort(index.ids, kind="stable")
+
+        def new_rows(old_ids):
+            """Row of each old id in the new index, or -1 where it is gone."""
+            if len(index.ids) == 0 or len(old_ids) == 0:
+                return np.full(len(old_ids), -1, dtype=np.int64)
+            rows = order[np.minimum(np.searchsorted(index.ids, old_ids, sorter=order), len(order) - 1)]
+            return np.where(index.ids[rows] == old_ids, rows, -1)
+
+        main_rows = np.where(np.isin(main.ids, delta.ids), -1, new_rows(main.ids))
+        delta_rows = new_rows(delta.ids)
+        covered = np.zeros(len(index.ids), dtype=bool)
+        index.days = np.full(len(index.ids), -1, dtype=np.int32)
+        rows_by_value = {field: {} for field in FILTER_FIELDS}
+        for source, mapping in ((main, main_rows), (delta, delta_rows)):
+            kept = mapping >= 0
+            covered[mapping[kept]] = True
+            index.days[mapping[kept]] = source.days[kept]
+            for field, postings in source._postings.items():
+                for value, rows in postings.items():
+                    moved = mapping[rows]
+                    rows_by_value[field].setdefault(value, []).append(moved[moved >= 0])
+        if not covered.all():
+            return None
+        index._postings = {
+            field: {
+                value: np.sort(np.concatenate(parts)).astype(np.int32)
+                for value, parts in values.items() if sum(len(part) for part in parts)
+            }
+            for field, values in rows_by_value.items()
+        }
+        index.undated = bool(np.any(index.days < 0))
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def values(self, field: str) -> list:
+        """Indexed values of a field, most common first."""
+        postings = self._postings[field]
+        return sorted(postings, key=lambda v: -len(postings[v]))
+
+    def matching_values(self, field: str, wanted) -> list:
+        """Indexed values a filter selects: exact matches for EXACT_FIELDS, substring matches otherwise."""
+        found = []
+        for want in split_values(wanted):
+            want = want.casefold()
+            if field in EXACT_FIELDS:
+                found.extend(v for v in self._postings[field] if v == want)
+            else:
+                found.extend(v for v in self._postings[field] if want in v)
+        return list(dict.fromkeys(found))
+
+    def mask(self, filters: dict):
+        """
+        Boolean row mask of the records matching every filter, or None if no filter is set.
+
+        filters maps FILTER_FIELDS to a value or comma-separated values (any of
+        them may match) and may hold "start_day" / "end_day" ordinals; the
+        window includes both days. Records without a timestamp can't be placed
+        in a time window, so they always pass it.
+        """
+        mask = None
+        for field in FILTER_FIELDS:
+            if not split_values(filters.get(field)):
+                continue
+            field_mask = np.zeros(len(self.ids), dtype=bool)
+            for value in self.matching_values(field, filters[field]):
+                field_mask[self._postings[field][value]] = True
+            mask = field_mask if mask is None else mask & field_mask
+        start, end = filters.get("start_day"), filters.get("end_day")
+        if start is not None or end is not None:
+            window = self.days >= (start if start is not None else 0)
+            if end is not None:
+                window &= self.days <= end
+            window |= self.days < 0
+            mask = window if mask is None else mask & window
+        return mask
+
+    def rows(self, ids):
+        """Sorted rows of those ids that are in the index."""
+        return np.asarray(sorted({self._rows[int(i)] for i in ids if int(i) in self._rows}), dtype=np.int64)
+
+    def allows(self, mask, id_) -> bool:
+        row = self._rows.get(int(id_))
+        return row is not None and bool(mask[row])
+
+    def remote_restricts(self, filters: dict):
+        """
+        The filters as Matching Engine restricts: ([(namespace, allow_tokens)], [(namespace, op, value)]).
+
+        Substring filters are expanded to the indexed values they match, so the
+        index only needs the exact lowercased values as tokens. Undated records
+        have no day restrict and would never match one, so when the corpus has
+        any, the time window is left out and has to be applied to the results.
+        """
+        restricts = []
+        for field in FILTER_FIELDS:
+            if split_values(filters.get(field)):
+                restricts.append((field, self.matching_values(field, filters[field])))
+        numeric = []
+        if self.undated:
+            return restricts, numeric
+        if filters.get("start_day") is not None:
+            numeric.append((DAY_NAMESPACE, "GREATER_EQUAL", filters["start_day"]))
+        if filters.get("end_day") is not None:
+            numeric.append((DAY_NAMESPACE, "LESS_EQUAL", filters["end_day"]))
+        return restricts, numeric
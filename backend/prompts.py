@@ -35,6 +35,7 @@ The vector database contains historical incident records with the following stru
   - **Symptom-based searches**: "packet loss Manchester", "performance degradation", "authentication service"
   - **Component-based searches**: "core router", "BGP sessions", "SSL certificate"
   - **Root cause searches**: "fibre cut construction", "SIP trunk congestion", "certificate expired"
+  - Send the facet queries together in one retrieve_context_for_queries call
 
 - **Query Enhancement Techniques**:
   - Include location context when mentioned
@@ -96,8 +97,10 @@ For different incident types:
 - Use `ANALYTICS_AGENT_TOOL` when you have an analytics question related to the data you have.
 - Use retrieve_context_from_query with service impact terms, symptoms, and technical components
 - Perform multiple targeted searches: service type, symptoms, components, and locations
+- When you have several searches ready (e.g. one per facet), run them together with retrieve_context_for_queries instead of calling retrieve_context_from_query once per search
 - Search for both problem descriptions AND resolution steps
 - Include geographic context when available
+- When the question names a severity, service or location, pass it as a filter (severity, service_impact, location) instead of only putting it in the query text; every result will then match it
 
 ## Response Format:
 Structure responses to include:
@@ -110,4 +113,16 @@ Structure responses to include:
 
 Remember: Leverage the structured historical incident data to provide data-driven, proven solutions based on successful past resolutions while adapting to the specific context of the current incident.
     """
-    return prompt
\ No newline at end of file
+    return prompt
+
+
+# Searches the root instruction steers the agent towards; used to pre-seed the embedding cache
+CANONICAL_SEARCH_QUERIES = [
+    "4G Service Outage", "DNS Resolution Failure", "Billing Portal Access",
+    "packet loss Manchester", "performance degradation", "authentication service",
+    "core router", "BGP sessions", "SSL certificate",
+    "fibre cut construction", "SIP trunk congestion", "certificate expired",
+    "packet loss", "service outage", "network connectivity", "routing",
+    "access issues", "login failures", "latency", "slow response",
+    "router", "switch", "BGP", "routing protocol", "security", "encryption", "expired",
+]
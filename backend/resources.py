@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class LazyResource:
+    """
+    A value built by factory() on first use instead of at import time.
+
+    Concurrent first callers block on one build rather than racing to build
+    several. If the factory raises, nothing is cached and the next get()
+    tries again.
+    """
+
+    def __init__(self, name: str, factory):
+        self.name = name
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._value = None
+        self.load_seconds = None
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                start = time.perf_counter()
+                self._value = self._factory()
+                self.load_seconds = time.perf_counter() - start
+                self._loaded = True
+        return self._value
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def set(self, value):
+        """Replace the value, e.g. to inject a stand-in or swap in a reloaded one."""
+        with self._lock:
+            self._value = value
+            self._loaded = True
+
+    def reset(self):
+        """Drop the value so the next get() builds it again."""
+        with self._lock:
+            self._value = None
+            self._loaded = False
+            self.load_seconds = None
+
+
+def warm_up(resources, background: bool = True):
+    """
+    Build resources in order, on a daemon thread by default.
+
+    Failures are printed and skipped; the failed resource is retried on its
+    first real use. Returns the thread (or None when run in the foreground).
+    """
+
+    def run():
+        start = time.perf_counter()
+        for resource in resources:
+            try:
+                resource.get()
+            except Exception as e:
+                print(f"Warning: Failed to warm up {resource.name}: {e}")
+        print(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="backend-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Bounded TTL cache for retrieval results.
+
+    Entries expire ttl seconds after they are stored and the least recently
+    used entry is evicted once max_entries is reached. Each entry remembers
+    how long it took to compute, so hits can be reported as latency saved.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.saved_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, compute_seconds = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.saved_seconds += compute_seconds
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value, compute_seconds: float = 0.0):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl, compute_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, cacheable=lambda value: True):
+        """Return the cached value for key, or compute(), store it if cacheable(value), and return it."""
+        if not self.enabled:
+            return compute()
+        value = self.get(key)
+        if value is not None:
+            return value
+        start = time.perf_counter()
+        value = compute()
+        if cacheable(value):
+            self.put(key, value, time.perf_counter() - start)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "entries": len(self._entries),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,451 @@
+"""
+Live updates layered over the immutable main corpus segment.
+
+Records upserted or deleted since the corpus was loaded live in a small
+DeltaSegment. DeltaSegment.over(main) gives a view of a main-segment store,
+local vector index, metadata index or lexical index with the delta merged
+in: rows are the main rows followed by the delta rows, and main rows whose
+id was deleted or upserted again are hidden. A DeltaSegment never changes;
+every update builds a new one, so a query keeps a consistent view while
+updates land.
+
+The corpus file is the log of updates: LiveDelta follows the lines appended
+to it after the main segment was loaded, and compaction reloads the main
+segment from the file and starts following again from its new end.
+
+The main segment is a CorpusSnapshot. LiveDelta.view pairs it with the delta
+over it, and a query reads everything it uses from one view.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from .lexical_index import LexicalIndex, is_incident_id, query_terms
+from .metadata_index import MetadataIndex
+from .resources import LazyResource
+from .text_store import TextStore
+from .vector_search import LocalSearchBackend
+
+# Seconds before a failed compaction is retried, doubling with each failure in a row up to the maximum
+COMPACT_RETRY_DELAY = 30.0
+COMPACT_MAX_RETRY_DELAY = 3600.0
+
+
+class CorpusSnapshot:
+    """
+    One loaded version of the main segment: the store, and the search backend,
+    lexical index and metadata index that go with it, each built on first use.
+
+    A reload builds a complete new snapshot and swaps it in with one
+    assignment (LiveDelta.reset); a query keeps the snapshot it started with,
+    so its structures always agree on the rows.
+    """
+
+    def __init__(self, store, build_search_backend):
+        self.store = store
+        self.search_backend = LazyResource("search backend", lambda: build_search_backend(store))
+        self.lexical_index = LazyResource("lexical index", lambda: LexicalIndex.from_store(store))
+        # Posting lists over severity, service, location and day, for filtered retrieval
+        self.metadata_index = LazyResource("metadata index", lambda: MetadataIndex.from_store(store))
+
+
+class DeltaSegment:
+    """
+    Records changed since the main segment was built.
+
+    records maps id -> (text, vector) for upserted records; deleted holds ids
+    removed from the main segment. Both kinds of id hide their main rows.
+    """
+
+    def __init__(self, records=None, deleted=frozenset(), since: float = None):
+        self.records = dict(records or {})
+        self.deleted = frozenset(deleted)
+        # When the oldest change in this delta arrived
+        self.since = since
+        self.hidden = frozenset(self.records) | self.deleted
+        ids = list(self.records)
+        texts = [text for text, _ in self.records.values()]
+        vectors = None
+        if ids and all(vector is not None for _, vector in self.records.values()):
+            vectors = np.asarray([vector for _, vector in self.records.values()], dtype=np.float32)
+        self.store = TextStore(ids, texts, vectors)
+        self.metadata = MetadataIndex(ids, texts)
+        self.lexical = LexicalIndex(ids, texts)
+        self._views = {}
+        self._views_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def empty(self) -> bool:
+        return not self.records and not self.deleted
+
+    def apply(self, changes) -> "DeltaSegment":
+        """
+        A new delta with the changes applied in order: (id, text, vector) upserts
+        a record, and (id, None, None) deletes one.
+        """
+        records = dict(self.records)
+        deleted = set(self.deleted)
+        for id_, text, vector in changes:
+            id_ = int(id_)
+            # Popped first so an upserted record moves to the end, like its line in the corpus file
+            records.pop(id_, None)
+            if text is None:
+                deleted.add(id_)
+            else:
+                records[id_] = (text, vector)
+        return DeltaSegment(records, deleted, self.since or time.time())
+
+    def over(self, main):
+        """
+        This delta layered over a main-segment structure, or main itself when
+        the delta is empty or main can't be layered (the remote index, which
+        receives upserts itself).
+        """
+        if self.empty or main is None:
+            return main
+        with self._views_lock:
+            cached = self._views.get(id(main))
+            if cached is not None and cached[0] is main:
+                return cached[1]
+        if isinstance(main, LocalSearchBackend):
+            view = SegmentedSearchBackend(main, self)
+        elif isinstance(main, MetadataIndex):
+            view = SegmentedMetadataIndex(main, self)
+        elif isinstance(main, LexicalIndex):
+            view = SegmentedLexicalIndex(main, self)
+        elif hasattr(main, "lookup_many"):
+            view = SegmentedStore(main, self)
+        else:
+            return main
+        with self._views_lock:
+            self._views[id(main)] = (main, view)
+        return view
+
+
+class SegmentedStore:
+    """A TextStore or MmapCorpusStore with a delta merged in; same lookup API."""
+
+    def __init__(self, main, delta: DeltaSegment):
+        self.main = main
+        self.delta = delta
+        self._hidden_in_main = sum(1 for id_ in delta.hidden if id_ in main)
+
+    def __len__(self):
+        return len(self.main) - self._hidden_in_main + len(self.delta)
+
+    def __contains__(self, id_):
+        id_ = int(id_)
+        if id_ in self.delta.records:
+            return True
+        return id_ not in self.delta.deleted and id_ in self.main
+
+    def items(self):
+        hidden = self.delta.hidden
+        for id_, text in self.main.items():
+            if id_ not in hidden:
+                yield id_, text
+        yield from self.delta.store.items()
+
+    def get(self, id_, default=None):
+        id_ = int(id_)
+        record = self.delta.records.get(id_)
+        if record is not None:
+            return record[0]
+        if id_ in self.delta.deleted:
+            return default
+        return self.main.get(id_, default)
+
+    def lookup_many(self, ids) -> list:
+        """Return the texts for ids in the order given, skipping ids not in the corpus."""
+        ids = [int(i) for i in ids]
+        hidden = self.delta.hidden
+        if not any(id_ in hidden for id_ in ids):
+            return self.main.lookup_many(ids)
+        found = []
+        for id_ in ids:
+            text = self.get(id_)
+            if text is not None:
+                found.append(text)
+        return found
+
+
+class SegmentedSearchBackend:
+    """
+    A LocalSearchBackend with a delta merged in.
+
+    The main index skips the hidden rows (see LocalSearchBackend.find_neighbors),
+    the delta is searched exactly, and the two result lists are merged by
+    distance. The delta is small, so this adds little to a query.
+    """
+
+    def __init__(self, main: LocalSearchBackend, delta: DeltaSegment):
+        self.main = main
+        self.delta = delta
+        self.excluded = main.rows(list(delta.hidden))
+        self.delta_backend = None
+        if delta.store.vectors is not None:
+            self.delta_backend = LocalSearchBackend(delta.store.ids, delta.store.vectors, main.distance_measure)
+
+    def find_neighbors(self, queries, num_neighbors: int = 10, allowed=None, return_vectors: bool = False):
+        """Same as LocalSearchBackend.find_neighbors; allowed covers the main rows, then the delta rows."""
+        n = len(self.main.ids)
+        if allowed is not None and len(allowed) != n + len(self.delta):
+            raise ValueError("allowed mask does not match the indexed vectors")
+        hits = self.main.find_neighbors(queries, num_neighbors, None if allowed is None else allowed[:n],
+                                        excluded=self.excluded, return_vectors=return_vectors)
+        if self.delta_backend is None:
+            return hits
+        delta_hits = self.delta_backend.find_neighbors(queries, num_neighbors,
+                                                       None if allowed is None else allowed[n:],
+                                                       return_vectors=return_vectors)
+        return [
+            sorted(main + delta, key=lambda neighbor: neighbor.distance, reverse=self.main.largest)[:num_neighbors]
+            for main, delta in zip(hits, delta_hits)
+        ]
+
+
+class SegmentedMetadataIndex(MetadataIndex):
+    """
+    A MetadataIndex with a delta merged in; masks cover the main rows, then the delta rows.
+
+    Inherits remote_restricts, which only needs matching_values.
+    """
+
+    def __init__(self, main: MetadataIndex, delta: DeltaSegment):
+        self.main = main
+        self.delta = delta
+        self.hidden_rows = main.rows(delta.hidden)
+
+    def __len__(self):
+        return len(self.main) + len(self.delta)
+
+    @property
+    def undated(self) -> bool:
+        return self.main.undated or self.delta.metadata.undated
+
+    def values(self, field: str) -> list:
+        return list(dict.fromkeys(self.main.values(field) + self.delta.metadata.values(field)))
+
+    def matching_values(self, field: str, wanted) -> list:
+        return list(dict.fromkeys(
+            self.main.matching_values(field, wanted) + self.delta.metadata.matching_values(field, wanted)
+        ))
+
+    def mask(self, filters: dict):
+        main_mask = self.main.mask(filters)
+        if main_mask is None:
+            return None
+        mask = np.concatenate([main_mask, self.delta.metadata.mask(filters)])
+        mask[self.hidden_rows] = False
+        return mask
+
+    def allows(self, mask, id_) -> bool:
+        id_ = int(id_)
+        if id_ in self.delta.records:
+            return self.delta.metadata.allows(mask[len(self.main):], id_)
+        return id_ not in self.delta.deleted and self.main.allows(mask, id_)
+
+
+class SegmentedLexicalIndex:
+    """
+    A LexicalIndex with a delta merged in.
+
+    Delta documents are scored with the delta's own term statistics until
+    compaction indexes them with the rest, so their scores are approximate.
+    """
+
+    def __init__(self, main: LexicalIndex, delta: DeltaSegment):
+        self.main = main
+        self.delta = delta
+        self.main_live = None
+        hidden_rows = main.rows(delta.hidden)
+        if len(hidden_rows):
+            self.main_live = np.ones(len(main), dtype=bool)
+            self.main_live[hidden_rows] = False
+
+    def __len__(self):
+        return len(self.main) + len(self.delta)
+
+    def search(self, query: str, k: int = 10, allowed=None) -> list:
+        n = len(self.main)
+        main_allowed = None if allowed is None else allowed[:n]
+        if self.main_live is not None:
+            main_allowed = self.main_live if main_allowed is None else main_allowed & self.main_live
+        hits = self.main.search(query, k, main_allowed)
+        hits += self.delta.lexical.search(query, k, None if allowed is None else allowed[n:])
+        return sorted(hits, key=lambda hit: -hit[1])[:k]
+
+    def incident_ids(self, query: str) -> list:
+        hidden = self.delta.hidden
+        found = [id_ for id_ in self.main.incident_ids(query) if id_ not in hidden]
+        return list(dict.fromkeys(found + self.delta.lexical.incident_ids(query)))
+
+    def answers_alone(self, query: str, hits: list, confidence: float = 2.0) -> bool:
+        """Same rule as LexicalIndex.answers_alone, over both segments."""
+        terms = query_terms(query)
+        if not terms or not hits:
+            return False
+        if all(is_incident_id(t) for t in terms):
+            return all(self.incident_ids(t) for t in terms)
+        top = hits[0][0]
+        segment = self.delta.lexical if int(top) in self.delta.records else self.main
+        if not segment.contains_terms(top, terms):
+            return False
+        return len(hits) == 1 or hits[0][1] >= confidence * hits[1][1]
+
+
+class LiveDelta:
+    """
+    The current DeltaSegment of the serving corpus, fed by the lines appended
+    to the corpus file, and its compaction.
+
+    reset(offset, base) is called whenever the main segment is (re)loaded, with
+    the file size it was loaded from and the main segment itself; poll()
+    applies the complete lines appended since, and view is the current
+    (base, DeltaSegment) pair, replaced whole on every change. start() polls on a daemon thread every poll_interval seconds and
+    calls compact() once the delta holds max_records records or its oldest
+    change is compact_after seconds old, so the delta stays small enough that
+    searching it costs next to nothing. compact() must reload the main segment
+    from the file (and so call reset); a compaction that does not is retried
+    after a delay that doubles with each failure in a row. on_change() is
+    called after a poll changed the delta.
+    """
+
+    def __init__(self, path: str, compact=None, on_change=None, max_records: int = 2000,
+                 compact_after: float = 300.0):
+        self.path = path
+        self.compact = compact
+        self.on_change = on_change
+        self.max_records = max_records
+        self.compact_after = compact_after
+        self.segment = DeltaSegment()
+        self.base = None
+        self.view = (None, self.segment)
+        self.offset = None
+        self._inode = None
+        self._replaced = False
+        self._resets = 0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reset(self, offset: int, base=None):
+        """Start over following the file from offset, with base and a delta of what is already past it."""
+        with self._lock:
+            self.segment = DeltaSegment()
+            self.base = base
+            self.offset = offset
+            st = self._stat()
+            self._inode = st.st_ino if st is not None else None
+            self._replaced = False
+            self._resets += 1
+            self._failures = 0
+            self._retry_at = 0.0
+            self._read_changes()
+            self.view = (base, self.segment)
+
+    def _stat(self):
+        try:
+            return os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+    def poll(self) -> int:
+        """Apply the records and deletion markers appended to the file since the last poll; returns how many."""
+        with self._lock:
+            applied = self._read_changes()
+        if applied and self.on_change is not None:
+            self.on_change()
+        return applied
+
+    def caught_up(self):
+        """Poll, then return (view, offset) read together; offset is None if the file was replaced since."""
+        self.poll()
+        with self._lock:
+            return self.view, None if self._replaced else self.offset
+
+    def _read_changes(self) -> int:
+        st = self._stat()
+        if self.offset is None or st is None:
+            return 0
+        if st.st_ino != self._inode:
+            # Replaced (e.g. by a refresh from the bucket): only a reload of the main segment catches up
+            self._replaced = True
+            return 0
+        if st.st_size <= self.offset:
+            return 0
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(st.st_size - self.offset)
+        # A line still being written is picked up by the next poll
+        end = data.rfind(b"\n") + 1
+        changes = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if record.get("deleted"):
+                    changes.append((record["id"], None, None))
+                else:
+                    changes.append((record["id"], record["text"], record.get("embedding")))
+            except (ValueError, KeyError) as e:
+                print(f"Warning: Skipping invalid line in {self.path}: {e}")
+        if changes:
+            self.segment = self.segment.apply(changes)
+            self.view = (self.base, self.segment)
+        self.offset += end
+        return len(changes)
+
+    def compaction_due(self) -> bool:
+        segment = self.segment
+        if self._replaced:
+            return True
+        if segment.empty:
+            return False
+        return len(segment) >= self.max_records or time.time() - segment.since >= self.compact_after
+
+    def start(self, poll_interval: float):
+        """Poll the file and compact when due, every poll_interval seconds on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        def run():
+            while not self._stop.wait(poll_interval):
+                try:
+                    self.poll()
+                    if self.compact is not None and self.compaction_due() and time.time() >= self._retry_at:
+                        self._compact()
+                except Exception as e:
+                    print(f"Warning: Applying live corpus updates from {self.path} failed: {e}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="live-delta", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _compact(self):
+        resets = self._resets
+        try:
+            self.compact()
+        finally:
+            if self._resets == resets:
+                # Failed: a persistent error would otherwise rebuild the corpus on every poll
+                delay = min(COMPACT_MAX_RETRY_DELAY, COMPACT_RETRY_DELAY * 2 ** self._failures)
+                self._failures += 1
+                self._retry_at = time.time() + delay
+                print(f"Warning: Corpus compaction failed; retrying in {delay:.0f}s")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
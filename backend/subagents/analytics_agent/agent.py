@@ -1,7 +1,8 @@
 from dotenv import load_dotenv
 import os
-from google.cloud import bigquery
 from google.adk import Agent
+from ...tracing import TRACING_CALLBACKS
+from .bq_client import run_queries, run_query
 load_dotenv()
 model_name = os.getenv("MODEL", "gemini-2.0-flash")
 
@@ -9,26 +10,50 @@ def execute_bq_query(query: str):
     """
     Executes a SQL query on a Google BigQuery table and returns the results as a list of dictionaries.
 
+    Large results are not returned in full: past the row or size cap, the result is a
+    summary with "truncated": true, the total row count, per-column statistics and the
+    first few rows. Queries estimated to scan more than the byte budget are not run;
+    the result is then a dictionary with "rejected": true, the reason and hints for
+    rewriting the query.
+
     Args:
         query (str): A valid SQL query string to be executed on BigQuery.
 
     Returns:
-        List[dict]: A list of dictionaries, where each dictionary represents a row from the query result.
+        List[dict] | dict: A list of dictionaries, where each dictionary represents a row from
+        the query result, a summary dictionary if the result was too large, or a rejection.
 
     Example:
         result = execute_bq_query("SELECT COUNT(*) FROM `project.dataset.table` WHERE severity = 'Critical'")
     """
     print(query)
-    client = bigquery.Client()
-    query_job = client.query(query)
-    results = query_job.result()
-    print(query)
-    return [dict(row) for row in results]
+    return run_query(query)
+
+
+def execute_bq_queries(queries: list[str]):
+    """
+    Executes several SQL queries on Google BigQuery concurrently and returns all of their results.
+
+    Use this instead of calling execute_bq_query repeatedly when a question needs
+    more than one independent query.
+
+    Args:
+        queries (list[str]): Valid SQL query strings to be executed on BigQuery.
+
+    Returns:
+        List[dict]: One entry per query, in the same order, with the query and either
+        its "rows" (a list of dictionaries, or a summary if too large), an "error" message,
+        or "rejected": true with the reason and hints if it would scan too much data.
+    """
+    for query in queries:
+        print(query)
+    return run_queries(queries)
 
 
 instruction = """
-You are a data agent with access to the following tool:
+You are a data agent with access to the following tools:
 1. execute_bq_query: Use this tool to execute a SQL query on the table `vodaf-aida25lcpm-206.network_data.network_data` and return the result.
+2. execute_bq_queries: Use this tool to execute several independent SQL queries at once when a question needs more than one query.
 
 Table schema and sample data:
 - incident_id (STRING): Unique identifier for the incident. Example: 'INC-1000'
@@ -43,7 +68,11 @@ Your workflow:
 - Read the user's question.
 - Write a valid SQL query that answers the question using the table `vodaf-aida25lcpm-206.network_data.network_data` and the columns described above.
 - Whenever you have a SQL query to execute, always call the `execute_bq_query` tool and pass the SQL query as its argument.
+- If the question has several independent parts, write one query per part and run them together with `execute_bq_queries`.
 - Take the output from `execute_bq_query` and formulate a clear, concise answer to the user's question.
+- If the output is a summary with "truncated": true, answer from its totals and column statistics, or rewrite the query to aggregate instead of listing rows.
+- If the output has "rejected": true, the query would have scanned too much data and was not run. Rewrite it following the "hints" (select only the needed columns, filter on `timestamp`, avoid cross joins) and try again.
+- Prefer aggregated queries (COUNT, GROUP BY) over selecting raw rows, and never use an unbounded `SELECT *`.
 - Do not answer the question directly without first executing the relevant SQL query.
 """
 
@@ -55,6 +84,9 @@ ANALYTICS_AGENT = Agent(
     description="Agent that writes SQL queries from user questions and executes them on BigQuery.",
     instruction=instruction,
     tools=[
-        execute_bq_query
-    ]
+        execute_bq_query,
+        execute_bq_queries
+    ],
+    # Per-stage latency spans for model calls and tool calls (see tracing.py)
+    **TRACING_CALLBACKS
 )
@@ -0,0 +1,303 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from ...tracing import span
+from .local_sql import ANALYTICS_LOCAL_FALLBACK, is_engine_error
+from .query_guard import check_query, log_query
+from .rollups import ANALYTICS_ROLLUPS
+from .result_summary import ResultSummary
+
+load_dotenv()
+
+# "bigquery" runs statements on BigQuery; "local" runs them on a DuckDB/SQLite snapshot (see local_sql.py)
+ANALYTICS_BACKEND = os.getenv("ANALYTICS_BACKEND", "bigquery").lower()
+
+# Connections kept open to the BigQuery API, shared by every query in the process
+BQ_HTTP_POOL_SIZE = int(os.getenv("BQ_HTTP_POOL_SIZE", "16"))
+# Most statements execute_bq_queries runs at the same time
+BQ_MAX_CONCURRENT_QUERIES = int(os.getenv("BQ_MAX_CONCURRENT_QUERIES", "8"))
+
+# Caps on what a query hands back to the model; past them it gets a summary instead of rows
+BQ_MAX_ROWS = int(os.getenv("BQ_MAX_ROWS", "500"))
+BQ_MAX_RESULT_BYTES = int(os.getenv("BQ_MAX_RESULT_BYTES", "200000"))
+BQ_PAGE_SIZE = int(os.getenv("BQ_PAGE_SIZE", "1000"))
+# Rows included in a summary, and rows scanned to compute its column statistics
+BQ_SUMMARY_SAMPLE_ROWS = int(os.getenv("BQ_SUMMARY_SAMPLE_ROWS", "20"))
+BQ_SUMMARY_SCAN_ROWS = int(os.getenv("BQ_SUMMARY_SCAN_ROWS", "100000"))
+
+_client = None
+_client_lock = threading.Lock()
+_local_backend = None
+_rollup = None
+
+
+def _create_client():
+    """Create a BigQuery client whose HTTP session keeps a pool of connections alive."""
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import bigquery
+    from requests.adapters import HTTPAdapter
+
+    credentials, project = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+    session = AuthorizedSession(credentials)
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=BQ_HTTP_POOL_SIZE))
+    return bigquery.Client(project=project, credentials=credentials, _http=session)
+
+
+def get_bq_client():
+    """
+    The process-wide BigQuery client, created on first use.
+
+    Credential discovery, HTTP session setup and TLS handshakes happen once
+    instead of for every statement.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def set_bq_client(client):
+    """Replace the shared client, e.g. with a local stub for benchmarks or offline runs."""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def get_local_backend():
+    """The process-wide local SQL backend, created on first use; starts periodic snapshot syncs if configured."""
+    global _local_backend
+    if _local_backend is None:
+        with _client_lock:
+            if _local_backend is None:
+                from .local_sql import ANALYTICS_SNAPSHOT_SYNC_INTERVAL, LocalSQLBackend
+
+                backend = LocalSQLBackend()
+                if ANALYTICS_SNAPSHOT_SYNC_INTERVAL > 0:
+                    backend.start_sync(get_bq_client, ANALYTICS_SNAPSHOT_SYNC_INTERVAL)
+                _local_backend = backend
+    return _local_backend
+
+
+def set_local_backend(backend):
+    """Replace the shared local backend, e.g. with one over a test snapshot."""
+    global _local_backend
+    with _client_lock:
+        _local_backend = backend
+
+
+def get_rollup():
+    """The process-wide incident rollup; built and kept up to date on a background thread once first used."""
+    global _rollup
+    if _rollup is None:
+        with _client_lock:
+            if _rollup is None:
+                from .rollups import ANALYTICS_ROLLUP_REFRESH_INTERVAL, IncidentRollup
+
+                rollup = IncidentRollup()
+                rollup.start(ANALYTICS_ROLLUP_REFRESH_INTERVAL)
+                _rollup = rollup
+    return _rollup
+
+
+def set_rollup(rollup):
+    """Replace the shared rollup (None builds a new one on next use)."""
+    global _rollup
+    with _client_lock:
+        _rollup = rollup
+
+
+def iter_query_rows(query: str):
+    """
+    Every row of a statement on the configured backend, uncapped.
+
+    On BigQuery the statement still goes through check_query first; one that
+    would scan more than BQ_MAX_BYTES_SCANNED raises RuntimeError instead of
+    running.
+    """
+    if ANALYTICS_BACKEND == "local":
+        rows = get_local_backend().query(query, page_size=BQ_PAGE_SIZE)
+    else:
+        client = get_bq_client()
+        start = time.perf_counter()
+        estimated, rejection = check_query(client, query)
+        if rejection is not None:
+            log_query(query, "rejected", estimated_bytes=estimated, seconds=time.perf_counter() - start)
+            raise RuntimeError(rejection["reason"])
+        rows = client.query(query).result(page_size=BQ_PAGE_SIZE)
+    for row in rows:
+        yield dict(row)
+
+
+def _row_size(row: dict) -> int:
+    return len(json.dumps(row, default=str))
+
+
+def _summarize_arrow(row_iterator, reason: str) -> dict:
+    """Summarize a large result from Arrow record batches, column by column."""
+    summary = ResultSummary()
+    sample = []
+    for batch in row_iterator.to_arrow_iterable():
+        if len(sample) < BQ_SUMMARY_SAMPLE_ROWS:
+            sample.extend(batch.slice(0, BQ_SUMMARY_SAMPLE_ROWS - len(sample)).to_pylist())
+        summary.add_batch(batch)
+        if summary.rows_scanned >= BQ_SUMMARY_SCAN_ROWS:
+            break
+    return summary.to_dict(row_iterator.total_rows, sample, reason)
+
+
+def fetch_results(row_iterator, max_rows: int = None, max_bytes: int = None):
+    """
+    Read a query result page by page without holding more than the caps in memory.
+
+    Returns the rows as dictionaries when the result fits in max_rows and
+    max_bytes. Otherwise returns a summary: total row count, statistics for
+    each column (over at most BQ_SUMMARY_SCAN_ROWS rows) and the first
+    BQ_SUMMARY_SAMPLE_ROWS rows. Results known up front to exceed the row
+    cap are summarized from Arrow record batches when pyarrow is installed.
+    """
+    max_rows = BQ_MAX_ROWS if max_rows is None else max_rows
+    max_bytes = BQ_MAX_RESULT_BYTES if max_bytes is None else max_bytes
+    total_rows = getattr(row_iterator, "total_rows", None)
+
+    if total_rows is not None and total_rows > max_rows:
+        reason = f"{total_rows} rows exceed the {max_rows}-row cap"
+        try:
+            import pyarrow  # noqa: F401
+
+            return _summarize_arrow(row_iterator, reason)
+        except ImportError:
+            pass
+
+    rows = []
+    size = 0
+    summary = None
+    reason = None
+    for row in row_iterator:
+        row = dict(row)
+        if summary is None:
+            size += _row_size(row)
+            if len(rows) < max_rows and size <= max_bytes:
+                rows.append(row)
+                continue
+            reason = f"more than {max_rows} rows" if len(rows) >= max_rows else f"more than {max_bytes} bytes"
+            # Over a cap: switch to summarizing, starting with the rows kept so far
+            summary = ResultSummary()
+            for kept in rows:
+                summary.add_row(kept)
+            del rows[BQ_SUMMARY_SAMPLE_ROWS:]
+        summary.add_row(row)
+        if summary.rows_scanned >= BQ_SUMMARY_SCAN_ROWS:
+            break
+    if summary is None:
+        return rows
+    return summary.to_dict(total_rows if total_rows is not None else summary.rows_scanned, rows, reason)
+
+
+def _run_local_query(query: str):
+    start = time.perf_counter()
+    try:
+        with span("analytics.local") as stage:
+            results = fetch_results(get_local_backend().query(query, page_size=BQ_PAGE_SIZE))
+            rows = len(results) if isinstance(results, list) else results["total_rows"]
+            stage.set(rows=rows, truncated=not isinstance(results, list))
+    except Exception as e:
+        log_query(query, "failed", seconds=time.perf_counter() - start, error=str(e), engine="local")
+        raise
+    log_query(query, "ok", rows=rows, seconds=time.perf_counter() - start, engine="local")
+    return results
+
+
+def run_query(query: str):
+    """
+    Run one statement on the configured backend; returns its rows, or a summary if over the caps.
+
+    On BigQuery the statement is dry-run first. If its estimated scan is over
+    BQ_MAX_BYTES_SCANNED it is not run, and the rejection from check_query is
+    returned instead so the caller can rewrite it. With ANALYTICS_BACKEND=local
+    it runs on the local snapshot, where there is no scan cost to guard; with
+    ANALYTICS_LOCAL_FALLBACK=1, a statement the local engine rejects goes to
+    BigQuery. Counts the incident rollup can answer exactly are served from it
+    instead.
+    """
+    if ANALYTICS_ROLLUPS:
+        start = time.perf_counter()
+        with span("analytics.rollup") as stage:
+            rows = get_rollup().answer_sql(query)
+            stage.set(answered=rows is not None, rows=None if rows is None else len(rows))
+        if rows is not None:
+            log_query(query, "ok", rows=len(rows), seconds=time.perf_counter() - start, engine="rollup")
+            return rows
+    if ANALYTICS_BACKEND == "local":
+        try:
+            return _run_local_query(query)
+        except Exception as e:
+            if not (ANALYTICS_LOCAL_FALLBACK and is_engine_error(e)):
+                raise
+            print(f"Warning: local SQL could not run the statement ({e}); running it on BigQuery")
+    client = get_bq_client()
+    start = time.perf_counter()
+    estimated = None
+    try:
+        with span("bigquery.dry_run") as stage:
+            estimated, rejection = check_query(client, query)
+            stage.set(estimated_bytes=estimated, rejected=rejection is not None)
+        if rejection is not None:
+            log_query(query, "rejected", estimated_bytes=estimated, seconds=time.perf_counter() - start)
+            return rejection
+        with span("bigquery.query") as stage:
+            job = client.query(query)
+            results = fetch_results(job.result(page_size=BQ_PAGE_SIZE))
+            stage.set(
+                bytes_processed=getattr(job, "total_bytes_processed", None),
+                cache_hit=getattr(job, "cache_hit", None),
+                rows=len(results) if isinstance(results, list) else results["total_rows"],
+                truncated=not isinstance(results, list),
+            )
+    except Exception as e:
+        log_query(query, "failed", estimated_bytes=estimated, seconds=time.perf_counter() - start, error=str(e))
+        raise
+    log_query(
+        query,
+        "ok",
+        estimated_bytes=estimated,
+        processed_bytes=getattr(job, "total_bytes_processed", None),
+        billed_bytes=getattr(job, "total_bytes_billed", None),
+        cache_hit=getattr(job, "cache_hit", None),
+        rows=len(results) if isinstance(results, list) else results["total_rows"],
+        seconds=time.perf_counter() - start,
+    )
+    return results
+
+
+def run_queries(queries) -> list:
+    """
+    Run several statements concurrently and wait for all of them.
+
+    Returns one entry per statement, in order: {"query", "rows"} on success,
+    {"query", "error"} on failure, or the query plus the rejection fields when
+    the scan guard refused it, so one bad statement doesn't lose the others.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+
+    def run(query):
+        try:
+            result = run_query(query)
+            if isinstance(result, dict) and result.get("rejected"):
+                return {"query": query, **result}
+            return {"query": query, "rows": result}
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            return {"query": query, "error": str(e)}
+
+    workers = max(1, min(len(queries), BQ_MAX_CONCURRENT_QUERIES))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bq-query") as pool:
+        return list(pool.map(run, queries))
@@ -0,0 +1,424 @@
+"""
+Local SQL engine over a snapshot of the BigQuery incident table.
+
+The snapshot is a Parquet file (queried with DuckDB) or a SQLite database,
+synced from BigQuery or from an exported file:
+
+    python -m backend.subagents.analytics_agent.local_sql sync network_data.parquet
+    python -m backend.subagents.analytics_agent.local_sql sync network_data.sqlite --from export.csv
+
+Statements written for BigQuery run unchanged for the forms the analytics
+agent writes; translate_query rewrites them for the local engine:
+
+- `project.dataset.table` and dataset.table become the local table name,
+  other backticked names become "quoted" identifiers
+- SAFE_CAST, CAST to DATE / DATETIME / TIMESTAMP, typed literals
+  (DATE '...', TIMESTAMP '...'), CURRENT_DATE() and CURRENT_TIMESTAMP()
+- DATE_TRUNC / TIMESTAMP_TRUNC / DATETIME_TRUNC to DAY, WEEK, WEEK(<weekday>),
+  ISOWEEK, MONTH, QUARTER, YEAR (and HOUR / MINUTE for timestamps)
+- EXTRACT of YEAR, QUARTER, MONTH, WEEK, DAY, DAYOFWEEK (1 = Sunday, as in
+  BigQuery), DAYOFYEAR, HOUR, MINUTE, SECOND and DATE
+- FORMAT_TIMESTAMP / FORMAT_DATE / FORMAT_DATETIME with strftime-style
+  formats (time zone arguments are ignored; SQLite lacks names of days and
+  months)
+
+Anything else is passed through as written. With ANALYTICS_LOCAL_FALLBACK=1 a
+statement the local engine rejects is run on BigQuery instead.
+"""
+import argparse
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# The BigQuery table the snapshot mirrors
+ANALYTICS_BQ_TABLE = os.getenv("ANALYTICS_BQ_TABLE", "vodaf-aida25lcpm-206.network_data.network_data")
+# Snapshot file: .parquet is queried with DuckDB, .sqlite / .db with SQLite
+ANALYTICS_SNAPSHOT = os.getenv("ANALYTICS_SNAPSHOT", "network_data.parquet")
+# Seconds between re-syncs of the snapshot from BigQuery (0 = never; sync with the CLI instead)
+ANALYTICS_SNAPSHOT_SYNC_INTERVAL = float(os.getenv("ANALYTICS_SNAPSHOT_SYNC_INTERVAL", "0"))
+
+# Set to 1 to run statements the local engine rejects on BigQuery (needs BigQuery access)
+ANALYTICS_LOCAL_FALLBACK = os.getenv("ANALYTICS_LOCAL_FALLBACK", "0") == "1"
+
+_QUALIFIED_NAME = re.compile(r"`([\w-]+(?:\.[\w-]+)+)`|`[\w-]+`(?:\.`[\w-]+`)+")
+_BACKTICKED = re.compile(r"`([^`.]+)`")
+_SAFE_CAST = re.compile(r"\bSAFE_CAST\s*\(", re.IGNORECASE)
+_TYPED_LITERAL = re.compile(r"\b(?:DATE|DATETIME|TIMESTAMP)\s+('(?:[^'\\]|\\.)*')", re.IGNORECASE)
+_CURRENT = re.compile(r"\bCURRENT_(DATE|DATETIME|TIMESTAMP)\s*\(\s*\)", re.IGNORECASE)
+_CALL = re.compile(r"\b(DATE_TRUNC|TIMESTAMP_TRUNC|DATETIME_TRUNC|EXTRACT|FORMAT_TIMESTAMP|FORMAT_DATE|FORMAT_DATETIME"
+                   r"|SAFE_CAST|CAST)\s*\(", re.IGNORECASE)
+_CAST_ARGS = re.compile(r"^\s*(.+?)\s+AS\s+(DATE|DATETIME|TIMESTAMP)\s*$", re.IGNORECASE | re.DOTALL)
+_TRUNC_PART = re.compile(r"^(\w+)(?:\s*\(\s*(\w+)\s*\))?$")
+_EXTRACT_ARGS = re.compile(r"^\s*(\w+)\s+FROM\s+(.+)$", re.IGNORECASE | re.DOTALL)
+_WEEKDAYS = ("SUNDAY", "MONDAY", "TUESDAY", "WEDNESDAY", "THURSDAY", "FRIDAY", "SATURDAY")
+# EXTRACT parts as SQLite strftime formats
+_SQLITE_EXTRACT = {"YEAR": "%Y", "MONTH": "%m", "DAY": "%d", "HOUR": "%H", "MINUTE": "%M", "SECOND": "%S",
+                   "DAYOFYEAR": "%j"}
+
+
+def local_table_name(table: str = ANALYTICS_BQ_TABLE) -> str:
+    return table.split(".")[-1]
+
+
+def _call_arguments(query: str, start: int):
+    """Top-level arguments of the call whose "(" is at start, and the index just past its ")"."""
+    args, depth, quote, current = [], 0, None, start + 1
+    for i in range(start + 1, len(query)):
+        ch = query[i]
+        if quote is not None:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"`":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            if depth == 0:
+                args.append(query[current:i])
+                return args, i + 1
+            depth -= 1
+        elif ch == "," and depth == 0:
+            args.append(query[current:i])
+            current = i + 1
+    return None, len(query)
+
+
+def _truncate(expr: str, part: str, function: str, duckdb: bool):
+    """DATE_TRUNC / TIMESTAMP_TRUNC / DATETIME_TRUNC of expr to part, or None if not supported."""
+    match = _TRUNC_PART.match(part.strip().upper())
+    if match is None:
+        return None
+    unit, weekday = match.groups()
+    as_date = function == "DATE_TRUNC"
+    if unit in ("WEEK", "ISOWEEK"):
+        weekday = weekday or ("MONDAY" if unit == "ISOWEEK" else "SUNDAY")
+        if weekday not in _WEEKDAYS:
+            return None
+        first = _WEEKDAYS.index(weekday)
+        if duckdb:
+            # DuckDB weeks start on Monday; shift the value so they start on the requested day
+            shift = (1 - first) % 7
+            truncated = f"date_trunc('week', ({expr}) + INTERVAL {shift} DAY) - INTERVAL {shift} DAY"
+        else:
+            offset = f"'-' || ((CAST(strftime('%w', {expr}) AS INTEGER) + {7 - first}) % 7) || ' days'"
+            return f"date({expr}, {offset})" if as_date else f"datetime({expr}, 'start of day', {offset})"
+    elif unit in ("DAY", "MONTH", "QUARTER", "YEAR") or (unit in ("HOUR", "MINUTE") and not as_date):
+        if duckdb:
+            truncated = f"date_trunc('{unit.lower()}', {expr})"
+        elif unit in ("HOUR", "MINUTE"):
+            return f"strftime('%Y-%m-%d %H:{'00' if unit == 'HOUR' else '%M'}:00', {expr})"
+        else:
+            modifiers = {
+                "DAY": "'start of day'",
+                "MONTH": "'start of month'",
+                "QUARTER": f"'start of month', '-' || ((CAST(strftime('%m', {expr}) AS INTEGER) - 1) % 3) || ' months'",
+                "YEAR": "'start of year'",
+            }[unit]
+            return f"{'date' if as_date else 'datetime'}({expr}, {modifiers})"
+    else:
+        return None
+    return f"CAST({truncated} AS DATE)" if as_date else truncated
+
+
+def _extract(part: str, expr: str, duckdb: bool):
+    """EXTRACT(part FROM expr) with BigQuery's numbering, or None to leave it as written."""
+    part = part.upper()
+    if part == "DATE":
+        return f"CAST({expr} AS DATE)" if duckdb else f"date({expr})"
+    if duckdb:
+        # DuckDB numbers days of the week from 0 = Sunday and its WEEK is the ISO week
+        if part == "DAYOFWEEK":
+            return f"(EXTRACT(DOW FROM {expr}) + 1)"
+        if part == "WEEK":
+            return f"CAST(strftime({expr}, '%U') AS INTEGER)"
+        if part == "ISOWEEK":
+            return f"EXTRACT(WEEK FROM {expr})"
+        return None
+    if part == "DAYOFWEEK":
+        return f"(CAST(strftime('%w', {expr}) AS INTEGER) + 1)"
+    if part == "QUARTER":
+        return f"((CAST(strftime('%m', {expr}) AS INTEGER) + 2) / 3)"
+    if part == "WEEK":
+        # Weeks starting on Sunday, the first one numbered 1 (%U, which older SQLite lacks)
+        return f"((CAST(strftime('%j', {expr}) AS INTEGER) + 6 - CAST(strftime('%w', {expr}) AS INTEGER)) / 7)"
+    if part in _SQLITE_EXTRACT:
+        return f"CAST(strftime('{_SQLITE_EXTRACT[part]}', {expr}) AS INTEGER)"
+    return None
+
+
+def _format(args: list, duckdb: bool):
+    """FORMAT_TIMESTAMP / FORMAT_DATE / FORMAT_DATETIME(format, value[, time zone])."""
+    if len(args) not in (2, 3):
+        return None
+    fmt = args[0].strip().replace("%F", "%Y-%m-%d").replace("%T", "%H:%M:%S")
+    expr = args[1].strip()
+    return f"strftime({expr}, {fmt})" if duckdb else f"strftime({fmt}, {expr})"
+
+
+def _translate_calls(query: str, duckdb: bool) -> str:
+    """Rewrite the date functions translate_query supports, innermost arguments first."""
+    out, position = [], 0
+    while True:
+        match = _CALL.search(query, position)
+        if match is None:
+            out.append(query[position:])
+            return "".join(out)
+        args, end = _call_arguments(query, match.end() - 1)
+        if args is None:
+            out.append(query[position:])
+            return "".join(out)
+        args = [_translate_calls(arg, duckdb) for arg in args]
+        function = match.group(1).upper()
+        replacement = None
+        if function == "EXTRACT":
+            parts = _EXTRACT_ARGS.match(args[0]) if len(args) == 1 else None
+            if parts is not None:
+                replacement = _extract(parts.group(1), parts.group(2).strip(), duckdb)
+        elif function.endswith("CAST"):
+            # SQLite would cast '2024-06-01' AS DATE to the number 2024
+            parts = _CAST_ARGS.match(args[0]) if len(args) == 1 and not duckdb else None
+            if parts is not None:
+                replacement = f"{'date' if parts.group(2).upper() == 'DATE' else 'datetime'}({parts.group(1)})"
+        elif function.endswith("_TRUNC"):
+            if len(args) == 2:
+                replacement = _truncate(args[0].strip(), args[1], function, duckdb)
+        else:
+            replacement = _format(args, duckdb)
+        if replacement is None:
+            replacement = f"{match.group(1)}({','.join(args)})"
+        out.append(query[position:match.start()])
+        out.append(replacement)
+        position = end
+
+
+def translate_query(query: str, table: str = ANALYTICS_BQ_TABLE, duckdb: bool = True) -> str:
+    """
+    Rewrite a BigQuery statement for the local engine (DuckDB, or SQLite when
+    duckdb is False). The forms translated are listed in the module docstring.
+    """
+    def local_name(match):
+        name = match.group(1) or match.group(0).replace("`", "")
+        return local_table_name(name)
+
+    query = _QUALIFIED_NAME.sub(local_name, query)
+    dataset_table = ".".join(table.split(".")[-2:])
+    query = re.sub(rf"\b{re.escape(dataset_table)}\b", local_table_name(table), query)
+    query = _BACKTICKED.sub(r'"\1"', query)
+    query = _translate_calls(query, duckdb)
+    if duckdb:
+        query = _SAFE_CAST.sub("TRY_CAST(", query)
+        return _CURRENT.sub(lambda m: f"CURRENT_{'DATE' if m.group(1).upper() == 'DATE' else 'TIMESTAMP'}", query)
+    # SQLite casts never fail, and compares dates and timestamps as ISO text
+    query = _SAFE_CAST.sub("CAST(", query)
+    query = _TYPED_LITERAL.sub(r"\1", query)
+    return _CURRENT.sub(lambda m: "date('now')" if m.group(1).upper() == "DATE" else "datetime('now')", query)
+
+
+def is_engine_error(error: Exception) -> bool:
+    """Whether error is the local engine rejecting or failing a statement (not a missing snapshot)."""
+    if isinstance(error, sqlite3.Error):
+        return True
+    try:
+        import duckdb
+    except ImportError:
+        return False
+    return isinstance(error, duckdb.Error)
+
+
+class LocalRowIterator:
+    """Rows of a local query as dictionaries, fetched from the cursor one page at a time."""
+
+    # Not known until the rows have been read, so fetch_results streams and counts them
+    total_rows = None
+
+    def __init__(self, cursor, page_size: int = 1000):
+        self._cursor = cursor
+        self._page_size = page_size
+
+    def __iter__(self):
+        try:
+            columns = [d[0] for d in self._cursor.description or ()]
+            while True:
+                page = self._cursor.fetchmany(self._page_size)
+                if not page:
+                    break
+                for row in page:
+                    yield dict(zip(columns, row))
+        finally:
+            self._cursor.close()
+
+
+class _DuckDBEngine:
+    """The Parquet snapshot loaded into an in-memory DuckDB table."""
+
+    duckdb = True
+
+    def __init__(self, path: str, table: str):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("The local analytics backend needs duckdb for Parquet snapshots "
+                              "(pip install duckdb), or use a .sqlite snapshot") from e
+        self._con = duckdb.connect(":memory:")
+        escaped = path.replace("'", "''")
+        self._con.execute(f'CREATE TABLE "{table}" AS SELECT * FROM read_parquet(\'{escaped}\')')
+
+    def cursor(self):
+        # Each cursor is an independent connection to the same database, safe to use from its own thread
+        return self._con.cursor()
+
+
+class _SQLiteEngine:
+    """A read-only SQLite snapshot; one connection per query, since connections are cheap."""
+
+    duckdb = False
+
+    def __init__(self, path: str, table: str):
+        self._uri = f"file:{path}?mode=ro"
+        con = self._connect()
+        try:
+            con.execute(f'SELECT 1 FROM "{table}" LIMIT 1')
+        finally:
+            con.close()
+
+    def _connect(self):
+        return sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+
+    def cursor(self):
+        return self._connect().cursor()
+
+
+class LocalSQLBackend:
+    """
+    Runs BigQuery statements against a local snapshot of the incident table.
+
+    The snapshot is reloaded on the next query after its file changes on disk
+    (e.g. after a sync), so a long-running process picks up new data without
+    a restart.
+    """
+
+    def __init__(self, path: str = None, table: str = ANALYTICS_BQ_TABLE):
+        self.path = path or ANALYTICS_SNAPSHOT
+        self.table = table
+        self._engine = None
+        self._version = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _file_version(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Analytics snapshot {self.path} not found. Create it with: "
+                f"python -m backend.subagents.analytics_agent.local_sql sync {self.path}"
+            ) from None
+        return st.st_mtime_ns, st.st_size
+
+    def _open(self):
+        version = self._file_version()
+        if self._engine is not None and version == self._version:
+            return self._engine
+        with self._lock:
+            if self._engine is None or version != self._version:
+                engine_class = _DuckDBEngine if self.path.endswith(".parquet") else _SQLiteEngine
+                engine = engine_class(self.path, local_table_name(self.table))
+                if self._engine is not None:
+                    print(f"Reloaded analytics snapshot {self.path}")
+                # Queries still reading the old engine keep it alive until they finish
+                self._engine, self._version = engine, version
+        return self._engine
+
+    def query(self, query: str, page_size: int = 1000) -> LocalRowIterator:
+        engine = self._open()
+        cursor = engine.cursor()
+        cursor.execute(translate_query(query, self.table, duckdb=engine.duckdb))
+        return LocalRowIterator(cursor, page_size)
+
+    def start_sync(self, client_factory, interval: float):
+        """Re-sync the snapshot from BigQuery every interval seconds on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    sync_snapshot(self.path, client=client_factory(), table=self.table)
+                except Exception as e:
+                    print(f"Warning: Analytics snapshot sync from {self.table} failed: {e}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="analytics-snapshot-sync", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+
+def _read_export(source: str):
+    import pandas as pd
+
+    if source.endswith(".parquet"):
+        return pd.read_parquet(source)
+    if source.endswith(".csv"):
+        return pd.read_csv(source)
+    return pd.read_json(source, lines=source.endswith(".jsonl"))
+
+
+def sync_snapshot(dest: str, source: str = None, client=None, table: str = ANALYTICS_BQ_TABLE) -> int:
+    """
+    Write a snapshot of the table to dest (.parquet or .sqlite) and return its row count.
+
+    Rows come from the exported file source when given, otherwise from BigQuery
+    through client. The file is written next to dest and swapped in with
+    os.replace, so running queries never see a partial snapshot.
+    """
+    if source is not None:
+        df = _read_export(source)
+    else:
+        if client is None:
+            from .bq_client import get_bq_client
+
+            client = get_bq_client()
+        df = client.query(f"SELECT * FROM `{table}`").result().to_dataframe()
+
+    directory = os.path.dirname(os.path.abspath(dest))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-", suffix=os.path.splitext(dest)[1])
+    os.close(fd)
+    try:
+        if dest.endswith(".parquet"):
+            df.to_parquet(tmp_path, index=False)
+        else:
+            with sqlite3.connect(tmp_path) as con:
+                df.to_sql(local_table_name(table), con, index=False, if_exists="replace")
+        os.replace(tmp_path, dest)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    print(f"Synced {len(df)} rows of {table} to {dest}")
+    return len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    sync = commands.add_parser("sync", help="write a snapshot of the table")
+    sync.add_argument("dest", nargs="?", default=ANALYTICS_SNAPSHOT, help=".parquet or .sqlite file")
+    sync.add_argument("--from", dest="source", help="exported .csv/.json/.jsonl/.parquet file instead of BigQuery")
+    sync.add_argument("--table", default=ANALYTICS_BQ_TABLE)
+    args = parser.parse_args()
+    sync_snapshot(args.dest, source=args.source, table=args.table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import json
+import os
+import re
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Most bytes a single statement may scan, checked with a dry run before it runs (0 disables the check)
+BQ_MAX_BYTES_SCANNED = int(os.getenv("BQ_MAX_BYTES_SCANNED", str(1024 ** 3)))
+# Set to 0 to skip the dry run entirely
+BQ_DRY_RUN = os.getenv("BQ_DRY_RUN", "1") != "0"
+# Optional JSONL file receiving one record per statement (shape, bytes, latency, outcome)
+BQ_QUERY_LOG = os.getenv("BQ_QUERY_LOG", "")
+
+_log_lock = threading.Lock()
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+_SELECT_STAR = re.compile(r"\bselect\s+(?:distinct\s+)?(?:\w+\.)?\*", re.IGNORECASE)
+_CROSS_JOIN = re.compile(r"\bcross\s+join\b", re.IGNORECASE)
+_COMMA_JOIN = re.compile(r"\bfrom\s+`[^`]+`(?:\s+(?:as\s+)?\w+)?\s*,\s*`", re.IGNORECASE)
+_TIMESTAMP_FILTER = re.compile(r"\b(?:where|and|or)\b[^;]*\btimestamp\b", re.IGNORECASE)
+_AGGREGATE = re.compile(r"\b(?:count|sum|avg|min|max|group\s+by)\b", re.IGNORECASE)
+_LIMIT = re.compile(r"\blimit\s+\d+", re.IGNORECASE)
+
+
+def query_shape(query: str) -> str:
+    """The statement with literals replaced by ? and whitespace collapsed, so similar questions group together."""
+    shape = _STRING_LITERAL.sub("?", query)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+def lint_query(query: str) -> list:
+    """Patterns in a statement that usually make it scan more than it needs to."""
+    hints = []
+    if _SELECT_STAR.search(query):
+        hints.append("Avoid SELECT *: BigQuery bills every column read, so select only the columns you need.")
+    if _CROSS_JOIN.search(query) or _COMMA_JOIN.search(query):
+        hints.append("Avoid cross joins: join on a key or aggregate each side first.")
+    if not _TIMESTAMP_FILTER.search(query):
+        hints.append("Add a WHERE filter on `timestamp` to restrict the time range scanned.")
+    if not _AGGREGATE.search(query) and not _LIMIT.search(query):
+        hints.append("Aggregate with COUNT / GROUP BY, or add a LIMIT, instead of listing raw rows.")
+    return hints
+
+
+def estimate_bytes(client, query: str) -> int:
+    """Bytes the statement would process, from a BigQuery dry run (no cost, no result cache)."""
+    from google.cloud import bigquery
+
+    config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    job = client.query(query, job_config=config)
+    return job.total_bytes_processed or 0
+
+
+def check_query(client, query: str, max_bytes: int = None):
+    """
+    Dry-run a statement and compare its estimated scan against the budget.
+
+    Returns (estimated_bytes, rejection). rejection is None when the statement
+    may run, otherwise a dictionary with "rejected": true, the reason, the
+    estimate and the budget, and hints for rewriting the statement.
+    """
+    max_bytes = BQ_MAX_BYTES_SCANNED if max_bytes is None else max_bytes
+    if not BQ_DRY_RUN:
+        return None, None
+    estimated = estimate_bytes(client, query)
+    if max_bytes <= 0 or estimated <= max_bytes:
+        return estimated, None
+    rejection = {
+        "rejected": True,
+        "reason": f"The query would scan {format_bytes(estimated)}, over the {format_bytes(max_bytes)} budget.",
+        "estimated_bytes": estimated,
+        "max_bytes": max_bytes,
+        "hints": lint_query(query) or ["Select fewer columns or filter the rows scanned more tightly."],
+        "note": "The query was not run. Rewrite it to scan less data and try again.",
+    }
+    return estimated, rejection
+
+
+def format_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def log_query(query: str, outcome: str, estimated_bytes=None, processed_bytes=None, billed_bytes=None,
+              cache_hit=None, rows=None, seconds: float = 0.0, error: str = None, engine: str = "bigquery"):
+    """Print one line per statement and append a record to BQ_QUERY_LOG when it is set."""
+    if engine == "bigquery":
+        estimated = "-" if estimated_bytes is None else format_bytes(estimated_bytes)
+        processed = "-" if processed_bytes is None else format_bytes(processed_bytes)
+        print(f"BigQuery {outcome}: estimated {estimated}, processed {processed}, {seconds:.2f}s")
+    elif engine == "rollup":
+        print(f"Rollup {outcome}: {rows} rows, {seconds * 1e6:.0f}us")
+    else:
+        print(f"Local SQL {outcome}: {rows if rows is not None else '-'} rows, {seconds:.3f}s")
+    if not BQ_QUERY_LOG:
+        return
+    record = {
+        "time": time.time(),
+        "engine": engine,
+        "outcome": outcome,
+        "shape": query_shape(query),
+        "query": query,
+        "estimated_bytes": estimated_bytes,
+        "processed_bytes": processed_bytes,
+        "billed_bytes": billed_bytes,
+        "cache_hit": cache_hit,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "error": error,
+    }
+    try:
+        with _log_lock, open(BQ_QUERY_LOG, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Warning: could not write BigQuery query log: {e}")
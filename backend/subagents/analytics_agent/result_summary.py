@@ -0,0 +1,125 @@
+from collections import Counter
+from numbers import Number
+
+# Distinct values tracked per column for top_values before counting stops
+MAX_TRACKED_VALUES = 1000
+TOP_VALUES = 5
+
+
+class ColumnStats:
+    """Streaming statistics for one result column: count, nulls, min/max, mean and top values."""
+
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self.numeric = True
+        self.values = Counter()
+        self.values_complete = True
+
+    def _update_range(self, low, high):
+        try:
+            if self.min is None or low < self.min:
+                self.min = low
+            if self.max is None or high > self.max:
+                self.max = high
+        except TypeError:
+            # Mixed types in one column; keep the first range seen
+            pass
+
+    def _count_value(self, value, n: int = 1):
+        if value in self.values or len(self.values) < MAX_TRACKED_VALUES:
+            self.values[value] += n
+        else:
+            self.values_complete = False
+
+    def add(self, value):
+        self.count += 1
+        if value is None:
+            self.nulls += 1
+            return
+        self._update_range(value, value)
+        if isinstance(value, Number) and not isinstance(value, bool):
+            self.total += float(value)
+        else:
+            self.numeric = False
+        try:
+            self._count_value(value)
+        except TypeError:
+            # Unhashable (e.g. REPEATED/RECORD columns)
+            self.values_complete = False
+
+    def add_array(self, array):
+        """Add a whole pyarrow array at once using Arrow compute kernels."""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        self.count += len(array)
+        self.nulls += array.null_count
+        if array.null_count == len(array):
+            return
+        if pa.types.is_nested(array.type):
+            self.numeric = False
+            self.values_complete = False
+            return
+        bounds = pc.min_max(array)
+        self._update_range(bounds["min"].as_py(), bounds["max"].as_py())
+        if pa.types.is_integer(array.type) or pa.types.is_floating(array.type) or pa.types.is_decimal(array.type):
+            self.total += float(pc.sum(array).as_py() or 0)
+        else:
+            self.numeric = False
+        for entry in pc.value_counts(array).to_pylist():
+            if entry["values"] is not None:
+                self._count_value(entry["values"], entry["counts"])
+
+    def to_dict(self) -> dict:
+        stats = {"non_null": self.count - self.nulls, "nulls": self.nulls}
+        if self.min is not None:
+            stats["min"] = self.min
+            stats["max"] = self.max
+        non_null = self.count - self.nulls
+        if self.numeric and non_null:
+            stats["mean"] = self.total / non_null
+        if self.values:
+            if self.values_complete:
+                stats["distinct"] = len(self.values)
+            stats["top_values"] = [{"value": v, "count": c} for v, c in self.values.most_common(TOP_VALUES)]
+        return stats
+
+
+class ResultSummary:
+    """Column statistics accumulated over rows (dicts) or Arrow record batches."""
+
+    def __init__(self):
+        self.columns = {}
+        self.rows_scanned = 0
+
+    def _column(self, name):
+        stats = self.columns.get(name)
+        if stats is None:
+            stats = self.columns[name] = ColumnStats()
+        return stats
+
+    def add_row(self, row: dict):
+        self.rows_scanned += 1
+        for name, value in row.items():
+            self._column(name).add(value)
+
+    def add_batch(self, batch):
+        self.rows_scanned += batch.num_rows
+        for name, array in zip(batch.schema.names, batch.columns):
+            self._column(name).add_array(array)
+
+    def to_dict(self, total_rows, sample_rows, reason: str) -> dict:
+        return {
+            "truncated": True,
+            "reason": reason,
+            "total_rows": total_rows,
+            "rows_scanned_for_stats": self.rows_scanned,
+            "columns": {name: stats.to_dict() for name, stats in self.columns.items()},
+            "sample_rows": sample_rows,
+            "note": "The result was too large to return in full. Use aggregation (GROUP BY, COUNT) "
+                    "or a tighter WHERE clause / LIMIT if you need the individual rows.",
+        }
@@ -0,0 +1,459 @@
+"""
+Materialized incident counts per day x severity x service_impact x root_cause.
+
+Most analytics questions are counts over those dimensions. IncidentRollup
+keeps the counts in memory, adds new incidents incrementally, and answers
+statements of the shape
+
+    SELECT <dimensions>, COUNT(*) [AS n] FROM <table>
+    [WHERE <dimension filters and day-aligned time ranges, joined by AND>]
+    [GROUP BY ...] [ORDER BY ...] [LIMIT n]
+
+without touching the warehouse. answer_sql returns None for anything else,
+and the caller runs the statement on the SQL backend as before.
+"""
+import datetime
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+
+from .local_sql import ANALYTICS_BQ_TABLE
+
+load_dotenv()
+
+# Set to 1 to answer simple counts from the rollup; building it reads the whole table once
+ANALYTICS_ROLLUPS = os.getenv("ANALYTICS_ROLLUPS", "0") == "1"
+# Seconds between incremental updates with incidents newer than the last one seen
+ANALYTICS_ROLLUP_REFRESH_INTERVAL = float(os.getenv("ANALYTICS_ROLLUP_REFRESH_INTERVAL", "300"))
+# Seconds between full re-reads, which pick up late-arriving and corrected rows (0 = never)
+ANALYTICS_ROLLUP_FULL_REFRESH_INTERVAL = float(os.getenv("ANALYTICS_ROLLUP_FULL_REFRESH_INTERVAL", "3600"))
+
+DIMENSIONS = ("severity", "service_impact", "root_cause")
+
+# Expressions over the incident day that a rollup can group or filter on
+_DAY_EXPRESSIONS = [
+    (re.compile(r"^date\s*\(\s*timestamp\s*\)$", re.I), lambda d: d),
+    (re.compile(r"^date_trunc\s*\(\s*date\s*\(\s*timestamp\s*\)\s*,\s*week\s*\)$", re.I),
+     lambda d: d - datetime.timedelta(days=(d.weekday() + 1) % 7)),
+    (re.compile(r"^date_trunc\s*\(\s*date\s*\(\s*timestamp\s*\)\s*,\s*month\s*\)$", re.I), lambda d: d.replace(day=1)),
+    (re.compile(r"^date_trunc\s*\(\s*date\s*\(\s*timestamp\s*\)\s*,\s*year\s*\)$", re.I),
+     lambda d: d.replace(month=1, day=1)),
+    (re.compile(r"^extract\s*\(\s*year\s+from\s+timestamp\s*\)$", re.I), lambda d: d.year),
+    (re.compile(r"^extract\s*\(\s*month\s+from\s+timestamp\s*\)$", re.I), lambda d: d.month),
+    (re.compile(r"^extract\s*\(\s*day\s+from\s+timestamp\s*\)$", re.I), lambda d: d.day),
+    (re.compile(r"^extract\s*\(\s*dayofweek\s+from\s+timestamp\s*\)$", re.I), lambda d: (d.weekday() + 1) % 7 + 1),
+]
+_COUNT = re.compile(r"^count\s*\(\s*(?:\*|1|incident_id|distinct\s+incident_id)\s*\)$", re.I)
+_ALIAS = re.compile(r"^(.*?[\w)`])\s+(?:as\s+)?`?(\w+)`?$", re.I | re.S)
+
+_STATEMENT = re.compile(
+    r"^select\s+(?P<select>.+?)\s+from\s+(?P<table>`[^`]+`|[\w.-]+)"
+    r"(?:\s+where\s+(?P<where>.+?))?"
+    r"(?:\s+group\s+by\s+(?P<group>.+?))?"
+    r"(?:\s+order\s+by\s+(?P<order>.+?))?"
+    r"(?:\s+limit\s+(?P<limit>\d+))?\s*;?$",
+    re.I | re.S,
+)
+_LITERAL = r"'([^'\\]*)'"
+_DATE_LITERAL = rf"(?:date|datetime|timestamp)?\s*{_LITERAL}"
+_CONDITIONS = [
+    ("eq", re.compile(rf"^(\w+)\s*=\s*{_LITERAL}", re.I)),
+    ("ne", re.compile(rf"^(\w+)\s*(?:!=|<>)\s*{_LITERAL}", re.I)),
+    ("in", re.compile(r"^(\w+)\s+in\s*\(([^)]*)\)", re.I)),
+    ("between", re.compile(rf"^(date\s*\(\s*timestamp\s*\)|timestamp)\s+between\s+{_DATE_LITERAL}\s+and\s+{_DATE_LITERAL}", re.I)),
+    ("compare", re.compile(rf"^(date\s*\(\s*timestamp\s*\)|timestamp)\s*(>=|<=|>|<|=)\s*{_DATE_LITERAL}", re.I)),
+]
+_AND = re.compile(r"^\s+and\s+", re.I)
+
+
+def _split_top_level(text: str) -> list:
+    """Split on commas that are not inside parentheses or quotes."""
+    parts, depth, quoted, current = [], 0, False, []
+    for ch in text:
+        if ch == "'":
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ",":
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    parts.append("".join(current).strip())
+    return parts
+
+
+def _normalize(expr: str) -> str:
+    return re.sub(r"\s+", " ", expr.strip().strip("`")).lower()
+
+
+def _parse_day(value: str):
+    """A date from a literal, or None if it is not midnight-aligned."""
+    try:
+        parsed = datetime.datetime.fromisoformat(value.strip().replace("T", " "))
+    except ValueError:
+        return None
+    if parsed.time() != datetime.time(0):
+        return None
+    return parsed.date()
+
+
+def _to_day(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.fromisoformat(str(value).replace("T", " ")).date()
+
+
+class _Plan:
+    """A statement parsed into rollup terms: output columns, filters, day range, ordering, limit."""
+
+    def __init__(self):
+        self.columns = []  # (name, kind, key) with kind "dim", "day" or "count"
+        self.filters = {}  # dimension -> set of allowed values, or ("not", set)
+        self.start = None  # first day included
+        self.end = None  # first day excluded
+        self.order = []  # (column index, descending)
+        self.limit = None
+
+    def restrict(self, start=None, end=None):
+        if start is not None and (self.start is None or start > self.start):
+            self.start = start
+        if end is not None and (self.end is None or end < self.end):
+            self.end = end
+
+
+def _select_item(item: str):
+    """(alias or None, kind, key, normalized expression) for one SELECT item, or None."""
+    match = _ALIAS.match(item)
+    expr, alias = (match.group(1), match.group(2)) if match else (item, None)
+    expr = _normalize(expr)
+    if _COUNT.match(expr):
+        return alias, "count", None, expr
+    if expr in DIMENSIONS:
+        return alias or expr, "dim", expr, expr
+    for pattern, fn in _DAY_EXPRESSIONS:
+        if pattern.match(expr):
+            return alias, "day", fn, expr
+    return None
+
+
+def _apply_condition(plan: _Plan, kind: str, match) -> bool:
+    if kind in ("eq", "ne", "in"):
+        column = match.group(1).lower()
+        if column not in DIMENSIONS:
+            return False
+        if kind == "in":
+            values = set()
+            for value in _split_top_level(match.group(2)):
+                literal = re.fullmatch(_LITERAL, value)
+                if literal is None:
+                    return False
+                values.add(literal.group(1))
+        else:
+            values = {match.group(2)}
+        if column in plan.filters:
+            # Several conditions on one column are rare; leave them to the SQL backend
+            return False
+        plan.filters[column] = ("not", values) if kind == "ne" else values
+        return True
+
+    is_date = _normalize(match.group(1)) != "timestamp"
+    if kind == "between":
+        low, high = _parse_day(match.group(2)), _parse_day(match.group(3))
+        # timestamp BETWEEN includes the midnight of the last day, which a daily rollup can't separate
+        if low is None or high is None or not is_date:
+            return False
+        plan.restrict(low, high + datetime.timedelta(days=1))
+        return True
+
+    op, day = match.group(2), _parse_day(match.group(3))
+    if day is None:
+        return False
+    one_day = datetime.timedelta(days=1)
+    if op == ">=":
+        plan.restrict(start=day)
+    elif op == "<":
+        plan.restrict(end=day)
+    elif is_date and op == ">":
+        plan.restrict(start=day + one_day)
+    elif is_date and op == "<=":
+        plan.restrict(end=day + one_day)
+    elif is_date and op == "=":
+        plan.restrict(day, day + one_day)
+    else:
+        return False
+    return True
+
+
+def _parse_where(plan: _Plan, where: str) -> bool:
+    rest = where.strip()
+    while rest:
+        for kind, pattern in _CONDITIONS:
+            match = pattern.match(rest)
+            if match is not None:
+                break
+        else:
+            return False
+        if not _apply_condition(plan, kind, match):
+            return False
+        rest = rest[match.end():]
+        if not rest.strip():
+            break
+        joiner = _AND.match(rest)
+        if joiner is None:
+            return False
+        rest = rest[joiner.end():]
+    return True
+
+
+def _resolve_column(plan: _Plan, ref: str, exprs: list):
+    """Index of the output column a GROUP BY / ORDER BY item refers to (by position, alias or expression)."""
+    ref = _normalize(ref)
+    if ref.isdigit():
+        index = int(ref) - 1
+        return index if 0 <= index < len(plan.columns) else None
+    for i, (name, _, _) in enumerate(plan.columns):
+        if ref == name.lower() or ref == exprs[i]:
+            return i
+    return None
+
+
+def parse_statement(query: str, table: str = ANALYTICS_BQ_TABLE):
+    """Parse a statement into a _Plan, or return None if rollups cannot answer it exactly."""
+    match = _STATEMENT.match(query.strip())
+    if match is None:
+        return None
+    name = match.group("table").strip("`")
+    if name not in (table, ".".join(table.split(".")[-2:])):
+        return None
+
+    plan = _Plan()
+    exprs = []
+    anonymous = 0
+    for item in _split_top_level(match.group("select")):
+        parsed = _select_item(item)
+        if parsed is None:
+            return None
+        column_name, kind, key, expr = parsed
+        if column_name is None:
+            # BigQuery's names for unaliased expressions
+            column_name = f"f{anonymous}_"
+            anonymous += 1
+        plan.columns.append((column_name, kind, key))
+        exprs.append(expr)
+    kinds = [kind for _, kind, _ in plan.columns]
+    if kinds.count("count") != 1:
+        return None
+
+    grouped = {i for i, kind in enumerate(kinds) if kind != "count"}
+    if match.group("group"):
+        refs = [_resolve_column(plan, ref, exprs) for ref in _split_top_level(match.group("group"))]
+        if None in refs or set(refs) != grouped:
+            return None
+    elif grouped:
+        return None
+
+    if match.group("where") and not _parse_where(plan, match.group("where")):
+        return None
+
+    if match.group("order"):
+        for item in _split_top_level(match.group("order")):
+            direction = re.match(r"^(.*?)(?:\s+(asc|desc))?$", item.strip(), re.I | re.S)
+            index = _resolve_column(plan, direction.group(1), exprs)
+            if index is None:
+                return None
+            plan.order.append((index, (direction.group(2) or "").lower() == "desc"))
+    if match.group("limit"):
+        plan.limit = int(match.group("limit"))
+    return plan
+
+
+class IncidentRollup:
+    """
+    Incident counts keyed by (day, severity, service_impact, root_cause).
+
+    add() folds in new incident rows, skipping incident_ids already counted,
+    so refresh() can re-read from the last timestamp seen without double
+    counting. Rows without an incident_id are matched on their timestamp and
+    dimensions instead: within one read, only copies beyond those already
+    counted are added. Incidents inserted later with an older timestamp, and
+    corrected rows, are picked up by refresh(full=True), which start() runs
+    every full_interval seconds.
+    """
+
+    def __init__(self, table: str = ANALYTICS_BQ_TABLE):
+        self.table = table
+        self.ready = False
+        self.watermark = None
+        self._counts = {}  # day -> Counter of (severity, service_impact, root_cause)
+        self._totals = Counter()  # the same counts summed over all days, for questions without a time dimension
+        self._seen = set()
+        self._unkeyed = Counter()  # (timestamp, dimensions) -> rows without an incident_id counted
+        self._answers = {}
+        self._version = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._seen) + sum(self._unkeyed.values())
+
+    def add(self, rows) -> int:
+        """Count incidents not seen before; returns how many were added."""
+        added = 0
+        unkeyed = Counter()
+        with self._lock:
+            for row in rows:
+                incident_id = row.get("incident_id")
+                timestamp = row.get("timestamp")
+                key = tuple(row.get(dimension) for dimension in DIMENSIONS)
+                if incident_id is None:
+                    content = (str(timestamp), key)
+                    unkeyed[content] += 1
+                    if unkeyed[content] <= self._unkeyed[content]:
+                        continue
+                    self._unkeyed[content] = unkeyed[content]
+                elif incident_id in self._seen:
+                    continue
+                else:
+                    self._seen.add(incident_id)
+                day = _to_day(timestamp) if timestamp is not None else None
+                self._counts.setdefault(day, Counter())[key] += 1
+                self._totals[key] += 1
+                if timestamp is not None and (self.watermark is None or str(timestamp) > str(self.watermark)):
+                    self.watermark = timestamp
+                added += 1
+            if added:
+                self._version += 1
+                self._answers.clear()
+        return added
+
+    def refresh(self, full: bool = False) -> int:
+        """Read incidents since the watermark (or all, if full) from the SQL backend and add them."""
+        from .bq_client import iter_query_rows
+
+        with self._refresh_lock:
+            columns = ", ".join(("incident_id", "timestamp") + DIMENSIONS)
+            query = f"SELECT {columns} FROM `{self.table}`"
+            watermark = None if full else self.watermark
+            if watermark is not None:
+                query += f" WHERE timestamp >= '{watermark}'"
+            if full:
+                rebuilt = IncidentRollup(self.table)
+                rebuilt.add(iter_query_rows(query))
+                with self._lock:
+                    added = len(rebuilt._seen - self._seen) + sum((rebuilt._unkeyed - self._unkeyed).values())
+                    self._counts, self._totals = rebuilt._counts, rebuilt._totals
+                    self._seen, self._unkeyed = rebuilt._seen, rebuilt._unkeyed
+                    self.watermark = rebuilt.watermark
+                    self._version += 1
+                    self._answers.clear()
+            else:
+                added = self.add(iter_query_rows(query))
+            self.ready = True
+        return added
+
+    def start(self, interval: float, full_interval: float = ANALYTICS_ROLLUP_FULL_REFRESH_INTERVAL):
+        """
+        Build the rollup, then update it every interval seconds and re-read it
+        in full every full_interval seconds, on a daemon thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        def run():
+            last_full = time.monotonic()
+            while True:
+                now = time.monotonic()
+                full = not self.ready or (full_interval > 0 and now - last_full >= full_interval)
+                try:
+                    added = self.refresh(full=full)
+                    if full:
+                        last_full = now
+                    if added:
+                        print(f"Incident rollup: {added} new incidents, {len(self)} total")
+                except Exception as e:
+                    print(f"Warning: Incident rollup refresh failed: {e}")
+                if interval <= 0 or self._stop.wait(interval):
+                    return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="incident-rollup", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def _matches(self, key, filters) -> bool:
+        for position, dimension in enumerate(DIMENSIONS):
+            allowed = filters.get(dimension)
+            if allowed is None:
+                continue
+            if isinstance(allowed, tuple):
+                if key[position] is None or key[position] in allowed[1]:
+                    return False
+            elif key[position] not in allowed:
+                return False
+        return True
+
+    def _execute(self, plan: _Plan) -> list:
+        groups = Counter()
+        dim_positions = {dimension: i for i, dimension in enumerate(DIMENSIONS)}
+        by_day = plan.start is not None or plan.end is not None or any(kind == "day" for _, kind, _ in plan.columns)
+        with self._lock:
+            days = self._counts.items() if by_day else [(None, self._totals)]
+            for day, cells in days:
+                if day is None:
+                    # No timestamp: excluded by any time range, NULL in any day expression
+                    if plan.start is not None or plan.end is not None:
+                        continue
+                elif (plan.start is not None and day < plan.start) or (plan.end is not None and day >= plan.end):
+                    continue
+                for key, count in cells.items():
+                    if not self._matches(key, plan.filters):
+                        continue
+                    group = tuple(
+                        key[dim_positions[fn]] if kind == "dim" else (fn(day) if day is not None else None)
+                        for _, kind, fn in plan.columns if kind != "count"
+                    )
+                    groups[group] += count
+
+        if not groups and all(kind == "count" for _, kind, _ in plan.columns):
+            groups[()] = 0
+        rows = []
+        for group, count in groups.items():
+            values = iter(group)
+            rows.append({name: count if kind == "count" else next(values) for name, kind, _ in plan.columns})
+        for index, descending in reversed(plan.order):
+            name = plan.columns[index][0]
+            # NULLs sort first ascending and last descending, as in BigQuery
+            rows.sort(key=lambda row: (row[name] is not None, row[name]), reverse=descending)
+        return rows[:plan.limit] if plan.limit is not None else rows
+
+    def answer_sql(self, query: str):
+        """Rows for query computed from the rollup, or None if it can't answer it exactly."""
+        if not self.ready:
+            return None
+        key = re.sub(r"\s+", " ", query.strip())
+        cached = self._answers.get(key)
+        if cached is not None:
+            return [dict(row) for row in cached]
+        plan = parse_statement(query, self.table)
+        if plan is None:
+            return None
+        version = self._version
+        rows = self._execute(plan)
+        with self._lock:
+            if version == self._version:
+                self._answers[key] = rows
+        return [dict(row) for row in rows]
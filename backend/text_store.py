@@ -0,0 +1,61 @@
+import numpy as np
+
+
+class TextStore:
+    """
+    In-memory id -> text index over the embeddings corpus.
+
+    Built once when the embeddings file is loaded so that neighbor lookups are
+    hash lookups instead of a boolean-mask scan of the whole DataFrame.
+    """
+
+    def __init__(self, ids, texts, vectors=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        # Optional embedding matrix, one row per id, for the local search backend
+        self.vectors = vectors
+        self._texts = {int(i): t for i, t in zip(self.ids, texts)}
+
+    @classmethod
+    def from_dataframe(cls, df, id_column: str = "id", text_column: str = "text", vector_column: str = "embedding"):
+        """
+        Build the store from the DataFrame read from EMBEDDINGS_FILE.
+
+        Of rows sharing an id the last is kept, and dropped if it is a deletion
+        marker ({"id": ..., "deleted": true}).
+        """
+        df = df.drop_duplicates(subset=id_column, keep="last")
+        if "deleted" in df.columns:
+            df = df[~df["deleted"].eq(True)]
+        vectors = None
+        if vector_column in df.columns:
+            vectors = np.asarray(df[vector_column].tolist(), dtype=np.float32)
+        return cls(df[id_column].to_numpy(dtype=np.int64), df[text_column].tolist(), vectors)
+
+    def __len__(self):
+        return len(self._texts)
+
+    def __contains__(self, id_):
+        return int(id_) in self._texts
+
+    def items(self):
+        """Iterate over (id, text) pairs."""
+        return iter(self._texts.items())
+
+    def get(self, id_, default=None):
+        """Return the text for a single id, or default if it is not in the corpus."""
+        return self._texts.get(int(id_), default)
+
+    def lookup_many(self, ids) -> list:
+        """
+        Return the texts for ids in the order given.
+
+        Ids that are not in the corpus are skipped, so the result can be
+        shorter than the input.
+        """
+        texts = self._texts
+        found = []
+        for id_ in ids:
+            text = texts.get(int(id_))
+            if text is not None:
+                found.append(text)
+        return found
@@ -1,9 +1,23 @@
-from google.cloud import aiplatform
-from google.cloud import storage
-from vertexai.language_models import TextEmbeddingModel
 import os
-import pandas as pd
+import threading
 from dotenv import load_dotenv
+from .context_builder import build_context
+from .corpus_refresh import CorpusRefresher, source_from_uri
+from .corpus_store import MmapCorpusStore, append_records, prepare_store, publish_store, store_exists
+from .diversity import select_diverse
+from .embedding_cache import EmbeddingCache, normalize_query
+from .lexical_index import reciprocal_rank_fusion
+from .metadata_index import FILTER_FIELDS, MetadataIndex, parse_day, split_values
+from .resources import LazyResource, warm_up as _warm_up
+from .result_cache import ResultCache
+from .segments import CorpusSnapshot, LiveDelta, SegmentedSearchBackend
+from .text_store import TextStore
+from .tracing import span
+from .vector_search import LocalSearchBackend, RemoteSearchBackend
+
+# The Google Cloud SDKs and pandas are imported inside the loaders below:
+# importing them alone takes seconds, and nothing here should run until the
+# first query (or warm_up()) needs it.
 
 load_dotenv()
 
@@ -15,95 +29,678 @@ PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT","vodaf-aida25lcpm-206")
 LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION","europe-west1")
 INDEX_ENDPOINT_ID = os.getenv("INDEX_ENDPOINT_ID","projects/100938974863/locations/europe-west1/indexEndpoints/8033005564252389376")
 DEPLOYED_INDEX_ID = os.getenv("DEPLOYED_INDEX_ID","VECTOR_SEARCH_ENDPOINT_20250909155315")
+# The index deployed as DEPLOYED_INDEX_ID; only needed to upsert new incidents (stream-update indexes)
+INDEX_ID = os.getenv("INDEX_ID", "")
 EMBEDDINGS_FILE = os.getenv("EMBEDDINGS_FILE","embeddings_text.json")
 BUCKET_NAME = "vodaf-aida25lcpm-206-rag"
 BLOB_NAME = "csv_data/embeddings_text.json"
+# Compact mmap store built from EMBEDDINGS_FILE with `python -m backend.corpus_store`; used when present
+EMBEDDINGS_STORE_DIR = os.getenv("EMBEDDINGS_STORE_DIR", os.path.splitext(EMBEDDINGS_FILE)[0] + "_store")
+# Where the corpus comes from (gs://bucket/blob or a local path) and how often to check it for a
+# new version, in seconds (0 = only download when EMBEDDINGS_FILE is missing)
+EMBEDDINGS_SOURCE = os.getenv("EMBEDDINGS_SOURCE", f"gs://{BUCKET_NAME}/{BLOB_NAME}")
+CORPUS_REFRESH_INTERVAL = float(os.getenv("CORPUS_REFRESH_INTERVAL", "0"))
+
+# Vector search backend: "remote" (Matching Engine endpoint) or "local" (in-process NumPy search)
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "remote").lower()
+VECTOR_SEARCH_DISTANCE = os.getenv("VECTOR_SEARCH_DISTANCE", "COSINE_DISTANCE")
+LOCAL_SEARCH_MODE = os.getenv("LOCAL_SEARCH_MODE", "exact")
+LOCAL_SEARCH_NLIST = int(os.getenv("LOCAL_SEARCH_NLIST", "0"))
+LOCAL_SEARCH_NPROBE = int(os.getenv("LOCAL_SEARCH_NPROBE", "8"))
+# Records appended to EMBEDDINGS_FILE after it was loaded (by ingestion, in this or another process)
+# are served from a small delta segment, checked every LIVE_POLL_INTERVAL seconds (0 = never), until
+# compaction reloads the corpus with them: when the delta holds LIVE_DELTA_MAX_RECORDS records or
+# its oldest change is LIVE_COMPACT_INTERVAL seconds old
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", "1"))
+LIVE_DELTA_MAX_RECORDS = int(os.getenv("LIVE_DELTA_MAX_RECORDS", "2000"))
+LIVE_COMPACT_INTERVAL = float(os.getenv("LIVE_COMPACT_INTERVAL", "300"))
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "text-embedding-004")
+# Query embedding cache: in-memory LRU plus a SQLite file shared by all workers ("" disables the file)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+# Retrieval result cache for bursts of near-identical questions (a TTL of 0 disables it)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+
+# Fuse BM25 keyword results with the vector results (set to 0 for vector search only)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") != "0"
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Top keyword hit must score this many times the runner-up to skip the vector search
+HYBRID_LEXICAL_CONFIDENCE = float(os.getenv("HYBRID_LEXICAL_CONFIDENCE", "2.0"))
+
+# The remote index has severity/service_impact/location token restricts and a numeric "day" restrict
+REMOTE_INDEX_RESTRICTS = os.getenv("REMOTE_INDEX_RESTRICTS", "0") == "1"
+# Without restricts, filtered remote searches fetch this many times the neighbors and filter them afterwards
+FILTER_OVERFETCH = int(os.getenv("FILTER_OVERFETCH", "5"))
+
+# Re-select the neighbors from a wider candidate set: "mmr" (maximal marginal relevance),
+# "dedupe" (relevance order with near duplicates collapsed) or "off"
+RETRIEVAL_DIVERSITY = os.getenv("RETRIEVAL_DIVERSITY", "mmr").lower()
+# Candidates fetched per requested neighbor to re-select from
+DIVERSITY_CANDIDATES = int(os.getenv("DIVERSITY_CANDIDATES", "3"))
+# Weight of relevance against novelty in MMR (1 = relevance only)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Candidates at least this cosine-similar to a selected one are near duplicates and left out
+DUPLICATE_SIMILARITY = float(os.getenv("DUPLICATE_SIMILARITY", "0.97"))
+
+# Token budget for the context a retrieval returns (0 = unlimited) and its format: "text" or "jsonl"
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+CONTEXT_FORMAT = os.getenv("CONTEXT_FORMAT", "text").lower()
 
 def download_embeddings_if_not_exists():
     """Download embeddings file from GCP bucket if it doesn't exist locally."""
     if not os.path.exists(EMBEDDINGS_FILE):
-        print(f"Embeddings file {EMBEDDINGS_FILE} not found. Downloading from GCP bucket...")
+        print(f"Embeddings file {EMBEDDINGS_FILE} not found. Downloading from {EMBEDDINGS_SOURCE}...")
         try:
-            # Initialize storage client
-            storage_client = storage.Client(project=PROJECT_ID)
-            bucket = storage_client.bucket(BUCKET_NAME)
-            blob = bucket.blob(BLOB_NAME)
-            
-            # Download the file
-            blob.download_to_filename(EMBEDDINGS_FILE)
-            print(f"Successfully downloaded {EMBEDDINGS_FILE} from gs://{BUCKET_NAME}/{BLOB_NAME}")
+            corpus_refresher.get().refresh(force=True, notify=False)
         except Exception as e:
             print(f"Error downloading embeddings file: {e}")
             raise
     else:
         print(f"Embeddings file {EMBEDDINGS_FILE} already exists locally.")
 
-# Initialize AI Platform with explicit project
-try:
-    aiplatform.init(project=PROJECT_ID, location=LOCATION)
-except Exception as e:
-    print(f"Warning: Failed to initialize AI Platform: {e}")
-
-# Load index endpoint
-try:
-    index_endpoint = aiplatform.MatchingEngineIndexEndpoint(
-        INDEX_ENDPOINT_ID,
-        project=PROJECT_ID,
-        location=LOCATION,
-    )
-except Exception as e:
-    print(f"Warning: Failed to load index endpoint: {e}")
-    index_endpoint = None
+def _init_aiplatform():
+    """Initialize AI Platform with explicit project."""
+    from google.cloud import aiplatform
+
+    try:
+        aiplatform.init(project=PROJECT_ID, location=LOCATION)
+        return True
+    except Exception as e:
+        print(f"Warning: Failed to initialize AI Platform: {e}")
+        return False
+
+def _load_index_endpoint():
+    """Load the Matching Engine index endpoint, or None if it can't be loaded."""
+    from google.cloud import aiplatform
+
+    aiplatform_ready.get()
+    try:
+        return aiplatform.MatchingEngineIndexEndpoint(
+            INDEX_ENDPOINT_ID,
+            project=PROJECT_ID,
+            location=LOCATION,
+        )
+    except Exception as e:
+        print(f"Warning: Failed to load index endpoint: {e}")
+        return None
+
+def _load_index():
+    """The MatchingEngineIndex named by INDEX_ID, or None if it is unset or can't be loaded."""
+    if not INDEX_ID:
+        return None
+    from google.cloud import aiplatform
+
+    aiplatform_ready.get()
+    try:
+        return aiplatform.MatchingEngineIndex(INDEX_ID, project=PROJECT_ID, location=LOCATION)
+    except Exception as e:
+        print(f"Warning: Failed to load index {INDEX_ID}: {e}")
+        return None
+
+def _embeddings_file_state():
+    """(size, inode) of EMBEDDINGS_FILE, or (0, None) if it doesn't exist."""
+    try:
+        st = os.stat(EMBEDDINGS_FILE)
+    except FileNotFoundError:
+        return 0, None
+    return st.st_size, st.st_ino
+
+def _open_corpus(store_dir: str = None):
+    """
+    Open the embeddings corpus on disk: the mmap store if one has been built
+    (store_dir, a version of it not published yet, or EMBEDDINGS_STORE_DIR),
+    otherwise EMBEDDINGS_FILE indexed by id in memory.
+
+    Returns the store and the size of EMBEDDINGS_FILE it holds; lines past it
+    are served by the live delta.
+    """
+    size, inode = _embeddings_file_state()
+    store_dir = store_dir or EMBEDDINGS_STORE_DIR
+    if store_exists(store_dir):
+        print(f"Using compact embeddings store {store_dir}")
+        store = MmapCorpusStore(store_dir)
+        if store.meta.get("source_inode") == inode:
+            size = min(size, store.meta.get("source_size", size))
+        return store, size
+
+    import pandas as pd
+
+    df = pd.read_json(EMBEDDINGS_FILE, orient='records', lines=True)
+    return TextStore.from_dataframe(df), size
+
+def _load_corpus():
+    """Download the embeddings file if needed, start the refresher and open the corpus."""
+    corpus_refresher.get()
+    if not store_exists(EMBEDDINGS_STORE_DIR):
+        download_embeddings_if_not_exists()
+    store, offset = _open_corpus()
+    _serve(CorpusSnapshot(store, load_search_backend), offset)
+    if LIVE_POLL_INTERVAL > 0:
+        live_delta.start(LIVE_POLL_INTERVAL)
+    return True
+
+def use_corpus(store, search_backend=None, offset: int = None):
+    """
+    Serve a new corpus snapshot of store from now on, following EMBEDDINGS_FILE
+    from offset (its current end by default). search_backend is built from
+    the store on first use unless given, e.g. a stand-in for benchmarks.
+    """
+    snapshot = CorpusSnapshot(store, load_search_backend)
+    if search_backend is not None:
+        snapshot.search_backend.set(search_backend)
+    _serve(snapshot, _embeddings_file_state()[0] if offset is None else offset)
+    corpus.set(True)
+    return snapshot
+
+def _serve(snapshot, offset: int):
+    """Swap snapshot in for every query that starts from now on, with the live delta following from offset."""
+    live_delta.reset(offset, snapshot)
+
+def _build_local_backend(store, previous=None):
+    """The local index of store; an IVF index reuses the centroids of previous, skipping k-means."""
+    try:
+        return LocalSearchBackend.from_store(
+            store,
+            distance_measure=VECTOR_SEARCH_DISTANCE,
+            mode=LOCAL_SEARCH_MODE,
+            nlist=LOCAL_SEARCH_NLIST,
+            nprobe=LOCAL_SEARCH_NPROBE,
+            centroids=getattr(previous, "centroids", None),
+        )
+    except Exception as e:
+        print(f"Warning: Failed to build local search index: {e}")
+        return None
+
+def load_search_backend(store):
+    """Build the vector search backend selected by VECTOR_SEARCH_BACKEND for store, or None if unavailable."""
+    if VECTOR_SEARCH_BACKEND == "local":
+        return _build_local_backend(store)
+    if VECTOR_SEARCH_BACKEND != "remote":
+        print(f"Warning: Unknown VECTOR_SEARCH_BACKEND '{VECTOR_SEARCH_BACKEND}', expected 'remote' or 'local'")
+        return None
+    return remote_backend_resource.get()
+
+def _load_remote_backend():
+    index_endpoint = index_endpoint_resource.get()
+    if index_endpoint is None:
+        return None
+    return RemoteSearchBackend(index_endpoint, DEPLOYED_INDEX_ID, index=_load_index())
 
-# Download embeddings file if it doesn't exist
-download_embeddings_if_not_exists()
+def _load_embedding_model():
+    from vertexai.language_models import TextEmbeddingModel
 
-# Load embeddings text data
-df = pd.read_json(EMBEDDINGS_FILE, orient='records', lines=True)
+    aiplatform_ready.get()
+    try:
+        return TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_NAME)
+    except Exception as e:
+        print(f"Error initializing embedding model: {e}")
+        raise
+
+# Bumped whenever the corpus or index changes; part of every result cache key
+_corpus_version = 0
+
+def get_corpus_version():
+    return (VECTOR_SEARCH_BACKEND, DEPLOYED_INDEX_ID, _corpus_version)
 
-# Load embedding model lazily to avoid authentication issues at import time
-embedding_model = None
+def _corpus_changed():
+    """Invalidate everything derived from the previous corpus or index."""
+    global _corpus_version
+    _corpus_version += 1
+    result_cache.clear()
+
+_reload_lock = threading.Lock()
+
+def reload_corpus(generation: str = None):
+    """
+    Rebuild the corpus (and the local index) from the files on disk and swap them in.
+
+    The new snapshot is built completely, with every structure the current one
+    has loaded, and swapped in with one assignment; queries already running
+    keep the snapshot they started with, so nothing in flight is dropped or
+    mixed. Compaction of the live delta and corpus refreshes can both call
+    this; one runs at a time.
+    """
+    with _reload_lock:
+        _reload_corpus(generation)
+
+def _reload_corpus(generation):
+    # The rebuilt store is only published once the new snapshot has been built from it
+    store_dir = prepare_store(EMBEDDINGS_FILE, EMBEDDINGS_STORE_DIR) if store_exists(EMBEDDINGS_STORE_DIR) else None
+    (old, delta), delta_offset = live_delta.caught_up()
+    new_corpus, offset = _open_corpus(store_dir)
+    snapshot = CorpusSnapshot(new_corpus, load_search_backend)
+    # Compaction only folds the delta in: reuse what it can of the old structures instead of starting over
+    compacted = old is not None and delta_offset is not None and delta_offset >= offset
+    if old is not None and old.search_backend.loaded:
+        previous = old.search_backend.get()
+        if VECTOR_SEARCH_BACKEND == "local":
+            new_backend = _build_local_backend(new_corpus, previous if compacted else None)
+            if new_backend is None:
+                print("Warning: Keeping the previous corpus because the local index could not be rebuilt")
+                return
+            snapshot.search_backend.set(new_backend)
+        else:
+            snapshot.search_backend.set(previous)
+    if old is not None and old.metadata_index.loaded:
+        merged = None
+        if compacted:
+            merged = MetadataIndex.merged(old.metadata_index.get(), delta.metadata, new_corpus.ids)
+        snapshot.metadata_index.set(merged if merged is not None else MetadataIndex.from_store(new_corpus))
+    if old is not None and old.lexical_index.loaded:
+        # BM25 weights depend on corpus-wide statistics, so the keyword index is rebuilt
+        snapshot.lexical_index.get()
+    if store_dir is not None:
+        publish_store(EMBEDDINGS_STORE_DIR, store_dir)
+    _serve(snapshot, offset)
+    _corpus_changed()
+    print(f"Reloaded embeddings corpus ({len(new_corpus)} records, generation {generation})")
+
+def _create_corpus_refresher():
+    refresher = CorpusRefresher(source_from_uri(EMBEDDINGS_SOURCE, PROJECT_ID), EMBEDDINGS_FILE, on_update=reload_corpus)
+    if CORPUS_REFRESH_INTERVAL > 0:
+        refresher.start(CORPUS_REFRESH_INTERVAL)
+    return refresher
+
+def _open_embedding_cache():
+    try:
+        return EmbeddingCache(EMBEDDING_MODEL_NAME, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_SIZE)
+    except Exception as e:
+        print(f"Warning: Failed to open embedding cache file, caching in memory only: {e}")
+        return EmbeddingCache(EMBEDDING_MODEL_NAME, None, EMBEDDING_CACHE_SIZE)
+
+# Everything expensive is built on first use (or by warm_up()), once per process
+aiplatform_ready = LazyResource("aiplatform", _init_aiplatform)
+index_endpoint_resource = LazyResource("index endpoint", _load_index_endpoint)
+corpus_refresher = LazyResource("corpus refresher", _create_corpus_refresher)
+# Loads the first corpus snapshot (see use_corpus); the serving one is always live_delta.view
+corpus = LazyResource("embeddings corpus", _load_corpus)
+remote_backend_resource = LazyResource("remote search backend", _load_remote_backend)
+embedding_model_resource = LazyResource("embedding model", _load_embedding_model)
+embedding_cache_resource = LazyResource("embedding cache", _open_embedding_cache)
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+# Records appended to EMBEDDINGS_FILE since the corpus was loaded; compaction reloads the corpus
+live_delta = LiveDelta(EMBEDDINGS_FILE, compact=lambda: reload_corpus("compacted"), on_change=_corpus_changed,
+                       max_records=LIVE_DELTA_MAX_RECORDS, compact_after=LIVE_COMPACT_INTERVAL)
+
+def warm_up(background: bool = True):
+    """Load the corpus, search backend and embedding model ahead of the first query."""
+    # Per-call wrappers: warming up builds the structures of whichever snapshot is serving
+    snapshot_part = lambda name, part: LazyResource(name, lambda: getattr(get_corpus_view()[0], part).get())
+    return _warm_up([
+        aiplatform_ready,
+        embedding_cache_resource,
+        corpus,
+        snapshot_part("search backend", "search_backend"),
+        embedding_model_resource,
+        snapshot_part("metadata index", "metadata_index"),
+    ] + ([snapshot_part("lexical index", "lexical_index")] if HYBRID_SEARCH else []), background=background)
 
 def get_embedding_model():
     """Get the embedding model, initializing it if necessary."""
-    global embedding_model
-    if embedding_model is None:
-        try:
-            embedding_model = TextEmbeddingModel.from_pretrained("text-embedding-004")
-        except Exception as e:
-            print(f"Error initializing embedding model: {e}")
-            raise
-    return embedding_model
+    return embedding_model_resource.get()
+
+def get_embedding_cache():
+    return embedding_cache_resource.get()
+
+# The getters below return the serving structures with the live delta merged in. A query passes
+# the same view (get_corpus_view()) to each of them so their rows line up while updates and reloads land.
+
+def get_corpus_view():
+    """The serving (CorpusSnapshot, DeltaSegment) pair, read together."""
+    corpus.get()
+    return live_delta.view
+
+def get_text_store(view=None):
+    snapshot, delta = view or get_corpus_view()
+    return delta.over(snapshot.store)
 
-def retrieve_context_from_query(query: str, num_neighbors: int = 10) -> str:
+def get_search_backend(view=None):
+    snapshot, delta = view or get_corpus_view()
+    return delta.over(snapshot.search_backend.get())
+
+def get_lexical_index(view=None):
+    if not HYBRID_SEARCH:
+        return None
+    snapshot, delta = view or get_corpus_view()
+    return delta.over(snapshot.lexical_index.get())
+
+def get_metadata_index(view=None):
+    snapshot, delta = view or get_corpus_view()
+    return delta.over(snapshot.metadata_index.get())
+
+def upsert_records(ids, vectors, texts, persisted: bool = False):
+    """
+    Add or replace corpus records without rebuilding any index.
+
+    The records are appended to EMBEDDINGS_FILE (unless persisted says the
+    caller already did) and, when following the file is on (LIVE_POLL_INTERVAL),
+    served from the live delta as soon as this returns; other processes serving
+    the same file pick them up within LIVE_POLL_INTERVAL seconds. With the remote backend they are also upserted
+    into the Matching Engine index (stream updates, needs INDEX_ID).
+    """
+    if not persisted:
+        append_records(EMBEDDINGS_FILE, [
+            {"id": int(id_), "text": text, "embedding": [float(v) for v in vector]}
+            for id_, text, vector in zip(ids, texts, vectors)
+        ])
+    backend = get_corpus_view()[0].search_backend.get()
+    if isinstance(backend, RemoteSearchBackend) and backend.index is not None:
+        backend.upsert(ids, vectors, texts)
+    if LIVE_POLL_INTERVAL > 0:
+        live_delta.poll()
+
+def delete_records(ids, persisted: bool = False):
+    """Remove corpus records without rebuilding any index; the counterpart of upsert_records."""
+    if not persisted:
+        append_records(EMBEDDINGS_FILE, [{"id": int(id_), "deleted": True} for id_ in ids])
+    backend = get_corpus_view()[0].search_backend.get()
+    if isinstance(backend, RemoteSearchBackend) and backend.index is not None:
+        backend.delete(ids)
+    if LIVE_POLL_INTERVAL > 0:
+        live_delta.poll()
+
+def get_cache_stats() -> dict:
+    """Hit rates of the retrieval result cache and the query embedding cache, for sizing them."""
+    stats = {"results": result_cache.stats()}
+    if embedding_cache_resource.loaded:
+        stats["embeddings"] = get_embedding_cache().stats()
+    return stats
+
+def _embed_uncached(texts):
+    model = get_embedding_model()
+    return [e.values for e in model.get_embeddings(texts)]
+
+def embed_queries(queries):
+    """Return one embedding per query, going through the embedding cache."""
+    with span("retrieval.embed", queries=len(queries)):
+        return get_embedding_cache().get_embeddings(queries, _embed_uncached)
+
+def preseed_embedding_cache(queries) -> int:
+    """Embed common queries ahead of time. Returns how many were not already cached."""
+    return get_embedding_cache().preseed(queries, _embed_uncached)
+
+def _missing_backend_message():
+    """Error message for the tools when no search backend is available."""
+    if VECTOR_SEARCH_BACKEND == "local":
+        return "Error: Local vector search index is not available. Please check EMBEDDINGS_FILE."
+    return "Error: Vector search index endpoint is not available. Please check your GCP configuration."
+
+def merge_neighbor_ids(response) -> list:
+    """
+    Merge the neighbor lists of a multi-query response into one list of unique ids.
+
+    Lists are interleaved by rank so every query's best matches come before any
+    query's weaker ones; an id seen again for another query is dropped.
+    """
+    merged = []
+    seen = set()
+    for rank in range(max((len(res) for res in response), default=0)):
+        for res in response:
+            if rank < len(res):
+                neighbor_id = int(res[rank].id)
+                if neighbor_id not in seen:
+                    seen.add(neighbor_id)
+                    merged.append(neighbor_id)
+    return merged
+
+def _retrieval_filters(severity, service_impact, location, start_date, end_date) -> dict:
+    """Tool filter arguments as a MetadataIndex filter dict; unset filters are left out."""
+    filters = {
+        field: value
+        for field, value in (("severity", severity), ("service_impact", service_impact), ("location", location))
+        if split_values(value)
+    }
+    for key, value in (("start_day", start_date), ("end_day", end_date)):
+        if value:
+            day = parse_day(value)
+            if day is None:
+                raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+            filters[key] = day
+    return filters
+
+def _filters_key(filters: dict) -> tuple:
+    return tuple(sorted((k, str(v).casefold()) for k, v in filters.items()))
+
+def _filter_mask(metadata, filters: dict):
+    """Row mask of the corpus records matching the filters, or None when there are none."""
+    if not filters:
+        return None
+    return metadata.mask(filters)
+
+def _no_matches_message(metadata, filters: dict) -> str:
+    known = "; ".join(
+        f"{field}: {', '.join(metadata.values(field)[:10])}" for field in FILTER_FIELDS if field in filters
+    )
+    message = f"No incidents match the filters {filters}."
+    if known:
+        message += f" Known values - {known}"
+    return message
+
+def _search_vectors(search_backend, embeddings, num_neighbors: int, metadata, filters: dict, allowed) -> list:
+    """
+    Vector search honoring the filters; returns the merged neighbor ids.
+
+    The local backend scores only the allowed rows. A remote index with
+    restricts (REMOTE_INDEX_RESTRICTS=1) gets the filters pushed down; without
+    them the search over-fetches FILTER_OVERFETCH times the neighbors and
+    drops the records the filters exclude.
+
+    Unless RETRIEVAL_DIVERSITY is "off", each query gets DIVERSITY_CANDIDATES
+    times the neighbors with their vectors and keeps num_neighbors of them
+    (see _diversify).
+    """
+    diversify = RETRIEVAL_DIVERSITY in ("mmr", "dedupe") and DIVERSITY_CANDIDATES > 1
+    with span("retrieval.neighbors", num_neighbors=num_neighbors, queries=len(embeddings),
+              filtered=allowed is not None, backend=type(search_backend).__name__) as stage:
+        fetch = num_neighbors * DIVERSITY_CANDIDATES if diversify else num_neighbors
+        response = _find_neighbors(search_backend, embeddings, fetch, metadata, filters, allowed, diversify)
+        if diversify:
+            response = _diversify(embeddings, response, num_neighbors)
+        neighbor_ids = merge_neighbor_ids(response)
+        stage.set(neighbors=len(neighbor_ids))
+        return neighbor_ids
+
+def _find_neighbors(search_backend, embeddings, num_neighbors: int, metadata, filters: dict, allowed,
+                    return_vectors: bool) -> list:
+    kwargs = {"return_vectors": True} if return_vectors else {}
+    if allowed is None:
+        return search_backend.find_neighbors(embeddings, num_neighbors=num_neighbors, **kwargs)
+    if isinstance(search_backend, (LocalSearchBackend, SegmentedSearchBackend)):
+        return search_backend.find_neighbors(embeddings, num_neighbors=num_neighbors, allowed=allowed, **kwargs)
+    if REMOTE_INDEX_RESTRICTS:
+        restricts, numeric_restricts = metadata.remote_restricts(filters)
+        # Without a day restrict (undated records in the corpus) the time window is applied to the results
+        window = ("start_day" in filters or "end_day" in filters) and not numeric_restricts
+        response = search_backend.find_neighbors(
+            embeddings, num_neighbors=num_neighbors * FILTER_OVERFETCH if window else num_neighbors,
+            restricts=restricts, numeric_restricts=numeric_restricts, **kwargs
+        )
+        if not window:
+            return response
+        return [[n for n in res if metadata.allows(allowed, int(n.id))][:num_neighbors] for res in response]
+    response = search_backend.find_neighbors(embeddings, num_neighbors=num_neighbors * FILTER_OVERFETCH, **kwargs)
+    return [[n for n in res if metadata.allows(allowed, int(n.id))][:num_neighbors] for res in response]
+
+def _diversify(embeddings, response, num_neighbors: int) -> list:
+    """
+    Keep num_neighbors of each query's candidates, chosen by maximal marginal
+    relevance ("mmr") or in relevance order ("dedupe"); either way candidates
+    nearly identical to a kept one (DUPLICATE_SIMILARITY) are collapsed into it,
+    so the context spends its tokens on distinct incidents.
+
+    Candidates returned without vectors are cut to the top num_neighbors.
+    """
+    mmr_lambda = MMR_LAMBDA if RETRIEVAL_DIVERSITY == "mmr" else 1.0
+    with span("retrieval.diversify", mode=RETRIEVAL_DIVERSITY, num_neighbors=num_neighbors) as stage:
+        selected = []
+        for embedding, neighbors in zip(embeddings, response):
+            vectors = [getattr(n, "feature_vector", None) for n in neighbors]
+            if any(v is None or len(v) == 0 for v in vectors):
+                selected.append(neighbors[:num_neighbors])
+                continue
+            picks = select_diverse(embedding, vectors, num_neighbors, mmr_lambda, DUPLICATE_SIMILARITY)
+            selected.append([neighbors[i] for i in picks])
+        kept = sum(len(res) for res in selected)
+        stage.set(candidates=sum(len(res) for res in response), selected=kept,
+                  collapsed=sum(min(len(res), num_neighbors) for res in response) - kept)
+        return selected
+
+def fuse_rankings(vector_ids, lexical_hits, pinned_ids=(), limit: int = None) -> list:
+    """
+    Reciprocal rank fusion of the vector and keyword rankings.
+
+    Records named by incident id in the query (pinned_ids) come first; limit
+    caps the length of the fused list.
+    """
+    fused = reciprocal_rank_fusion([vector_ids] + [[id_ for id_, _ in hits] for hits in lexical_hits], k=HYBRID_RRF_K)
+    ranked = list(dict.fromkeys(list(pinned_ids) + fused))
+    return ranked[:limit] if limit else ranked
+
+def _pinned_ids(lexical, queries, metadata, allowed) -> list:
+    """Records the queries name by incident id, without those the filters exclude."""
+    pinned = [id_ for query in queries for id_ in lexical.incident_ids(query)]
+    if allowed is None:
+        return pinned
+    return [id_ for id_ in pinned if metadata.allows(allowed, id_)]
+
+def _lexical_search(lexical, query: str, num_neighbors: int, allowed) -> list:
+    with span("retrieval.lexical", num_neighbors=num_neighbors) as stage:
+        hits = lexical.search(query, num_neighbors, allowed)
+        stage.set(hits=len(hits))
+        return hits
+
+def _build_context(store, neighbor_ids) -> str:
+    with span("retrieval.lookup", records=len(neighbor_ids)):
+        texts = store.lookup_many(neighbor_ids)
+    with span("retrieval.context", max_tokens=CONTEXT_MAX_TOKENS) as stage:
+        context, stats = build_context(texts, CONTEXT_MAX_TOKENS, CONTEXT_FORMAT)
+        stage.set(records=stats["records_included"], truncated=stats["records_truncated"],
+                  context_chars=stats["chars"], context_tokens=stats["tokens"])
+    print(
+        f"Context: {stats['records_included']}/{stats['records_available']} records "
+        f"({stats['records_truncated']} truncated), ~{stats['tokens']} tokens"
+    )
+    omitted = stats["records_available"] - stats["records_included"]
+    if omitted:
+        context += f"[{omitted} lower-ranked incidents omitted to fit the context budget]\n"
+    return context
+
+def retrieve_context_from_query(query: str, num_neighbors: int = 10, severity: str = "", service_impact: str = "",
+                                location: str = "", start_date: str = "", end_date: str = "") -> str:
     """
     Given a query string, returns the context text from the nearest neighbors in the index.
+
+    The optional filters restrict the search to matching incidents before ranking,
+    so all num_neighbors results satisfy them. Several values can be given
+    comma-separated; service_impact and location match partial names.
+
+    Args:
+        query (str): The search query.
+        num_neighbors (int): Number of neighbors to retrieve.
+        severity (str): Only incidents of this severity, e.g. "Critical" or "High,Critical".
+        service_impact (str): Only incidents affecting this service, e.g. "4G" or "DNS Resolution Failure".
+        location (str): Only incidents observed in this location, e.g. "Manchester".
+        start_date (str): Only incidents on or after this date (YYYY-MM-DD); incidents without a timestamp are kept.
+        end_date (str): Only incidents on or before this date (YYYY-MM-DD); incidents without a timestamp are kept.
+
+    Returns:
+        str: The context text of the matching incidents.
     """
     try:
-        # Check if index endpoint is available
-        if index_endpoint is None:
-            return "Error: Vector search index endpoint is not available. Please check your GCP configuration."
-        
-        # Step 1: Create embedding
-        model = get_embedding_model()
-        embedding = model.get_embeddings([query])[0].values
-
-        # Step 2: Retrieve neighbors
-        response = index_endpoint.find_neighbors(
-            deployed_index_id=DEPLOYED_INDEX_ID,
-            queries=[embedding],
-            num_neighbors=num_neighbors
-        )
+        # Check if a search backend is available
+        view = get_corpus_view()
+        search_backend = get_search_backend(view)
+        if search_backend is None:
+            return _missing_backend_message()
+        store = get_text_store(view)
+        filters = _retrieval_filters(severity, service_impact, location, start_date, end_date)
 
-        # Step 3: Extract context
-        context = ""
-        for res in response:
-            for neighbor in res:
-                match = df[df['id'] == int(neighbor.id)]
-                if not match.empty:
-                    context += match['text'].values[0] + "\n\n\n"
+        def compute():
+            metadata = get_metadata_index(view)
+            allowed = _filter_mask(metadata, filters)
+            if allowed is not None and not allowed.any():
+                return _no_matches_message(metadata, filters)
 
-        return context
+            # Step 1: Keyword search; exact incident ids and clear keyword matches skip the embedding
+            lexical = get_lexical_index(view)
+            pinned, hits = [], []
+            if lexical is not None:
+                pinned = _pinned_ids(lexical, [query], metadata, allowed)
+                hits = _lexical_search(lexical, query, num_neighbors, allowed)
+                if lexical.answers_alone(query, hits, HYBRID_LEXICAL_CONFIDENCE):
+                    return _build_context(store, fuse_rankings([], [hits], pinned, num_neighbors))
+
+            # Step 2: Create embedding
+            embedding = embed_queries([query])[0]
+
+            # Step 3: Retrieve neighbors
+            neighbor_ids = _search_vectors(search_backend, [embedding], num_neighbors, metadata, filters, allowed)
+
+            # Step 4: Extract context
+            if lexical is None:
+                return _build_context(store, neighbor_ids)
+            return _build_context(store, fuse_rankings(neighbor_ids, [hits], pinned, num_neighbors))
+
+        key = ("query", normalize_query(query), num_neighbors, _filters_key(filters), get_corpus_version())
+        return result_cache.get_or_compute(key, compute)
     except Exception as e:
         print(f"Error in retrieve_context_from_query: {e}")
         return f"Error retrieving context: {str(e)}"
+
+def retrieve_context_for_queries(queries: list[str], num_neighbors: int = 10, severity: str = "",
+                                 service_impact: str = "", location: str = "", start_date: str = "",
+                                 end_date: str = "") -> str:
+    """
+    Runs several search queries at once and returns the merged context of their nearest neighbors.
+
+    Use this for a multi-faceted search (service, symptom, component and root cause
+    queries) instead of calling retrieve_context_from_query once per facet. All
+    queries are embedded in one request and searched in one request, and an
+    incident matched by several queries is only included once. The filters apply
+    to every query, as in retrieve_context_from_query.
+
+    Args:
+        queries (list[str]): The search queries, one per facet.
+        num_neighbors (int): Number of neighbors to retrieve for each query.
+        severity (str): Only incidents of this severity, e.g. "Critical" or "High,Critical".
+        service_impact (str): Only incidents affecting this service, e.g. "4G" or "DNS Resolution Failure".
+        location (str): Only incidents observed in this location, e.g. "Manchester".
+        start_date (str): Only incidents on or after this date (YYYY-MM-DD); incidents without a timestamp are kept.
+        end_date (str): Only incidents on or before this date (YYYY-MM-DD); incidents without a timestamp are kept.
+
+    Returns:
+        str: The context text of the matching incidents.
+    """
+    try:
+        view = get_corpus_view()
+        search_backend = get_search_backend(view)
+        if search_backend is None:
+            return _missing_backend_message()
+        store = get_text_store(view)
+        queries = [q for q in queries if q and q.strip()]
+        if not queries:
+            return "Error: No search queries were provided."
+        filters = _retrieval_filters(severity, service_impact, location, start_date, end_date)
+
+        def compute():
+            metadata = get_metadata_index(view)
+            allowed = _filter_mask(metadata, filters)
+            if allowed is not None and not allowed.any():
+                return _no_matches_message(metadata, filters)
+            embeddings = embed_queries(queries)
+            neighbor_ids = _search_vectors(search_backend, embeddings, num_neighbors, metadata, filters, allowed)
+            lexical = get_lexical_index(view)
+            if lexical is not None:
+                pinned = _pinned_ids(lexical, queries, metadata, allowed)
+                hits = [_lexical_search(lexical, q, num_neighbors, allowed) for q in queries]
+                neighbor_ids = fuse_rankings(neighbor_ids, hits, pinned, len(neighbor_ids) or None)
+            return _build_context(store, neighbor_ids)
+
+        key = ("queries", tuple(normalize_query(q) for q in queries), num_neighbors, _filters_key(filters),
+               get_corpus_version())
+        return result_cache.get_or_compute(key, compute)
+    except Exception as e:
+        print(f"Error in retrieve_context_for_queries: {e}")
+        return f"Error retrieving context: {str(e)}"
@@ -0,0 +1,345 @@
+"""
+Latency tracing for the agent, retrieval and analytics stages.
+
+Each stage runs inside a span carrying its duration and a few attributes
+(num_neighbors, bytes scanned, rows returned, context length). Spans are
+exported to a local JSONL file (TRACE_EXPORTER=jsonl) or to OpenTelemetry
+(TRACE_EXPORTER=otel, using the OTLP exporter configured by the standard
+OTEL_* variables). With no exporter set, span() costs next to nothing.
+
+Per-stage percentiles of a JSONL trace file:
+
+    python -m backend.tracing report [traces.jsonl]
+"""
+import argparse
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "jsonl" writes spans to TRACE_FILE, "otel" hands them to OpenTelemetry; empty disables tracing
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+# Service name reported to OpenTelemetry
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "network-incident-agent")
+
+_current = contextvars.ContextVar("current_span", default=None)
+_write_lock = threading.Lock()
+_otel_lock = threading.Lock()
+_otel_tracer = None
+# Spans opened by one agent callback and closed by another, by (kind, invocation, key)
+_open_spans = {}
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start", "start_time", "error",
+                 "_otel")
+
+    def __init__(self, name: str, parent=None, trace_id: str = None, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id or (parent.trace_id if parent is not None else uuid.uuid4().hex)
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.error = None
+        self._otel = _start_otel(self, parent) if TRACE_EXPORTER == "otel" else None
+
+    def set(self, **attributes):
+        """Add or overwrite attributes; None values are skipped."""
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def end(self):
+        seconds = time.perf_counter() - self.start
+        _export(self, seconds)
+        return seconds
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def end(self):
+        return 0.0
+
+
+_NOOP = _NoopSpan()
+
+
+def enabled() -> bool:
+    return TRACE_EXPORTER in ("jsonl", "otel")
+
+
+def _get_otel_tracer():
+    """The OpenTelemetry tracer, installing an OTLP-exporting provider if the app hasn't set one."""
+    global _otel_tracer
+    if _otel_tracer is not None:
+        return _otel_tracer
+    with _otel_lock:
+        if _otel_tracer is None:
+            from opentelemetry import trace
+
+            if type(trace.get_tracer_provider()).__name__ == "ProxyTracerProvider":
+                from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+                from opentelemetry.sdk.resources import Resource
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+                provider = TracerProvider(resource=Resource.create({"service.name": TRACE_SERVICE_NAME}))
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+                trace.set_tracer_provider(provider)
+            _otel_tracer = trace.get_tracer("backend.tracing")
+    return _otel_tracer
+
+
+def _otel_attribute(value):
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+def _otel_parent_context(span: Span, parent):
+    """
+    The OpenTelemetry context to start span in: its parent's live span, or
+    for a root span a remote parent carrying span.trace_id, so every span of
+    one agent invocation lands in the same OpenTelemetry trace.
+    """
+    from opentelemetry import trace
+
+    if parent is not None and parent._otel is not None:
+        return trace.set_span_in_context(parent._otel)
+    try:
+        trace_id = int(span.trace_id, 16)
+    except ValueError:
+        trace_id = 0
+    if not 0 < trace_id < 2 ** 128:
+        trace_id = int(hashlib.md5(span.trace_id.encode("utf-8")).hexdigest(), 16)
+    remote = trace.SpanContext(trace_id=trace_id, span_id=trace_id % 2 ** 64 or 1, is_remote=True,
+                               trace_flags=trace.TraceFlags(trace.TraceFlags.SAMPLED))
+    return trace.set_span_in_context(trace.NonRecordingSpan(remote))
+
+
+def _start_otel(span: Span, parent):
+    """Start the OpenTelemetry span mirroring span, as a child of its parent's; None if that fails."""
+    try:
+        return _get_otel_tracer().start_span(
+            span.name,
+            context=_otel_parent_context(span, parent),
+            start_time=int(span.start_time * 1e9),
+        )
+    except Exception as e:
+        print(f"Warning: could not start OpenTelemetry span: {e}")
+        return None
+
+
+def _export(span: Span, seconds: float):
+    if TRACE_EXPORTER == "otel":
+        otel_span = span._otel
+        if otel_span is None:
+            return
+        try:
+            from opentelemetry.trace import Status, StatusCode
+
+            otel_span.set_attributes({k: _otel_attribute(v) for k, v in span.attributes.items()})
+            if span.error is not None:
+                otel_span.set_attribute("error", span.error)
+                otel_span.set_status(Status(StatusCode.ERROR, span.error))
+            otel_span.end(end_time=int(span.start_time * 1e9) + int(seconds * 1e9))
+        except Exception as e:
+            print(f"Warning: could not export span to OpenTelemetry: {e}")
+        return
+    record = {
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "name": span.name,
+        "start": round(span.start_time, 6),
+        "ms": round(seconds * 1000, 3),
+        "attributes": span.attributes,
+    }
+    if span.error is not None:
+        record["error"] = span.error
+    try:
+        line = json.dumps(record, default=str)
+        with _write_lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"Warning: could not write span to {TRACE_FILE}: {e}")
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time the enclosed block as a stage named name.
+
+    Yields the span so attributes known only afterwards (rows returned,
+    bytes scanned) can be added with .set(). Spans opened inside the block
+    become its children. An exception is recorded on the span and re-raised.
+    """
+    if not enabled():
+        yield _NOOP
+        return
+    current = Span(name, parent=_current.get(), attributes=attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+def start_span(key: tuple, name: str, trace_id: str = None, **attributes):
+    """
+    Open a span that end_span(key) closes later, for stages bracketed by two callbacks.
+
+    Spans opened while it is open become its children.
+    """
+    if not enabled():
+        return _NOOP
+    parent = _current.get()
+    started = Span(name, parent=parent, trace_id=trace_id if parent is None else None, attributes=attributes)
+    _open_spans[key] = (started, parent, _current.set(started))
+    return started
+
+
+def end_span(key: tuple, error: BaseException = None, **attributes):
+    """Close the span start_span(key) opened, recording error on it if the stage failed."""
+    entry = _open_spans.pop(key, None)
+    if entry is None:
+        return None
+    started, parent, token = entry
+    started.set(**attributes)
+    if error is not None:
+        started.error = f"{type(error).__name__}: {error}"
+    if _current.get() is started:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Closed from a different context than the one that opened it
+            _current.set(parent)
+    return started.end()
+
+
+# ---------- ADK agent callbacks ----------
+
+def before_model_callback(callback_context, llm_request):
+    """Opens an "llm" span per model call of an agent."""
+    start_span(("llm", callback_context.invocation_id, callback_context.agent_name), "llm",
+               trace_id=callback_context.invocation_id, agent=callback_context.agent_name,
+               model=getattr(llm_request, "model", None))
+    return None
+
+
+def after_model_callback(callback_context, llm_response):
+    usage = getattr(llm_response, "usage_metadata", None)
+    end_span(
+        ("llm", callback_context.invocation_id, callback_context.agent_name),
+        prompt_tokens=getattr(usage, "prompt_token_count", None),
+        output_tokens=getattr(usage, "candidates_token_count", None),
+    )
+    return None
+
+
+def on_model_error_callback(callback_context, llm_request, error):
+    """Closes the "llm" span of a model call that raised; ADK skips after_model_callback then."""
+    end_span(("llm", callback_context.invocation_id, callback_context.agent_name), error=error)
+    return None
+
+
+def before_tool_callback(tool, args, tool_context):
+    """Opens a "tool" span per tool call, including AgentTool calls into a sub-agent."""
+    start_span(("tool", tool_context.invocation_id, tool_context.function_call_id), f"tool.{tool.name}",
+               trace_id=tool_context.invocation_id, agent=tool_context.agent_name, tool=tool.name)
+    return None
+
+
+def after_tool_callback(tool, args, tool_context, tool_response):
+    size = len(tool_response) if isinstance(tool_response, (str, list)) else None
+    end_span(("tool", tool_context.invocation_id, tool_context.function_call_id), response_size=size)
+    return None
+
+
+def on_tool_error_callback(tool, args, tool_context, error):
+    """Closes the "tool" span of a tool call that raised; ADK skips after_tool_callback then."""
+    end_span(("tool", tool_context.invocation_id, tool_context.function_call_id), error=error)
+    return None
+
+
+TRACING_CALLBACKS = {
+    "before_model_callback": before_model_callback,
+    "after_model_callback": after_model_callback,
+    "on_model_error_callback": on_model_error_callback,
+    "before_tool_callback": before_tool_callback,
+    "after_tool_callback": after_tool_callback,
+    "on_tool_error_callback": on_tool_error_callback,
+}
+
+
+# ---------- Report ----------
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = q / 100 * (len(sorted_values) - 1)
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(path: str = TRACE_FILE) -> dict:
+    """Per span name: count, errors and p50/p95/p99/max duration in milliseconds."""
+    durations, errors = {}, {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            durations.setdefault(record["name"], []).append(record["ms"])
+            if "error" in record:
+                errors[record["name"]] = errors.get(record["name"], 0) + 1
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "p50": _percentile(values, 50),
+            "p95": _percentile(values, 95),
+            "p99": _percentile(values, 99),
+            "max": values[-1],
+        }
+    return summary
+
+
+def format_report(summary: dict) -> str:
+    width = max([len("stage")] + [len(name) for name in summary])
+    lines = [f"{'stage':<{width}} {'count':>7} {'errors':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}"]
+    for name, s in sorted(summary.items(), key=lambda item: -item[1]["p50"] * item[1]["count"]):
+        lines.append(
+            f"{name:<{width}} {s['count']:>7} {s['errors']:>6} "
+            f"{s['p50']:>10.1f} {s['p95']:>10.1f} {s['p99']:>10.1f} {s['max']:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    report = commands.add_parser("report", help="per-stage latency percentiles of a JSONL trace file")
+    report.add_argument("path", nargs="?", default=TRACE_FILE)
+    args = parser.parse_args()
+    print(format_report(summarize(args.path)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Same shape as aiplatform's MatchNeighbor so callers can treat both backends alike
+Neighbor = namedtuple("Neighbor", ["id", "distance", "feature_vector"], defaults=[None])
+
+DOT_PRODUCT_DISTANCE = "DOT_PRODUCT_DISTANCE"
+COSINE_DISTANCE = "COSINE_DISTANCE"
+SQUARED_L2_DISTANCE = "SQUARED_L2_DISTANCE"
+DISTANCE_MEASURES = (DOT_PRODUCT_DISTANCE, COSINE_DISTANCE, SQUARED_L2_DISTANCE)
+
+
+class RemoteSearchBackend:
+    """
+    Vector search through a deployed Vertex AI MatchingEngineIndexEndpoint.
+
+    index is the MatchingEngineIndex behind the deployment; it is only needed
+    to upsert datapoints, which requires an index created with stream updates.
+    """
+
+    def __init__(self, index_endpoint, deployed_index_id: str, index=None):
+        self.index_endpoint = index_endpoint
+        self.deployed_index_id = deployed_index_id
+        self.index = index
+
+    def find_neighbors(self, queries, num_neighbors: int = 10, restricts=None, numeric_restricts=None,
+                       return_vectors: bool = False):
+        """
+        restricts is a list of (namespace, allow_tokens) and numeric_restricts a
+        list of (namespace, op, int value); both need matching restricts on the
+        indexed datapoints. return_vectors fills in each neighbor's feature_vector.
+        """
+        kwargs = {}
+        if return_vectors:
+            kwargs["return_full_datapoint"] = True
+        if restricts or numeric_restricts:
+            from google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint import (
+                Namespace,
+                NumericNamespace,
+            )
+
+            kwargs["filter"] = [Namespace(name, list(tokens), []) for name, tokens in restricts or ()]
+            kwargs["numeric_filter"] = [
+                NumericNamespace(name=name, value_int=value, op=op) for name, op, value in numeric_restricts or ()
+            ]
+        return self.index_endpoint.find_neighbors(
+            deployed_index_id=self.deployed_index_id,
+            queries=[list(q) for q in queries],
+            num_neighbors=num_neighbors,
+            **kwargs,
+        )
+
+    def upsert(self, ids, vectors, texts):
+        """
+        Add or replace datapoints, with the metadata restricts filtered retrieval uses.
+
+        Needs the index (see __init__); stream-update indexes serve them within seconds.
+        """
+        from google.cloud.aiplatform_v1.types import IndexDatapoint
+
+        from .metadata_index import DAY_NAMESPACE, FILTER_FIELDS, record_metadata
+
+        if self.index is None:
+            raise ValueError("No index to upsert into; set INDEX_ID")
+        datapoints = []
+        for id_, vector, text in zip(ids, vectors, texts):
+            metadata = record_metadata(text)
+            datapoints.append(IndexDatapoint(
+                datapoint_id=str(id_),
+                feature_vector=[float(v) for v in vector],
+                restricts=[
+                    IndexDatapoint.Restriction(namespace=field, allow_list=[metadata[field]])
+                    for field in FILTER_FIELDS if field in metadata
+                ],
+                numeric_restricts=[
+                    IndexDatapoint.NumericRestriction(namespace=DAY_NAMESPACE, value_int=metadata["day"])
+                ] if "day" in metadata else [],
+            ))
+        self.index.upsert_datapoints(datapoints=datapoints)
+
+    def delete(self, ids):
+        """Remove datapoints from the index; like upsert, needs the index."""
+        if self.index is None:
+            raise ValueError("No index to delete from; set INDEX_ID")
+        self.index.remove_datapoints(datapoint_ids=[str(id_) for id_ in ids])
+
+
+def _top_k(scores, k: int, largest: bool):
+    """Return (indices, values) of the top k entries of each row, best first."""
+    k = min(k, scores.shape[1])
+    keyed = -scores if largest else scores
+    if k < scores.shape[1]:
+        part = np.argpartition(keyed, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    order = np.argsort(np.take_along_axis(keyed, part, axis=1), axis=1, kind="stable")
+    idx = np.take_along_axis(part, order, axis=1)
+    return idx, np.take_along_axis(scores, idx, axis=1)
+
+
+def _centroid_distances(vectors, centroids):
+    """
+    Squared L2 distance from each vector to each centroid, minus the constant |v|^2.
+
+    Partitions always use L2; for normalized vectors it ranks like cosine.
+    """
+    c_norms = np.einsum("ij,ij->i", centroids, centroids)
+    return c_norms[None, :] - 2 * vectors @ centroids.T
+
+
+class LocalSearchBackend:
+    """
+    In-process NumPy vector search over the vectors of the embeddings file.
+
+    mode="exact" scores every vector with blocked matrix products. mode="ivf"
+    clusters the vectors into nlist partitions with k-means and only scores
+    the nprobe partitions closest to each query; given the centroids of an
+    earlier index (e.g. before a compaction), it only assigns the vectors to them.
+
+    Distances follow the Matching Engine conventions: dot product (cosine
+    similarity for COSINE_DISTANCE) where larger is closer, and squared L2
+    where smaller is closer.
+    """
+
+    def __init__(self, ids, vectors, distance_measure: str = COSINE_DISTANCE, mode: str = "exact",
+                 nlist: int = 0, nprobe: int = 8, block_size: int = 65536, seed: int = 0, centroids=None):
+        if distance_measure not in DISTANCE_MEASURES:
+            raise ValueError(f"Unsupported distance measure: {distance_measure}")
+        if mode not in ("exact", "ivf"):
+            raise ValueError(f"Unsupported local search mode: {mode}")
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("vectors must be a 2D array with one row per id")
+
+        self.ids = np.asarray(ids)
+        self._id_order = None
+        self.distance_measure = distance_measure
+        self.largest = distance_measure != SQUARED_L2_DISTANCE
+        if distance_measure == COSINE_DISTANCE and not self._is_normalized(vectors):
+            vectors = self._normalize(vectors)
+        self.vectors = vectors
+        self.sq_norms = None if self.largest else np.einsum("ij,ij->i", vectors, vectors)
+        self.block_size = block_size
+        self.mode = mode
+        self.nprobe = nprobe
+        if mode == "ivf" and len(vectors):
+            if centroids is not None and centroids.shape[1] == vectors.shape[1]:
+                self._assign_lists(centroids)
+            else:
+                nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+                self._build_ivf(min(nlist, len(vectors)), seed)
+
+    @staticmethod
+    def _is_normalized(vectors, block_size: int = 65536):
+        """True if every row already has unit norm (e.g. text-embedding-004 output)."""
+        for start in range(0, len(vectors), block_size):
+            block = vectors[start:start + block_size]
+            if not np.allclose(np.einsum("ij,ij->i", block, block), 1.0, atol=1e-3):
+                return False
+        return True
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _score(self, queries, vectors, sq_norms=None):
+        scores = queries @ vectors.T
+        if self.largest:
+            return scores
+        q_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+        return np.maximum(q_norms - 2 * scores + sq_norms[None, :], 0)
+
+    def _build_ivf(self, nlist: int, seed: int, iterations: int = 10, sample_size: int = 100_000):
+        rng = np.random.default_rng(seed)
+        sample = self.vectors
+        if len(sample) > sample_size:
+            sample = sample[rng.choice(len(sample), sample_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = self._assign(sample, centroids)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            if self.distance_measure == COSINE_DISTANCE:
+                centroids = self._normalize(centroids)
+
+        self._assign_lists(centroids)
+
+    def _assign_lists(self, centroids):
+        assign = self._assign(self.vectors, centroids)
+        self.centroids = centroids
+        self.list_rows = np.argsort(assign, kind="stable")
+        self.list_offsets = np.searchsorted(assign[self.list_rows], np.arange(len(centroids) + 1))
+
+    def _assign(self, vectors, centroids):
+        out = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), self.block_size):
+            block = vectors[start:start + self.block_size]
+            out[start:start + len(block)] = np.argmin(_centroid_distances(block, centroids), axis=1)
+        return out
+
+    def _search_exact(self, queries, k: int, rows=None, excluded=None):
+        """
+        Score every vector, or only those in rows (sorted row numbers) when given.
+
+        excluded (sorted row numbers) are scored as the worst possible match and
+        dropped from the results; it only applies when rows is None.
+        """
+        best_idx, best_val = None, None
+        total = len(self.vectors) if rows is None else len(rows)
+        worst = -np.inf if self.largest else np.inf
+        for start in range(0, total, self.block_size):
+            stop = start + self.block_size
+            if rows is None:
+                block, sq = self.vectors[start:stop], self.sq_norms[start:stop] if self.sq_norms is not None else None
+            else:
+                block_rows = rows[start:stop]
+                block, sq = self.vectors[block_rows], self.sq_norms[block_rows] if self.sq_norms is not None else None
+            scores = self._score(queries, block, sq)
+            if excluded is not None and rows is None:
+                lo, hi = np.searchsorted(excluded, [start, stop])
+                scores[:, excluded[lo:hi] - start] = worst
+            idx, val = _top_k(scores, k, self.largest)
+            idx = idx + start if rows is None else rows[idx + start]
+            if best_idx is None:
+                best_idx, best_val = idx, val
+            else:
+                merged_idx = np.concatenate([best_idx, idx], axis=1)
+                order, best_val = _top_k(np.concatenate([best_val, val], axis=1), k, self.largest)
+                best_idx = np.take_along_axis(merged_idx, order, axis=1)
+        if best_idx is None:
+            return [[] for _ in queries]
+        if excluded is not None and len(excluded):
+            return [[(r, s) for r, s in zip(i, v) if s != worst] for i, v in zip(best_idx, best_val)]
+        return [list(zip(i, v)) for i, v in zip(best_idx, best_val)]
+
+    def _search_ivf(self, queries, k: int, allowed=None, excluded=None):
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes, _ = _top_k(_centroid_distances(queries, self.centroids), nprobe, largest=False)
+        results = []
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists])
+            if excluded is not None and allowed is None:
+                rows = rows[~np.isin(rows, excluded)]
+            if allowed is not None:
+                rows = rows[allowed[rows]]
+                if len(rows) < k:
+                    # Too few allowed vectors near the query: search all allowed vectors instead
+                    results.extend(self._search_exact(query[None, :], k, np.flatnonzero(allowed)))
+                    continue
+            if len(rows) == 0:
+                results.append([])
+                continue
+            sq = self.sq_norms[rows] if self.sq_norms is not None else None
+            idx, val = _top_k(self._score(query[None, :], self.vectors[rows], sq), k, self.largest)
+            results.append(list(zip(rows[idx[0]], val[0])))
+        return results
+
+    def rows(self, ids):
+        """Sorted rows of those ids that are in the index."""
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind="stable")
+        ids = np.asarray(ids).astype(self.ids.dtype)
+        if len(self.ids) == 0 or len(ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.ids, ids, sorter=self._id_order), len(self.ids) - 1)
+        rows = self._id_order[pos]
+        return np.unique(rows[self.ids[rows] == ids])
+
+    def find_neighbors(self, queries, num_neighbors: int = 10, allowed=None, excluded=None,
+                       return_vectors: bool = False):
+        """
+        Return one list of Neighbor per query, closest first.
+
+        allowed is an optional boolean mask over the rows (the store order the
+        backend was built from); only those vectors are scored. excluded is an
+        optional sorted array of rows never to return, e.g. records deleted
+        since the index was built; it costs next to nothing when small.
+        return_vectors fills in each neighbor's feature_vector (normalized for
+        cosine distance).
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        if self.distance_measure == COSINE_DISTANCE:
+            queries = self._normalize(queries)
+        if len(self.vectors) == 0 or num_neighbors <= 0:
+            return [[] for _ in queries]
+        if excluded is not None and len(excluded) == 0:
+            excluded = None
+        if allowed is not None:
+            if len(allowed) != len(self.ids):
+                raise ValueError("allowed mask does not match the indexed vectors")
+            if excluded is not None:
+                allowed = allowed.copy()
+                allowed[excluded] = False
+            if self.mode == "ivf":
+                hits = self._search_ivf(queries, num_neighbors, allowed)
+            else:
+                hits = self._search_exact(queries, num_neighbors, np.flatnonzero(allowed))
+        elif self.mode == "ivf":
+            hits = self._search_ivf(queries, num_neighbors, excluded=excluded)
+        else:
+            hits = self._search_exact(queries, num_neighbors, excluded=excluded)
+        if return_vectors:
+            return [
+                [Neighbor(str(self.ids[row]), float(score), self.vectors[row]) for row, score in query_hits]
+                for query_hits in hits
+            ]
+        return [
+            [Neighbor(id=str(self.ids[row]), distance=float(score)) for row, score in query_hits]
+            for query_hits in hits
+        ]
+
+    @classmethod
+    def from_store(cls, store, **kwargs):
+        """Build the backend from the ids and vectors of a TextStore or MmapCorpusStore."""
+        if store.vectors is None:
+            raise ValueError("Embeddings corpus has no vectors to build a local index from")
+        return cls(store.ids, store.vectors, **kwargs)
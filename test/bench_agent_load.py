@@ -0,0 +1,299 @@
+"""
+Concurrent load test of root_agent with a scripted model and stub backends.
+
+Conversations arrive at --rate per second (Poisson arrivals; 0 starts them
+all at once), at most --concurrency run at a time, and each replays --turns
+operator prompts through an ADK Runner. The LLM of both the root agent and
+BQQueryAgent is replaced by ScriptedLlm, which waits --llm-latency seconds
+per call and emits the tool calls the real model makes for that kind of
+prompt: retrieval for incident questions, the BQQueryAgent AgentTool (and
+then execute_bq_query) for counts and trends. Vector search runs on a
+synthetic corpus with the fake embedding model and index endpoint, and
+BigQuery is a stub client with --bq-latency per job.
+
+Reports throughput, per-turn latency percentiles, event-loop blocking time
+(how late a 10 ms ticker woke up, i.e. time the loop spent in synchronous
+code) and memory growth per session.
+
+    python test/bench_agent_load.py --conversations 200 --concurrency 50 --rate 20
+    python test/bench_agent_load.py --prompts prompts.txt --llm-latency 1.0 --bq-latency 1.5
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+from typing import AsyncGenerator
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("BACKEND_WARM_UP", "0")
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import types
+
+TABLE = "`vodaf-aida25lcpm-206.network_data.network_data`"
+ANALYTICS_WORDS = ("how many", "count", "trend", "most common", "top ", "per month", "breakdown", "statistics")
+DEFAULT_PROMPTS = [
+    "DNS resolution failures in Manchester since this morning, what fixed it last time?",
+    "4G service outage with high packet loss in London",
+    "VoIP call drops in Glasgow, intermittent connectivity",
+    "What is the usual root cause of SMS delivery delay?",
+    "Billing portal access errors with authentication failures",
+    "Broadband performance degradation in Leeds, elevated latency",
+    "How many critical incidents did we have last month?",
+    "What are the most common root causes for 4G outages?",
+    "Show the trend of DNS resolution failures per month",
+    "Count incidents by severity for VoIP call drops",
+    "INC-1042 details and resolution steps",
+    "SSL certificate expired on the billing portal, how many times has this happened and how was it fixed?",
+]
+ANALYTICS_QUERIES = [
+    f"SELECT severity, COUNT(*) AS count FROM {TABLE} WHERE timestamp >= '2024-06-01' GROUP BY severity",
+    f"SELECT root_cause, COUNT(*) AS count FROM {TABLE} WHERE service_impact = '4G Service Outage' "
+    f"GROUP BY root_cause ORDER BY count DESC LIMIT 5",
+    f"SELECT DATE_TRUNC(DATE(timestamp), MONTH) AS month, COUNT(*) AS count FROM {TABLE} "
+    f"WHERE service_impact = 'DNS Resolution Failure' GROUP BY month ORDER BY month",
+]
+
+
+def is_analytics(prompt: str) -> bool:
+    return any(word in prompt.lower() for word in ANALYTICS_WORDS)
+
+
+def root_plan(prompt: str) -> list:
+    """Tool calls the root agent makes for a prompt, in order: (name, args)."""
+    calls = []
+    if not is_analytics(prompt) or "fixed" in prompt.lower():
+        if len(prompt.split()) > 8:
+            facets = [prompt, prompt.split(",")[0], "root cause " + prompt.split()[0]]
+            calls.append(("retrieve_context_for_queries", {"queries": facets, "num_neighbors": 10}))
+        else:
+            calls.append(("retrieve_context_from_query", {"query": prompt, "num_neighbors": 10}))
+    if is_analytics(prompt):
+        calls.append(("BQQueryAgent", {"request": prompt}))
+    return calls
+
+
+def analytics_plan(prompt: str) -> list:
+    return [("execute_bq_query", {"query": ANALYTICS_QUERIES[len(prompt) % len(ANALYTICS_QUERIES)]})]
+
+
+def turn_state(contents):
+    """(prompt, tool responses so far) of the turn the request belongs to."""
+    responses = []
+    for content in reversed(contents or []):
+        parts = content.parts or []
+        found = [p.function_response for p in parts if p.function_response is not None]
+        if found:
+            responses.extend(found)
+            continue
+        texts = [p.text for p in parts if p.text]
+        if content.role == "user" and texts:
+            return " ".join(texts), responses
+    return "", responses
+
+
+class ScriptedLlm(BaseLlm):
+    """Stand-in for Gemini: fixed latency per call, tool calls chosen from the prompt, then an answer."""
+
+    model: str = "scripted"
+    plan: str = "root"
+    latency: float = 0.0
+    answer_chars: int = 1200
+    calls: int = 0
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        prompt, responses = turn_state(llm_request.contents)
+        calls = root_plan(prompt) if self.plan == "root" else analytics_plan(prompt)
+        if len(responses) < len(calls):
+            name, args = calls[len(responses)]
+            part = types.Part(function_call=types.FunctionCall(name=name, args=args))
+        else:
+            evidence = " ".join(json.dumps(r.response, default=str) for r in responses)
+            part = types.Part(text=("Resolution plan: " + evidence)[:self.answer_chars])
+        prompt_chars = sum(len(p.text or "") for c in llm_request.contents or [] for p in c.parts or [])
+        usage = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_chars // 4, candidates_token_count=len(part.text or "") // 4 + 1
+        )
+        yield LlmResponse(content=types.Content(role="model", parts=[part]), usage_metadata=usage)
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def install_stubs(args):
+    """Point the retrieval tools and the analytics client at local stand-ins."""
+    from backend import tools
+    from backend.embedding_cache import EmbeddingCache
+    from backend.text_store import TextStore
+    from backend.vector_search import RemoteSearchBackend
+    from backend.subagents.analytics_agent import bq_client
+    from fakes import FakeEmbeddingModel, FakeIndexEndpoint, StubBigQueryClient
+    from synthetic import make_embedded_corpus
+
+    model = FakeEmbeddingModel(args.dim, latency=args.embed_latency)
+    ids, texts, vectors = make_embedded_corpus(args.corpus, model)
+    tools.corpus_refresher.set(None)
+    tools.use_corpus(
+        TextStore(ids, texts, vectors),
+        RemoteSearchBackend(FakeIndexEndpoint(ids, vectors, latency=args.search_latency), "load-test"),
+    )
+    tools.embedding_model_resource.set(model)
+    tools.embedding_cache_resource.set(EmbeddingCache("fake", None, 1024))
+    tools.get_metadata_index()
+    tools.get_lexical_index()
+
+    rows = [{"severity": s, "count": c} for s, c in (("Critical", 42), ("High", 97), ("Medium", 211), ("Low", 318))]
+    bq_client.set_bq_client(StubBigQueryClient(rows=rows, latency=args.bq_latency))
+    bq_client.ANALYTICS_BACKEND = "bigquery"
+    bq_client.ANALYTICS_ROLLUPS = False
+
+
+async def watch_loop(lags: list, stop: asyncio.Event, interval: float = 0.01):
+    """Record how late each interval-second sleep wakes up; the lateness is time the loop was blocked."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def conversation(runner, index, prompts, args, semaphore, turn_latencies, failures):
+    async with semaphore:
+        user_id = f"operator-{index}"
+        session = await runner.session_service.create_session(app_name=runner.app_name, user_id=user_id)
+        for prompt in prompts:
+            start = time.perf_counter()
+            answered = False
+            try:
+                message = types.Content(role="user", parts=[types.Part(text=prompt)])
+                async for event in runner.run_async(user_id=user_id, session_id=session.id, new_message=message):
+                    if event.is_final_response() and event.author == runner.agent.name:
+                        answered = True
+            except Exception as e:
+                failures.append(f"{type(e).__name__}: {e}")
+                continue
+            if answered:
+                turn_latencies.append(time.perf_counter() - start)
+            else:
+                failures.append("no final response")
+
+
+async def run_load(args, prompts):
+    from backend.agent import root_agent
+    from backend.subagents.analytics_agent import ANALYTICS_AGENT
+
+    root_llm = ScriptedLlm(plan="root", latency=args.llm_latency, answer_chars=args.answer_chars)
+    analytics_llm = ScriptedLlm(plan="analytics", latency=args.llm_latency, answer_chars=args.answer_chars)
+    root_agent.model = root_llm
+    ANALYTICS_AGENT.model = analytics_llm
+    runner = InMemoryRunner(agent=root_agent, app_name="load-test")
+
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    turn_latencies, failures, lags = [], [], []
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(lags, stop))
+
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    tasks = []
+    for index in range(args.conversations):
+        script = [rng.choice(prompts) for _ in range(args.turns)]
+        tasks.append(asyncio.create_task(
+            conversation(runner, index, script, args, semaphore, turn_latencies, failures)
+        ))
+        if args.rate > 0:
+            await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await watcher
+    rss_end = rss_mb()
+
+    return {
+        "elapsed": elapsed,
+        "turns": len(turn_latencies),
+        "failures": failures,
+        "latencies": turn_latencies,
+        "lags": lags,
+        "rss_start": rss_start,
+        "rss_end": rss_end,
+        "llm_calls": root_llm.calls + analytics_llm.calls,
+    }
+
+
+def load_prompts(path):
+    if not path:
+        return DEFAULT_PROMPTS
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            prompts.append(json.loads(line)["prompt"] if line.startswith("{") else line)
+    return prompts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20, help="conversations running at once")
+    parser.add_argument("--rate", type=float, default=10.0, help="new conversations per second (0 = all at once)")
+    parser.add_argument("--turns", type=int, default=3, help="prompts per conversation")
+    parser.add_argument("--prompts", help="file of recorded prompts: one per line, or JSONL with a 'prompt' field")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per model call")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per embedding request")
+    parser.add_argument("--search-latency", type=float, default=0.02, help="seconds per find_neighbors request")
+    parser.add_argument("--bq-latency", type=float, default=1.0, help="seconds per BigQuery job")
+    parser.add_argument("--answer-chars", type=int, default=1200)
+    parser.add_argument("--corpus", type=int, default=10_000, help="synthetic corpus records")
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show the tools' own output")
+    args = parser.parse_args()
+
+    install_stubs(args)
+    # The tools print a line per call; keep the report readable unless asked for them
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else open(os.devnull, "w")):
+        result = asyncio.run(run_load(args, load_prompts(args.prompts)))
+
+    latencies = np.asarray(result["latencies"]) * 1000
+    lags = np.asarray(result["lags"]) * 1000
+    elapsed = result["elapsed"]
+    print(f"{args.conversations} conversations x {args.turns} turns, concurrency {args.concurrency}, "
+          f"rate {args.rate}/s, in {elapsed:.1f}s")
+    print(f"  throughput      {result['turns'] / elapsed:8.2f} turns/s  ({result['llm_calls']} model calls)")
+    if len(latencies):
+        print(f"  turn latency    p50 {np.percentile(latencies, 50):8.0f} ms  p95 {np.percentile(latencies, 95):8.0f} ms"
+              f"  p99 {np.percentile(latencies, 99):8.0f} ms  max {latencies.max():8.0f} ms")
+    if len(lags):
+        blocked = lags.sum() / 1000
+        print(f"  loop blocked    {blocked:8.2f} s ({blocked / elapsed:.0%} of wall time)  "
+              f"p99 lag {np.percentile(lags, 99):6.1f} ms  max lag {lags.max():6.1f} ms")
+    growth = result["rss_end"] - result["rss_start"]
+    print(f"  memory          {result['rss_start']:.0f} -> {result['rss_end']:.0f} MB RSS, "
+          f"{growth * 1024 / max(args.conversations, 1):.1f} KB per session")
+    if result["failures"]:
+        print(f"  failures        {len(result['failures'])}, e.g. {result['failures'][0]}")
+
+
+if __name__ == "__main__":
+    main()
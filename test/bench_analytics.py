@@ -0,0 +1,86 @@
+"""
+Compare analytics query latency on BigQuery (a stub with job latency), on
+the local snapshot engines and from the incident rollup, over a synthetic
+network_data table.
+
+    python test/bench_analytics.py --rows 50000 --latency 1.5
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from backend.subagents.analytics_agent import bq_client
+from backend.subagents.analytics_agent.local_sql import LocalSQLBackend, sync_snapshot
+from backend.subagents.analytics_agent.rollups import IncidentRollup
+from fakes import StubBigQueryClient
+from synthetic import make_incident_rows
+
+TABLE = "`vodaf-aida25lcpm-206.network_data.network_data`"
+QUERIES = [
+    f"SELECT severity, COUNT(*) AS count FROM {TABLE} GROUP BY severity ORDER BY count DESC",
+    f"SELECT service_impact, COUNT(*) AS count FROM {TABLE} WHERE severity = 'Critical' GROUP BY service_impact",
+    f"SELECT root_cause, COUNT(*) AS count FROM {TABLE} WHERE timestamp >= '2024-06-01' GROUP BY root_cause",
+    f"SELECT COUNT(*) AS count FROM {TABLE} WHERE severity IN ('High', 'Critical') AND timestamp >= '2024-03-01'",
+]
+
+
+def time_queries(repeats):
+    timings = []
+    for _ in range(repeats):
+        for query in QUERIES:
+            start = time.perf_counter()
+            bq_client.run_query(query)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--latency", type=float, default=1.5, help="seconds per stub BigQuery job")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export = os.path.join(tmp, "export.parquet")
+        make_incident_rows(args.rows).to_parquet(export, index=False)
+
+        results = []
+        bq_client.ANALYTICS_ROLLUPS = False
+        bq_client.set_bq_client(StubBigQueryClient(latency=args.latency))
+        bq_client.ANALYTICS_BACKEND = "bigquery"
+        results.append(("bigquery (stub)", time_queries(1)))
+
+        bq_client.ANALYTICS_BACKEND = "local"
+        for name in ("network_data.parquet", "network_data.sqlite"):
+            snapshot = os.path.join(tmp, name)
+            sync_snapshot(snapshot, source=export)
+            backend = LocalSQLBackend(snapshot)
+            try:
+                bq_client.set_local_backend(backend)
+                bq_client.run_query(QUERIES[0])  # load the snapshot
+            except ImportError as e:
+                print(f"skipping {name}: {e}")
+                continue
+            results.append((f"local {os.path.splitext(name)[1][1:]}", time_queries(args.repeats)))
+
+        rollup = IncidentRollup()
+        start = time.perf_counter()
+        rollup.refresh(full=True)
+        print(f"rollup built from {len(rollup)} incidents in {time.perf_counter() - start:.2f}s")
+        bq_client.set_rollup(rollup)
+        bq_client.ANALYTICS_ROLLUPS = True
+        results.append(("rollup", time_queries(args.repeats)))
+
+    print(f"\n{'backend':<18}{'median ms':>10}{'max ms':>10}")
+    for name, timings in results:
+        print(f"{name:<18}{statistics.median(timings) * 1000:>10.3f}{max(timings) * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
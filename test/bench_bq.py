@@ -0,0 +1,57 @@
+"""
+Compare BigQuery execution strategies against a local stub client.
+
+  per-call client   a new client for every statement (the old execute_bq_query)
+  shared client     one process-wide client, statements run one after another
+  concurrent        one shared client, statements submitted together (execute_bq_queries)
+
+    python test/bench_bq.py --statements 4 --latency 0.8 --create-latency 0.3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from backend.subagents.analytics_agent import bq_client
+from fakes import StubBigQueryClient
+
+QUERY = "SELECT severity, COUNT(*) AS count FROM `vodaf-aida25lcpm-206.network_data.network_data` GROUP BY severity"
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--statements", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.8, help="seconds per query job")
+    parser.add_argument("--create-latency", type=float, default=0.3, help="seconds to create a client")
+    args = parser.parse_args()
+    queries = [QUERY] * args.statements
+
+    def per_call():
+        for query in queries:
+            client = StubBigQueryClient(latency=args.latency, create_latency=args.create_latency)
+            [dict(row) for row in client.query(query).result()]
+
+    bq_client.set_bq_client(StubBigQueryClient(latency=args.latency, create_latency=args.create_latency))
+
+    def shared():
+        for query in queries:
+            bq_client.run_query(query)
+
+    def concurrent():
+        results = bq_client.run_queries(queries)
+        assert all("rows" in r for r in results)
+
+    for name, fn in (("per-call client", per_call), ("shared client", shared), ("concurrent", concurrent)):
+        print(f"{name:<16} {timed(fn):7.2f}s for {args.statements} statements")
+
+
+if __name__ == "__main__":
+    main()
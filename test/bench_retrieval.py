@@ -0,0 +1,217 @@
+"""
+Offline benchmark of the retrieval tools in backend/tools.py.
+
+Runs against a synthetic incident corpus with a fake embedding model and a
+fake Matching Engine endpoint (or the local backend), each with injectable
+latency, so results don't depend on the network. For every corpus size it
+times:
+
+    embed        embed_queries() for one query, with the embedding cache off
+    neighbors    find_neighbors() for one query vector
+    text_join    neighbor text lookup and context assembly (_build_context)
+    end_to_end   retrieve_context_from_query(), with the result cache off
+
+and reports throughput, p50/p95/p99 latency and peak RSS. Each size runs in
+a fresh process so peak RSS is per size.
+
+    python test/bench_retrieval.py
+    python test/bench_retrieval.py --sizes 10000 100000 --dim 768 --embed-latency 0.05 --search-latency 0.02
+    python test/bench_retrieval.py --save-baseline retrieval_baseline.json
+    python test/bench_retrieval.py --baseline retrieval_baseline.json --tolerance 0.2
+
+With --baseline, any stage whose p50 or p95 is more than tolerance slower
+than the baseline is reported and the exit status is 1. Baselines are only
+comparable on the same machine with the same options.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+STAGES = ("embed", "neighbors", "text_join", "end_to_end")
+RESULT_PREFIX = "BENCH_RESULT "
+
+
+def make_queries(n, seed=0):
+    """Operator-style searches over the synthetic vocabulary."""
+    from synthetic import LOCATIONS, ROOT_CAUSES, SERVICES, SYMPTOMS
+
+    rng = random.Random(seed)
+    shapes = [
+        lambda: f"{rng.choice(SERVICES)} {rng.choice(LOCATIONS)}",
+        lambda: f"{rng.choice(SYMPTOMS)} in {rng.choice(LOCATIONS)}",
+        lambda: f"{rng.choice(ROOT_CAUSES)}",
+        lambda: f"{rng.choice(SERVICES)} {rng.choice(SYMPTOMS).lower()}",
+    ]
+    return [rng.choice(shapes)() for _ in range(n)]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def measure(fn, items):
+    """Latency percentiles in ms and throughput in calls/s of fn over items."""
+    timings = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        timings.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    ms = np.asarray(timings) * 1000
+    return {
+        "calls": len(timings),
+        "per_second": len(timings) / elapsed if elapsed else 0.0,
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+    }
+
+
+def run_size(args):
+    """Benchmark one corpus size in this process; returns the result dict."""
+    from backend import tools
+    from backend.embedding_cache import EmbeddingCache
+    from backend.result_cache import ResultCache
+    from backend.text_store import TextStore
+    from backend.vector_search import DOT_PRODUCT_DISTANCE, LocalSearchBackend, RemoteSearchBackend
+    from fakes import FakeEmbeddingModel, FakeIndexEndpoint
+    from synthetic import make_embedded_corpus
+
+    setup = {}
+    model = FakeEmbeddingModel(args.dim, latency=args.embed_latency)
+    start = time.perf_counter()
+    ids, texts, vectors = make_embedded_corpus(args.size, model)
+    store = TextStore(ids, texts, vectors)
+    setup["corpus_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if args.backend == "local":
+        backend = LocalSearchBackend(ids, vectors, distance_measure=DOT_PRODUCT_DISTANCE)
+    else:
+        backend = RemoteSearchBackend(FakeIndexEndpoint(ids, vectors, latency=args.search_latency), "bench")
+    setup["index_s"] = time.perf_counter() - start
+
+    # Everything the tools would load from the cloud or disk is injected; caches are off
+    tools.corpus_refresher.set(None)
+    tools.use_corpus(store, backend)
+    tools.embedding_model_resource.set(model)
+    tools.embedding_cache_resource.set(EmbeddingCache("fake", None, 0))
+    tools.result_cache = ResultCache(0)
+    tools.HYBRID_SEARCH = args.hybrid
+    start = time.perf_counter()
+    tools.get_metadata_index()
+    if args.hybrid:
+        tools.get_lexical_index()
+    setup["keyword_indexes_s"] = time.perf_counter() - start
+
+    queries = make_queries(args.queries)
+    embeddings = [tools.embed_queries([q])[0] for q in queries]
+    neighbor_ids = [tools.merge_neighbor_ids(backend.find_neighbors([e], args.neighbors)) for e in embeddings]
+
+    results = {
+        "embed": measure(lambda q: tools.embed_queries([q]), queries),
+        "neighbors": measure(lambda e: backend.find_neighbors([e], args.neighbors), embeddings),
+        "text_join": measure(lambda n: tools._build_context(store, n), neighbor_ids),
+        "end_to_end": measure(lambda q: tools.retrieve_context_from_query(q, args.neighbors), queries),
+    }
+    return {"size": args.size, "setup": setup, "stages": results, "peak_rss_mb": peak_rss_mb()}
+
+
+def run_child(args, size):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--one", str(size),
+        "--dim", str(args.dim), "--queries", str(args.queries), "--neighbors", str(args.neighbors),
+        "--backend", args.backend, "--embed-latency", str(args.embed_latency),
+        "--search-latency", str(args.search_latency),
+    ] + ([] if args.hybrid else ["--no-hybrid"])
+    out = subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"size {size} failed:\n{out.stderr[-2000:]}")
+    line = next(l for l in reversed(out.stdout.splitlines()) if l.startswith(RESULT_PREFIX))
+    return json.loads(line[len(RESULT_PREFIX):])
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing stages slower than the baseline by more than tolerance."""
+    regressions = []
+    previous = {r["size"]: r for r in baseline["results"]}
+    for result in results:
+        base = previous.get(result["size"])
+        if base is None:
+            continue
+        for stage in STAGES:
+            for stat in ("p50", "p95"):
+                now, then = result["stages"][stage][stat], base["stages"][stage][stat]
+                if then > 0 and now > then * (1 + tolerance):
+                    regressions.append(
+                        f"{result['size']:>9} {stage:<11} {stat} {then:.3f} -> {now:.3f} ms (+{now / then - 1:.0%})"
+                    )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=128, help="embedding dimension (text-embedding-004 uses 768)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--neighbors", type=int, default=10)
+    parser.add_argument("--backend", choices=("remote", "local"), default="remote",
+                        help="fake Matching Engine endpoint, or the in-process local backend")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per embedding request")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="seconds per find_neighbors request")
+    parser.add_argument("--no-hybrid", dest="hybrid", action="store_false", help="vector search only")
+    parser.add_argument("--baseline", help="JSON file from --save-baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--one", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one is not None:
+        args.size = args.one
+        print(RESULT_PREFIX + json.dumps(run_size(args)))
+        return
+
+    results = []
+    print(f"{'records':>9} {'stage':<11} {'calls/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for size in args.sizes:
+        result = run_child(args, size)
+        results.append(result)
+        for stage in STAGES:
+            s = result["stages"][stage]
+            print(f"{size:>9} {stage:<11} {s['per_second']:>10.1f} {s['p50']:>9.3f} {s['p95']:>9.3f} {s['p99']:>9.3f}")
+        setup = ", ".join(f"{k[:-2]} {v:.1f}s" for k, v in result["setup"].items())
+        print(f"{size:>9} peak RSS {result['peak_rss_mb']:.0f} MB; setup: {setup}")
+
+    options = {k: getattr(args, k) for k in ("dim", "queries", "neighbors", "backend", "embed_latency",
+                                             "search_latency", "hybrid")}
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"options": options, "results": results}, f, indent=2)
+        print(f"\nbaseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("options") != options:
+            print(f"\nwarning: baseline options {baseline.get('options')} differ from {options}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nregressions over {args.tolerance:.0%}:")
+            print("\n".join(regressions))
+            sys.exit(1)
+        print(f"\nno stage slower than the baseline by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Measure backend cold start: import time, warm-up time and time to first query.
+
+Each run is a fresh interpreter so nothing is cached in-process. The first
+query runs against whatever the environment configures (.env, or e.g.
+VECTOR_SEARCH_BACKEND=local with a local EMBEDDINGS_FILE).
+
+    python test/bench_startup.py --runs 3
+    python test/bench_startup.py --module backend.agent --query "DNS Resolution Failure"
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CHILD = """
+import importlib, json, sys, time
+module, query, warm = sys.argv[1], sys.argv[2], sys.argv[3] == "1"
+t0 = time.perf_counter()
+importlib.import_module(module)
+t1 = time.perf_counter()
+import backend.tools as tools
+if warm:
+    tools.warm_up(background=False)
+t2 = time.perf_counter()
+result = tools.retrieve_context_from_query(query) if query else ""
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "warm_up": t2 - t1, "first_query": t3 - t2,
+                  "error": result.startswith("Error")}))
+"""
+
+
+def run_once(module, query, warm):
+    env = dict(os.environ, BACKEND_WARM_UP="0")
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, module, query, "1" if warm else "0"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.tools")
+    parser.add_argument("--query", default="DNS Resolution Failure", help='"" to skip the first query')
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    for warm in (False, True):
+        runs = [run_once(args.module, args.query, warm) for _ in range(args.runs)]
+        label = "warm_up() then query" if warm else "cold first query"
+        print(f"{label}:")
+        for key in ("import", "warm_up", "first_query"):
+            values = [r[key] for r in runs]
+            print(f"  {key:<12} median {statistics.median(values):8.3f}s  max {max(values):8.3f}s")
+        if any(r["error"] for r in runs):
+            print("  note: the first query returned an error; check the backend configuration")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark neighbor text lookup against corpus size.
+
+Compares the old per-neighbor DataFrame mask scan with TextStore.lookup_many
+and with the compact mmap store (open time and lookup time).
+
+    python test/bench_text_store.py
+    python test/bench_text_store.py --sizes 10000 100000 1000000 --neighbors 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from backend.corpus_store import MmapCorpusStore, convert_jsonl
+from backend.text_store import TextStore
+from synthetic import make_corpus
+
+
+def mask_scan(df, ids):
+    texts = []
+    for id_ in ids:
+        match = df[df['id'] == int(id_)]
+        if not match.empty:
+            texts.append(match['text'].values[0])
+    return texts
+
+
+def time_per_call(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--neighbors", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--scan-repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'build ms':>10} {'mask scan us':>14} {'lookup_many us':>15} {'speedup':>9}"
+          f" {'mmap open ms':>13} {'mmap lookup us':>15}")
+    for size in args.sizes:
+        df = make_corpus(size)
+        rng = random.Random(size)
+        ids = [rng.randrange(size) for _ in range(args.neighbors)]
+
+        start = time.perf_counter()
+        store = TextStore.from_dataframe(df)
+        build = time.perf_counter() - start
+
+        assert store.lookup_many(ids) == mask_scan(df, ids)
+        scan = time_per_call(lambda: mask_scan(df, ids), args.scan_repeats)
+        lookup = time_per_call(lambda: store.lookup_many(ids), args.repeats)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "embeddings_text.json")
+            with open(source, "w") as f:
+                for id_, text in zip(df["id"], df["text"]):
+                    f.write(json.dumps({"id": int(id_), "text": text}) + "\n")
+            convert_jsonl(source, os.path.join(tmp, "store"))
+            start = time.perf_counter()
+            mapped = MmapCorpusStore(os.path.join(tmp, "store"))
+            mmap_open = time.perf_counter() - start
+            assert mapped.lookup_many(ids) == store.lookup_many(ids)
+            mmap_lookup = time_per_call(lambda: mapped.lookup_many(ids), args.repeats)
+            mapped.close()
+
+        print(f"{size:>10} {build * 1e3:>10.1f} {scan * 1e6:>14.1f} {lookup * 1e6:>15.2f} {scan / lookup:>8.0f}x"
+              f" {mmap_open * 1e3:>13.2f} {mmap_lookup * 1e6:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
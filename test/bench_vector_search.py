@@ -0,0 +1,55 @@
+"""
+Benchmark the local vector search backend: exact vs IVF latency and IVF recall.
+
+    python test/bench_vector_search.py --rows 100000 --dim 768
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from backend.vector_search import LocalSearchBackend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--neighbors", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Clustered vectors so IVF partitions mean something
+    centers = rng.standard_normal((64, args.dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, 64, args.rows)] + 0.5 * rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+    queries = vectors[rng.choice(args.rows, args.queries, replace=False)] + 0.1 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    ids = np.arange(args.rows)
+
+    exact = LocalSearchBackend(ids, vectors)
+    start = time.perf_counter()
+    truth = [exact.find_neighbors([q], args.neighbors)[0] for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1e3 / args.queries
+    print(f"exact      {exact_ms:8.2f} ms/query  recall 1.000")
+
+    start = time.perf_counter()
+    ivf = LocalSearchBackend(ids, vectors, mode="ivf")
+    print(f"ivf build  {time.perf_counter() - start:8.2f} s ({len(ivf.centroids)} partitions)")
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        start = time.perf_counter()
+        approx = [ivf.find_neighbors([q], args.neighbors)[0] for q in queries]
+        ivf_ms = (time.perf_counter() - start) * 1e3 / args.queries
+        recall = np.mean([
+            len({n.id for n in a} & {n.id for n in t}) / max(len(t), 1) for a, t in zip(approx, truth)
+        ])
+        print(f"ivf np={nprobe:<3} {ivf_ms:8.2f} ms/query  recall {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
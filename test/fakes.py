@@ -0,0 +1,170 @@
+"""
+Local stand-ins for the cloud services the backend calls, with injectable latency.
+"""
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+
+class StubRowIterator:
+    def __init__(self, rows, page_size=None):
+        self._rows = rows
+        self.total_rows = len(rows)
+        self.page_size = page_size or 1000
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def to_arrow_iterable(self):
+        import pyarrow as pa
+
+        for start in range(0, len(self._rows), self.page_size):
+            yield pa.RecordBatch.from_pylist(self._rows[start:start + self.page_size])
+
+
+class StubQueryJob:
+    def __init__(self, client, query, dry_run=False):
+        self.client = client
+        self.query = query
+        self.dry_run = dry_run
+        # A dry run reports its estimate straight away; a real job once its result is read
+        self.total_bytes_processed = client.bytes_for(query) if dry_run else None
+        self.total_bytes_billed = None
+        self.cache_hit = False
+
+    def result(self, page_size=None):
+        if self.dry_run:
+            raise RuntimeError("a dry-run job has no result")
+        time.sleep(self.client.latency)
+        self.total_bytes_processed = self.total_bytes_billed = self.client.bytes_for(self.query)
+        return StubRowIterator(self.client.rows_for(self.query), page_size)
+
+
+class StubBigQueryClient:
+    """
+    Answers every query with canned rows after `latency` seconds.
+
+    create_latency is charged once, when the stub is constructed, to model
+    credential discovery and connection setup of a real bigquery.Client.
+    Dry runs (job_config.dry_run) return immediately with the bytes that
+    scanned_bytes reports for the statement: a number, or a function of it.
+    """
+
+    def __init__(self, rows=None, latency: float = 0.05, create_latency: float = 0.0, scanned_bytes=10 * 1024 ** 2):
+        time.sleep(create_latency)
+        self.rows = rows if rows is not None else [{"severity": "Critical", "count": 42}]
+        self.latency = latency
+        self.scanned_bytes = scanned_bytes
+        self.queries = []
+        self.dry_runs = []
+        self._lock = threading.Lock()
+
+    def rows_for(self, query):
+        return [dict(row) for row in self.rows]
+
+    def bytes_for(self, query):
+        return self.scanned_bytes(query) if callable(self.scanned_bytes) else self.scanned_bytes
+
+    def query(self, query, job_config=None):
+        dry_run = bool(getattr(job_config, "dry_run", False))
+        with self._lock:
+            (self.dry_runs if dry_run else self.queries).append(query)
+        return StubQueryJob(self, query, dry_run)
+
+
+_WORD = re.compile(r"[a-z]+")
+
+
+class FakeEmbedding:
+    def __init__(self, values):
+        self.values = values
+
+
+class FakeEmbeddingModel:
+    """
+    Deterministic stand-in for TextEmbeddingModel.
+
+    A text embeds to the normalized sum of one fixed random vector per word
+    (digits are ignored), so texts sharing words land close together and
+    synthetic corpora can be embedded in bulk with phrase_vector(). Each
+    get_embeddings call sleeps latency seconds plus per_text_latency per
+    text and, like the real model, refuses more than max_batch texts.
+    """
+
+    def __init__(self, dim: int = 768, latency: float = 0.0, per_text_latency: float = 0.0, max_batch: int = 250):
+        self.dim = dim
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.max_batch = max_batch
+        self.calls = 0
+        self.texts = 0
+        self._words = {}
+        self._lock = threading.Lock()
+
+    def word_vector(self, word):
+        vector = self._words.get(word)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(word.encode()))
+            vector = self._words[word] = rng.standard_normal(self.dim).astype(np.float32)
+        return vector
+
+    def phrase_vector(self, text):
+        """Unnormalized sum of the word vectors of text."""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            vector += self.word_vector(word)
+        return vector
+
+    def embed(self, text):
+        vector = self.phrase_vector(text)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get_embeddings(self, texts):
+        if len(texts) > self.max_batch:
+            raise ValueError(f"At most {self.max_batch} texts per request, got {len(texts)}")
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        with self._lock:
+            self.calls += 1
+            self.texts += len(texts)
+        return [FakeEmbedding(self.embed(text).tolist()) for text in texts]
+
+
+class MatchNeighbor:
+    __slots__ = ("id", "distance", "feature_vector")
+
+    def __init__(self, id, distance, feature_vector=None):
+        self.id = id
+        self.distance = distance
+        self.feature_vector = feature_vector
+
+
+class FakeIndexEndpoint:
+    """
+    Stand-in for MatchingEngineIndexEndpoint: exact dot-product search over
+    the given vectors after latency seconds per request. Restricts are
+    accepted and ignored.
+    """
+
+    def __init__(self, ids, vectors, latency: float = 0.0):
+        from backend.vector_search import DOT_PRODUCT_DISTANCE, LocalSearchBackend
+
+        self._search = LocalSearchBackend(ids, vectors, distance_measure=DOT_PRODUCT_DISTANCE)
+        self.latency = latency
+        self.calls = 0
+
+    def find_neighbors(self, deployed_index_id, queries, num_neighbors=10, filter=None, numeric_filter=None,
+                       return_full_datapoint=False):
+        time.sleep(self.latency)
+        self.calls += 1
+        # The real endpoint returns string ids and list vectors
+        return [
+            [
+                MatchNeighbor(str(n.id), n.distance, n.feature_vector.tolist() if return_full_datapoint else None)
+                for n in neighbors
+            ]
+            for neighbors in self._search.find_neighbors(queries, num_neighbors, return_vectors=return_full_datapoint)
+        ]
@@ -0,0 +1,126 @@
+import random
+
+import numpy as np
+import pandas as pd
+
+SEVERITIES = ["Low", "Medium", "High", "Critical"]
+SERVICES = [
+    "4G Service Outage",
+    "DNS Resolution Failure",
+    "Billing Portal Access",
+    "VoIP Call Drops",
+    "Broadband Performance Degradation",
+    "SMS Delivery Delay",
+]
+LOCATIONS = ["Manchester", "London", "Glasgow", "Birmingham", "Leeds", "Cardiff", "Bristol"]
+SYMPTOMS = ["High packet loss", "Intermittent connectivity", "Elevated latency", "Authentication failures"]
+ROOT_CAUSES = [
+    "Fibre cut due to construction",
+    "SIP trunk congestion",
+    "SSL certificate expired",
+    "BGP session flapping on core router",
+    "DNS server capacity exceeded",
+]
+RESOLUTIONS = [
+    "Restarted authentication service and cleared application cache.",
+    "Rerouted traffic through backup link and dispatched field engineers.",
+    "Renewed certificate and restarted load balancers.",
+    "Reset BGP sessions and verified routing table restoration.",
+    "Added DNS capacity and optimised cache settings.",
+]
+
+
+def make_incident_text(i, rng):
+    """Build one corpus text in the same shape as embeddings_text.json records."""
+    service = rng.choice(SERVICES)
+    return " | ".join([
+        f"Incident ID: INC-{1000 + i}",
+        f"Timestamp: 2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+        f"Severity: {rng.choice(SEVERITIES)}",
+        f"Service Impact: {service}",
+        f"Description: {service} detected. {rng.choice(SYMPTOMS)} observed in {rng.choice(LOCATIONS)}.",
+        f"Resolution Steps: {rng.choice(RESOLUTIONS)}",
+        f"Root Cause: {rng.choice(ROOT_CAUSES)}",
+    ])
+
+
+def make_corpus(n, seed=0):
+    """Return a DataFrame with the id/text columns of a synthetic n-record corpus."""
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "id": np.arange(n, dtype=np.int64),
+        "text": [make_incident_text(i, rng) for i in range(n)],
+    })
+
+
+def make_incident_rows(n, seed=0):
+    """Return a DataFrame shaped like the BigQuery network_data table."""
+    rng = random.Random(seed)
+    start = pd.Timestamp("2024-01-01")
+    rows = []
+    for i in range(n):
+        service = rng.choice(SERVICES)
+        rows.append({
+            "incident_id": f"INC-{1000 + i}",
+            "timestamp": start + pd.Timedelta(minutes=rng.randint(0, 366 * 24 * 60)),
+            "severity": rng.choice(SEVERITIES),
+            "service_impact": service,
+            "incident_description": f"{service} detected. {rng.choice(SYMPTOMS)} observed in {rng.choice(LOCATIONS)}.",
+            "resolution_steps": rng.choice(RESOLUTIONS),
+            "root_cause": rng.choice(ROOT_CAUSES),
+        })
+    return pd.DataFrame(rows)
+
+
+def make_embedded_corpus(n, model, seed=0, noise=0.05, chunk_size=100_000):
+    """
+    Return (ids, texts, vectors) of a synthetic n-record corpus embedded with a FakeEmbeddingModel.
+
+    Records are drawn from the same vocabularies as make_incident_text, and each
+    vector is what model.embed() gives for its text (plus a little noise so
+    records built from the same choices don't tie), computed from per-phrase
+    vectors so a million records embed in seconds.
+    """
+    rng = np.random.default_rng(seed)
+    fields = {
+        "severity": SEVERITIES,
+        "service": SERVICES,
+        "symptom": SYMPTOMS,
+        "location": LOCATIONS,
+        "resolution": RESOLUTIONS,
+        "root_cause": ROOT_CAUSES,
+    }
+    choice = {name: rng.integers(0, len(values), n) for name, values in fields.items()}
+    months, days = rng.integers(1, 13, n), rng.integers(1, 29, n)
+    hours, minutes = rng.integers(0, 24, n), rng.integers(0, 60, n)
+    texts = [
+        " | ".join([
+            f"Incident ID: INC-{1000 + i}",
+            f"Timestamp: 2024-{months[i]:02d}-{days[i]:02d} {hours[i]:02d}:{minutes[i]:02d}:00",
+            f"Severity: {SEVERITIES[choice['severity'][i]]}",
+            f"Service Impact: {SERVICES[choice['service'][i]]}",
+            f"Description: {SERVICES[choice['service'][i]]} detected. {SYMPTOMS[choice['symptom'][i]]} "
+            f"observed in {LOCATIONS[choice['location'][i]]}.",
+            f"Resolution Steps: {RESOLUTIONS[choice['resolution'][i]]}",
+            f"Root Cause: {ROOT_CAUSES[choice['root_cause'][i]]}",
+        ])
+        for i in range(n)
+    ]
+
+    # The words every record shares, then each field's phrases; the service is named twice
+    template = model.phrase_vector("Incident ID Timestamp Severity Service Impact Description detected observed in "
+                                   "Resolution Steps Root Cause")
+    phrases = {name: np.stack([model.phrase_vector(v) for v in values]) for name, values in fields.items()}
+    weights = {"service": 2.0}
+    vectors = np.empty((n, model.dim), dtype=np.float32)
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        block = np.repeat(template[None, :], end - start, axis=0)
+        for name, table in phrases.items():
+            block += weights.get(name, 1.0) * table[choice[name][start:end]]
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        if noise:
+            block += noise * rng.standard_normal(block.shape).astype(np.float32) / np.sqrt(model.dim)
+            block /= np.linalg.norm(block, axis=1, keepdims=True)
+        vectors[start:end] = block
+    return np.arange(n, dtype=np.int64), texts, vectors